@@ -0,0 +1,128 @@
+'''
+print throughput of threads while jobs capture their print statements
+
+	python benchmarks/bench_capture.py [number of prints]
+
+- 0, 1 and 50 concurrent capturing jobs print a line every millisecond in the background
+- plain: prints/s of a thread that is not capturing (ex: the flask app, the scheduler loop)
+- captured: prints/s of a thread that is capturing (ex: a job)
+- pyio: the previous implementation, a pure-python _pyio.TextIOWrapper proxy installed as sys.stdout
+	that encodes every print and hands every line to the callback
+- batched: flask_production._capture. threads that are not capturing write to the original sys.stdout,
+	captured lines are handed to the callback in batches
+'''
+import _pyio
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask_production._capture import print_capture
+
+
+LINE = "progress: processed 1000 records of the current batch"
+
+
+class _PyioProxy(_pyio.TextIOWrapper):
+	def __init__(self, target):
+		self._local_objects = threading.local()
+		super().__init__(target.buffer, target.encoding, 'strict', None, True)
+
+	@property
+	def buffer(self):
+		return getattr(self._local_objects, 'buffer', None) or self._buffer
+
+
+class _pyio_capture(_pyio.BytesIO):
+	'''previous implementation, condensed'''
+	_lock = threading.Lock()
+	_original = None
+	_proxy = None
+	_n_use = 0
+
+	def __init__(self, callback):
+		self._buf = b''
+		self._write_cb = callback
+
+	def write(self, b):
+		self._buf += b
+		if b.endswith(b'\n'):
+			self._write_cb(self._buf.decode(errors='ignore'))
+			self._buf = b''
+
+	def __enter__(self):
+		cls = _pyio_capture
+		with cls._lock:
+			if cls._n_use == 0:
+				if cls._original is None:
+					cls._original = sys.stdout
+					cls._proxy = _PyioProxy(cls._original)
+				sys.stdout = cls._proxy
+			cls._n_use += 1
+		cls._proxy._local_objects.buffer = self
+
+	def __exit__(self, *args):
+		cls = _pyio_capture
+		cls._proxy._local_objects.buffer = None
+		with cls._lock:
+			cls._n_use -= 1
+			if cls._n_use == 0:
+				sys.stdout = cls._original
+
+
+def timed(func, repeat=1):
+	start = time.perf_counter()
+	for _ in range(repeat):
+		func()
+	return (time.perf_counter() - start) / repeat
+
+
+def bench(capture, n_jobs, n_prints):
+	stop = threading.Event()
+	started = threading.Barrier(n_jobs + 1)
+	def _job():
+		with capture(lambda msg: None):
+			started.wait()
+			while not stop.is_set():
+				print(LINE)
+				time.sleep(0.001)
+	threads = [threading.Thread(target=_job, daemon=True) for _ in range(n_jobs)]
+	for t in threads:
+		t.start()
+	started.wait()
+
+	def _print():
+		for _ in range(n_prints):
+			print(LINE)
+	def _print_captured():
+		with capture(lambda msg: None):
+			_print()
+	results = {}
+	try:
+		results['plain'] = n_prints / timed(_print)
+		results['captured'] = n_prints / timed(_print_captured)
+	finally:
+		stop.set()
+		for t in threads:
+			t.join()
+	return results
+
+
+if __name__ == '__main__':
+	n_prints = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+	stdout = sys.stdout
+	rows = []
+	with open(os.devnull, 'w') as devnull:
+		sys.stdout = devnull
+		try:
+			for n_jobs in (0, 1, 50):
+				rows.append((n_jobs, bench(_pyio_capture, n_jobs, n_prints), bench(print_capture, n_jobs, n_prints)))
+		finally:
+			sys.stdout = stdout
+	print(f"{n_prints} prints, prints/s\n")
+	print("{:<6} {:<9} {:>12} {:>12} {:>9}".format("jobs", "", "pyio", "batched", "speedup"))
+	for n_jobs, pyio_res, batched_res in rows:
+		for k in pyio_res:
+			print("{:<6} {:<9} {:>12,.0f} {:>12,.0f} {:>8.2f}x".format(n_jobs, k, pyio_res[k], batched_res[k], batched_res[k] / pyio_res[k]))
@@ -0,0 +1,51 @@
+'''
+replay a year of schedules with TaskScheduler.simulate()
+
+	python benchmarks/bench_simulate.py [number of jobs]
+
+- jobs are spread over a mix of calendar intervals and half-hour times of day
+- shared: jobs with the same interval and time are simulated once
+- distinct: every job has its own calendar, so every job is simulated separately
+'''
+import os
+import sys
+import time
+from datetime import datetime as dt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask_production import TaskScheduler
+
+
+TZNAME = "America/New_York"
+INTERVALS = ["day", "businessday", "eom-businessday", "monday", "weekend"]
+
+
+def job(x):
+	pass
+
+
+def bench(backend, n_jobs, distinct=False):
+	sched = TaskScheduler(tzname=TZNAME, tz_backend=backend, persist_states=False)
+	at = ["{:02}:{:02}".format(h, m) for h in range(24) for m in (0, 30)]
+	with open(os.devnull, 'w') as devnull: # jobs print themselves when registered
+		stdout, sys.stdout = sys.stdout, devnull
+		try:
+			for i in range(n_jobs):
+				calendar = {} if distinct else None # a new calendar per job gives every job its own schedule key
+				sched.every(INTERVALS[i % len(INTERVALS)], calendar=calendar).at(at[i % len(at)]).do(job, x=i)
+		finally:
+			sys.stdout = stdout
+	start = time.perf_counter()
+	runs = sched.simulate(dt(2025, 1, 1), dt(2026, 1, 1))
+	return len(runs), time.perf_counter() - start
+
+
+if __name__ == '__main__':
+	n_jobs = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+	print(f"{n_jobs} jobs, one year, timezone {TZNAME}\n")
+	print("{:<10} {:<10} {:>10} {:>10}".format("backend", "schedules", "runs", "time"))
+	for backend in ('dateutil', 'zoneinfo'):
+		for distinct in (False, True):
+			n_runs, secs = bench(backend, n_jobs, distinct=distinct)
+			print("{:<10} {:<10} {:>10} {:>8.2f} s".format(backend, 'distinct' if distinct else 'shared', n_runs, secs))
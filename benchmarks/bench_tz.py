@@ -0,0 +1,79 @@
+'''
+compare the 'dateutil' and 'zoneinfo' timezone backends of TaskScheduler
+
+	python benchmarks/bench_tz.py [number of jobs]
+
+- register: create daily jobs (each computes its first schedule)
+- reschedule: Job.schedule_next_run() on every job
+- tz_dt: Job.tz_dt() (datetime construction + DST gap handling)
+- monitor: render the TaskMonitor homepage
+- uncached: tz_dt() math with dateutil.tz.gettz() called on every use, as before timezones were cached
+'''
+import os
+import sys
+import time
+from datetime import datetime as dt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dateutil import tz
+from flask import Flask
+from flask_production import TaskScheduler, TaskMonitor
+
+
+TZNAME = "America/New_York"
+
+
+def job(x):
+	pass
+
+
+def timed(func, repeat=1):
+	start = time.perf_counter()
+	for _ in range(repeat):
+		func()
+	return (time.perf_counter() - start) / repeat
+
+
+def bench(backend, n_jobs):
+	sched = TaskScheduler(tzname=TZNAME, tz_backend=backend, persist_states=False)
+	at = ["{:02}:{:02}".format(h, m) for h in range(24) for m in (0, 30)]
+	def _register():
+		for i in range(n_jobs):
+			sched.every("businessday").at(at[i % len(at)]).do(job, x=i)
+	results = {}
+	with open(os.devnull, 'w') as devnull: # jobs print themselves when registered
+		stdout, sys.stdout = sys.stdout, devnull
+		try:
+			results['register'] = timed(_register)
+		finally:
+			sys.stdout = stdout
+
+	results['reschedule'] = timed(lambda: [j.schedule_next_run() for j in sched.jobs], repeat=3)
+	j = sched.jobs[0]
+	results['tz_dt x10k'] = timed(lambda: [j.tz_dt(2024, 3, 10, 2, 30) for _ in range(10000)])
+
+	app = Flask(__name__)
+	TaskMonitor(app, sched)
+	with app.test_client() as client:
+		client.get("/@taskmonitor/") # warm up
+		results['monitor'] = timed(lambda: client.get("/@taskmonitor/"), repeat=5)
+	return results
+
+
+def bench_uncached():
+	def _tz_dt():
+		d = dt(2024, 3, 10, 2, 30, tzinfo=tz.gettz(TZNAME))
+		return tz.resolve_imaginary(d)
+	return timed(lambda: [_tz_dt() for _ in range(10000)])
+
+
+if __name__ == '__main__':
+	n_jobs = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+	print(f"{n_jobs} jobs, timezone {TZNAME}\n")
+	dateutil_res = bench('dateutil', n_jobs)
+	zoneinfo_res = bench('zoneinfo', n_jobs)
+	print("{:<14} {:>12} {:>12} {:>9}".format("", "dateutil", "zoneinfo", "speedup"))
+	for k in dateutil_res:
+		print("{:<14} {:>10.4f} s {:>10.4f} s {:>8.2f}x".format(k, dateutil_res[k], zoneinfo_res[k], dateutil_res[k] / zoneinfo_res[k]))
+	print("\nuncached tz_dt x10k: {:.4f} s".format(bench_uncached()))
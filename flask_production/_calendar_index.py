@@ -0,0 +1,94 @@
+import bisect
+import threading
+import weakref
+from datetime import date, datetime as dt
+
+
+
+MAX_LOOKAHEAD_YEARS = 10 # give up looking for a runnable day after this many years (ex: 'trading-holiday' with an empty calendar)
+
+
+class _CalendarIndex(object):
+	'''
+	sorted ordinals of the runnable days of a year, computed once per (day rule, calendar, year)
+	- shared by all jobs, so that finding the next runnable day is a bisect instead of a day by day scan
+	- day rules are the functions in jobs.RUNABLE_DAYS. they are called as rule(datetime, calendar)
+	- an entry is recomputed if the size of the calendar changed since it was built (holidays were added,
+		or the calendar expanded to another year)
+	'''
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._index = {} # (rule, id(calendar), year) -> (calendar ref, calendar size, sorted ordinals)
+
+	def __len__(self):
+		with self._lock:
+			return len(self._index)
+
+	def clear(self):
+		with self._lock:
+			self._index.clear()
+
+	@staticmethod
+	def _ref(calendar):
+		try:
+			return weakref.ref(calendar)
+		except TypeError: # ex: list, dict. hold on to the calendar instead
+			return lambda: calendar
+
+	@staticmethod
+	def _size(calendar):
+		try:
+			return len(calendar)
+		except TypeError:
+			return None
+
+	def _build(self, rule, calendar, year):
+		start = date(year, 1, 1).toordinal()
+		end = date(year + 1, 1, 1).toordinal()
+		ordinals = []
+		for o in range(start, end):
+			d = date.fromordinal(o)
+			if rule(dt(d.year, d.month, d.day), calendar):
+				ordinals.append(o)
+		return ordinals
+
+	def ordinals(self, rule, calendar, year):
+		'''sorted ordinals of the runnable days of the year'''
+		key = (rule, id(calendar), year)
+		with self._lock:
+			entry = self._index.get(key)
+		if entry is not None:
+			ref, size, ordinals = entry
+			if ref() is calendar and size == self._size(calendar):
+				return ordinals
+		ordinals = self._build(rule, calendar, year)
+		with self._lock:
+			self._index[key] = (self._ref(calendar), self._size(calendar), ordinals)
+		return ordinals
+
+	def is_runnable(self, rule, calendar, d):
+		'''test if the date of 'd' is a runnable day'''
+		ordinals = self.ordinals(rule, calendar, d.year)
+		o = d.toordinal()
+		i = bisect.bisect_left(ordinals, o)
+		return i < len(ordinals) and ordinals[i] == o
+
+	def iter_runnable(self, rule, calendar, d):
+		'''runnable dates on or after the date of 'd', in order, up to MAX_LOOKAHEAD_YEARS'''
+		o = d.toordinal()
+		for year in range(d.year, d.year + MAX_LOOKAHEAD_YEARS + 1):
+			ordinals = self.ordinals(rule, calendar, year)
+			for x in ordinals[bisect.bisect_left(ordinals, o):]:
+				yield date.fromordinal(x)
+
+	def next_runnable(self, rule, calendar, d):
+		'''
+		first runnable date on or after the date of 'd'
+		- returns None if there are no runnable days within MAX_LOOKAHEAD_YEARS
+		'''
+		return next(self.iter_runnable(rule, calendar, d), None)
+
+
+
+CALENDAR_INDEX = _CalendarIndex()
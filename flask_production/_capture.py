@@ -1,5 +1,7 @@
 '''
-code derived from stdio_proxy package - https://github.com/bonprosoft/stdio_proxy
+thread-local capture of print statements
+
+design derived from stdio_proxy package - https://github.com/bonprosoft/stdio_proxy
 
 MIT License
 
@@ -24,133 +26,199 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 '''
 
-import _pyio
 import threading
+import time
 import sys
 
 
+BATCH_CHARS = 8192 # captured output is handed to the callback once this many characters are pending
+BATCH_SECONDS = 0.25 # .. or once the oldest pending output is this old, so that running jobs show live logs
 
-class _ThreadSafeTextIOWrapperProxy(_pyio.TextIOWrapper):  # type: ignore
-    def __init__(self, *args, **kwargs):  # type: ignore
-        self._local_objects = threading.local()
-        super().__init__(*args, **kwargs)
-
-    def register(self, new_buffer, no_close=True):
-        self._local_objects.buffer = new_buffer
-        self._local_objects.no_close = no_close
-        self._local_objects.registered = True
-
-    def unregister(self):
-        self._local_objects.buffer = None
-        self._local_objects.registered = False
-
-    @property
-    def _registered(self):
-        return getattr(self._local_objects, "registered", False)
-
-    @property
-    def buffer(self):
-        if not self._registered:
-            return self._buffer
-
-        buf = self._local_objects.buffer
-        assert buf is not None
-        return buf
-
-    def close(self):
-        if self._registered and self._local_objects.no_close:
-            self.buffer.flush()
-        else:
-            super().buffer.flush()
-
-    def write(self, s):
-        return super().write(s)
-
-
-def _create_proxy(target):
-    return _ThreadSafeTextIOWrapperProxy(
-        target.buffer,
-        target.encoding,
-        getattr(target, "errors", "strict"),
-        getattr(target, "newlines", None),
-        getattr(target, "line_buffering", True),
-    )
-
-
-
-class _redirect_stdout(object):
-    """Context manager for temporarily redirecting stdout to an object.
-
-    Note:
-        For Python 3 environments, ``dst_obj`` is supposed to handle ``bytes``, not ``str``.
-        For Python 2 environments, ``str``, not ``unicode``.
-        The easiest way to prepare ``dst_obj`` for both environments is to use an ``io.BytesIO`` object.
-
-        For Python 3 environments, the interface of ``dst_obj`` should be compatible with that of ``io.BufferedWriter``.
-        For instance, if you use `sys.stdin.readline`, ``dst_obj`` must have ``write`` method, ``flush`` method, and ``closed`` property.
-        Note that the argument of ``write`` method is ``bytes``, not ``str``.
-
-        For Python 2 environments, the interface of ``dst_obj`` should be compatible with that of the Python file object.
-
-    Examples:
-        >>> buf = io.BytesIO()
-        >>> with redirect_stdout(buf):
-        ...     sys.stdout.write("Foo\n")
-        >>> print("Redirected: {}".format(buf.getvalue()))
-        Redirected: b'Foo\n'
-
-    """
-
-    _lock = threading.Lock()
-    _original = None
-    _proxy = None
-    _n_use = 0
-
-    def __init__(self, new_obj):
-        self._new_obj = new_obj
-
-    def __enter__(self):
-        with _redirect_stdout._lock:
-            if _redirect_stdout._n_use == 0:
-                if _redirect_stdout._original is None:
-                    _redirect_stdout._original = getattr(sys, 'stdout')
-                    _redirect_stdout._proxy = _create_proxy(_redirect_stdout._original)
-
-                setattr(sys, 'stdout', _redirect_stdout._proxy)
-
-            _redirect_stdout._n_use += 1
-            _redirect_stdout._proxy.register(self._new_obj)
-
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        _redirect_stdout._proxy.unregister()
-        with _redirect_stdout._lock:
-            _redirect_stdout._n_use -= 1
-
-            if _redirect_stdout._n_use == 0:
-                setattr(sys, 'stdout', _redirect_stdout._original)
-
-
-'''
-implementing print statement capture using the above thread safe stdout proxy
-'''
-# from stdio_proxy import redirect_stdout
-
-class _PrintCapture(_pyio.BytesIO):
-    '''File-like object that will be the destination of capture'''
-    def __init__(self, callback):
-        self._buf = b''
-        self._write_cb = callback
 
-    def write(self, b):
-        self._buf += b
-        if b.endswith(b'\n'):
-            line = self._buf.decode(errors='ignore')
-            self._write_cb(line)
-            self._buf = b''
+class _ThreadSink(threading.local):
+	sink = None # _LineBatcher of the current thread. the class attribute avoids an AttributeError per write of other threads
 
-    def capture(self):
-        return _redirect_stdout(self)
 
 
-def print_capture(callback):
-    return _PrintCapture(callback).capture()
+class _StdoutRouter(object):
+	'''
+	replacement of sys.stdout while any thread is capturing
+	- writes of threads that are not capturing go straight to the original stream (C level io.TextIOWrapper)
+	- writes of capturing threads go to the _LineBatcher registered for the thread
+	- everything else (encoding, fileno, isatty..) is read from the original stream
+	- a flusher thread hands over lines of jobs that printed something and went quiet (ex: a print followed by a long sleep)
+	'''
+
+	def __init__(self, original):
+		self._original = original
+		self._local = _ThreadSink()
+		self._batchers = set() # active captures
+		self._stop = threading.Event()
+		self._flusher = threading.Thread(target=self._flush_loop, name='print_capture_flusher', daemon=True)
+		self._flusher.start()
+
+	def _flush_loop(self):
+		while not self._stop.wait(BATCH_SECONDS):
+			for batcher in list(self._batchers):
+				batcher.flush_due()
+
+	def stop(self):
+		self._stop.set()
+
+	def _sink(self):
+		return self._local.sink
+
+	def write(self, s):
+		sink = self._local.sink
+		if sink is None:
+			return self._original.write(s)
+		return sink.write(s)
+
+	def writelines(self, lines):
+		for line in lines:
+			self.write(line)
+
+	def flush(self):
+		sink = self._sink()
+		if sink is None:
+			return self._original.flush()
+		return sink.flush()
+
+	@property
+	def buffer(self):
+		'''binary writes of capturing threads (ex: sys.stdout.buffer.write(b'..')) are captured too'''
+		sink = self._sink()
+		return self._original.buffer if sink is None else sink.buffer
+
+	def __getattr__(self, name):
+		return getattr(self._original, name)
+
+
+
+class _BytesAdapter(object):
+	'''sys.stdout.buffer of a capturing thread'''
+
+	def __init__(self, batcher):
+		self._batcher = batcher
+
+	def write(self, b):
+		self._batcher.write(bytes(b).decode(errors='replace'))
+		return len(b)
+
+	def flush(self):
+		self._batcher.flush()
+
+
+
+class _LineBatcher(object):
+	'''
+	collects the output of a capturing thread and hands complete lines to 'callback' in batches
+	- no encoding or decoding: print() writes str, which is kept as is
+	- a batch is handed over once BATCH_CHARS are pending, once the oldest pending output is BATCH_SECONDS old,
+		on flush() and when the capture ends (including a last line without a line break)
+	- the lock is only contended when the flusher thread hands over lines of a quiet job
+	- timestamps (`bool`): also hand the time.time() of the oldest write of the batch to the callback, callback(text, written_at).
+		lines are handed over up to BATCH_SECONDS after they were printed
+	'''
+
+	def __init__(self, callback, timestamps=False):
+		self._callback = callback
+		self._timestamps = timestamps
+		self._lock = threading.RLock() # reentrant in case the callback prints
+		self._pending = []
+		self._pending_len = 0
+		self._since = None # time.monotonic() of the oldest pending write
+		self._written_at = None # time.time() of the oldest pending write
+		self.buffer = _BytesAdapter(self)
+
+	def write(self, s):
+		if not s:
+			return 0
+		with self._lock:
+			self._pending.append(s)
+			self._pending_len += len(s)
+			if self._since is None:
+				self._since = time.monotonic()
+				self._written_at = time.time()
+			if self._pending_len >= BATCH_CHARS or time.monotonic() - self._since >= BATCH_SECONDS:
+				self._deliver(partial=False)
+		return len(s)
+
+	def flush(self):
+		with self._lock:
+			self._deliver(partial=False)
+
+	def flush_due(self):
+		with self._lock:
+			if self._since is not None and time.monotonic() - self._since >= BATCH_SECONDS:
+				self._deliver(partial=False)
+
+	def close(self):
+		with self._lock:
+			self._deliver(partial=True)
+
+	def _deliver(self, partial):
+		'''hand complete lines (and the incomplete last line if partial is True) to the callback. caller holds self._lock'''
+		if not self._pending:
+			return
+		text = ''.join(self._pending)
+		end = len(text) if partial else text.rfind('\n') + 1
+		self._pending = [text[end:]] if end < len(text) else []
+		self._pending_len = len(text) - end
+		written_at = self._written_at
+		self._since = time.monotonic() if self._pending else None
+		self._written_at = time.time() if self._pending else None
+		if end > 0:
+			if self._timestamps:
+				self._callback(text[:end], written_at)
+			else:
+				self._callback(text[:end])
+
+
+
+class _capture_stdout(object):
+	'''
+	context manager that sends what the current thread prints to a _LineBatcher
+	- sys.stdout is replaced by a _StdoutRouter while at least one thread is capturing
+	- captures can be nested within a thread. the outer capture resumes when the inner one ends
+	'''
+
+	_lock = threading.Lock()
+	_router = None
+	_n_use = 0
+
+	def __init__(self, batcher):
+		self._batcher = batcher
+		self._previous = None
+
+	def __enter__(self):
+		with _capture_stdout._lock:
+			if _capture_stdout._n_use == 0:
+				_capture_stdout._router = _StdoutRouter(sys.stdout)
+				sys.stdout = _capture_stdout._router
+			_capture_stdout._n_use += 1
+			router = _capture_stdout._router
+			router._batchers.add(self._batcher)
+		self._previous = router._sink()
+		router._local.sink = self._batcher
+		return self._batcher
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		router = _capture_stdout._router
+		try:
+			self._batcher.close()
+		finally:
+			router._local.sink = self._previous
+			with _capture_stdout._lock:
+				router._batchers.discard(self._batcher)
+				_capture_stdout._n_use -= 1
+				if _capture_stdout._n_use == 0:
+					if sys.stdout is router: # unless it was replaced by someone else in the meantime
+						sys.stdout = router._original
+					router.stop()
+					_capture_stdout._router = None
+
+
+def print_capture(callback, timestamps=False):
+	'''capture print statements of the current thread. 'callback' receives batches of complete lines. see _LineBatcher'''
+	return _capture_stdout(_LineBatcher(callback, timestamps=timestamps))
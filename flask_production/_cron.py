@@ -0,0 +1,113 @@
+import re
+
+
+MONTH_NAMES = {name: i + 1 for i, name in enumerate(['jan','feb','mar','apr','may','jun','jul','aug','sep','oct','nov','dec'])}
+WEEKDAY_NAMES = {name: i for i, name in enumerate(['sun','mon','tue','wed','thu','fri','sat'])}
+
+# (name, low, high, names) of the fields of a 6 field expression. 5 field expressions have no seconds
+_FIELDS = [
+	('second', 0, 59, None),
+	('minute', 0, 59, None),
+	('hour', 0, 23, None),
+	('day of month', 1, 31, None),
+	('month', 1, 12, MONTH_NAMES),
+	('day of week', 0, 7, WEEKDAY_NAMES), # 0 and 7 are both sunday
+]
+
+_TERM = re.compile(r'^(\*|\?|[0-9a-z]+(?:-[0-9a-z]+)?)(?:/([0-9]+))?$')
+
+
+def _next_bit(mask, i):
+	'''index of the first set bit of mask at or after bit i, or -1'''
+	m = mask >> i
+	if m == 0:
+		return -1
+	return i + (m & -m).bit_length() - 1
+
+
+def _parse_value(s, low, high, names, field):
+	if names is not None and s in names:
+		return names[s]
+	if not s.isdigit() or not low <= int(s) <= high:
+		raise ValueError(f"invalid {field} '{s}' (expected {low}-{high})")
+	return int(s)
+
+
+def _parse_field(spec, low, high, names, field):
+	'''
+	bitset of the values of one field. bit n is set if the field matches value n
+	- supports *, ?, n, a-b, */step, a-b/step, n/step (n to high), names (jan, mon..) and comma separated lists of these
+	'''
+	mask = 0
+	for term in spec.lower().split(','):
+		match = _TERM.match(term)
+		if match is None:
+			raise ValueError(f"invalid {field} '{term}'")
+		rng, step = match.groups()
+		step = int(step) if step is not None else 1
+		if step <= 0:
+			raise ValueError(f"invalid step in {field} '{term}'")
+		if rng in ('*', '?'):
+			start, end = low, high
+		elif '-' in rng:
+			start, end = (_parse_value(v, low, high, names, field) for v in rng.split('-'))
+			if start > end:
+				raise ValueError(f"invalid range in {field} '{term}'")
+		else:
+			start = _parse_value(rng, low, high, names, field)
+			end = high if match.group(2) is not None else start
+		for v in range(start, end + 1, step):
+			mask |= 1 << v
+	return mask
+
+
+class CronExpression(object):
+	'''
+	cron expression compiled into bitsets
+	- 5 fields: minute hour day-of-month month day-of-week
+	- 6 fields: second minute hour day-of-month month day-of-week
+	- as in standard cron, a day matches if either day-of-month or day-of-week matches when both are restricted
+	- finding the next time of a day is a scan for the next set bit of the hour, minute and second bitsets
+	'''
+
+	def __init__(self, expr: str):
+		fields = expr.split()
+		if len(fields) not in (5, 6):
+			raise ValueError(f"cron expression should have 5 or 6 fields: '{expr}'")
+		self.expr = expr
+		self.has_seconds = len(fields) == 6
+		if not self.has_seconds:
+			fields = ['0'] + fields
+		masks = [_parse_field(spec, low, high, names, name) for spec, (name, low, high, names) in zip(fields, _FIELDS)]
+		self.seconds, self.minutes, self.hours, self.days, self.months, weekdays = masks
+		if weekdays & (1 << 7):
+			weekdays = (weekdays | 1) & ~(1 << 7) # 7 is sunday
+		self.weekdays = weekdays
+		self._days_any = fields[3][0] in '*?' # as in vixie cron, a field starting with * is not a restriction
+		self._weekdays_any = fields[5][0] in '*?'
+
+	def __repr__(self):
+		return f"CronExpression('{self.expr}')"
+
+	def matches_day(self, d):
+		'''test if the date 'd' matches the month, day-of-month and day-of-week fields'''
+		if not (self.months >> d.month) & 1:
+			return False
+		dom = (self.days >> d.day) & 1
+		dow = (self.weekdays >> (d.isoweekday() % 7)) & 1
+		if self._days_any or self._weekdays_any:
+			return bool(dom and dow)
+		return bool(dom or dow)
+
+	def times_from(self, hour=0, minute=0, second=0):
+		'''generator of the (hour, minute, second) tuples of a matching day at or after the given time, in order'''
+		h = _next_bit(self.hours, hour)
+		while h != -1:
+			m = _next_bit(self.minutes, minute if h == hour else 0)
+			while m != -1:
+				s = _next_bit(self.seconds, second if (h, m) == (hour, minute) else 0)
+				while s != -1:
+					yield h, m, s
+					s = _next_bit(self.seconds, s + 1)
+				m = _next_bit(self.minutes, m + 1)
+			h = _next_bit(self.hours, h + 1)
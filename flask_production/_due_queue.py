@@ -0,0 +1,60 @@
+import heapq
+import itertools
+import threading
+
+
+
+class _DueJobQueue(object):
+	'''
+	priority queue of jobs keyed on due_timestamp (next_timestamp plus any stagger offset)
+	- used by TaskScheduler.check() so that each tick only touches jobs that are actually due
+	- entries are never removed in place. when a job is rescheduled a new entry is pushed,
+		and the previous entry goes stale and is dropped once it reaches the top of the heap
+	- jobs with next_timestamp == 0 (disabled, on-demand, already fired) are not indexed
+	'''
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._heap = []
+		self._counter = itertools.count() # tie-breaker. also identifies the latest entry of a job
+		self._latest = {} # id(job) -> sequence number of the latest valid entry
+
+	def __len__(self):
+		with self._lock:
+			return len(self._latest)
+
+	def push(self, job):
+		'''(re)index job using its current due_timestamp'''
+		ts = job.due_timestamp
+		with self._lock:
+			if not ts or ts <= 0:
+				self._latest.pop(id(job), None) # existing entries go stale
+				return
+			seq = next(self._counter)
+			self._latest[id(job)] = seq
+			heapq.heappush(self._heap, (ts, seq, job))
+			if len(self._heap) > 2 * len(self._latest) + 64:
+				self._compact()
+
+	def pop_due(self, now):
+		'''remove and return all jobs whose indexed timestamp is <= now, earliest first'''
+		due = []
+		with self._lock:
+			while self._heap and self._heap[0][0] <= now:
+				ts, seq, job = heapq.heappop(self._heap)
+				if self._latest.get(id(job)) == seq:
+					del self._latest[id(job)]
+					due.append(job)
+		return due
+
+	def peek_timestamp(self):
+		'''earliest indexed timestamp, or None if nothing is scheduled'''
+		with self._lock:
+			while self._heap and self._latest.get(id(self._heap[0][2])) != self._heap[0][1]:
+				heapq.heappop(self._heap) # drop stale entries
+			return self._heap[0][0] if self._heap else None
+
+	def _compact(self):
+		'''drop stale entries. caller should hold the lock'''
+		self._heap = [e for e in self._heap if self._latest.get(id(e[2])) == e[1]]
+		heapq.heapify(self._heap)
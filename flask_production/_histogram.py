@@ -0,0 +1,93 @@
+import bisect
+import threading
+
+
+# upper bounds (in seconds) of the histogram buckets. the last bucket is unbounded
+# - fine grained below a second for loop timings, coarse up to an hour for start lateness
+BUCKET_BOUNDS = (
+	0.0001, 0.00025, 0.0005,
+	0.001, 0.0025, 0.005,
+	0.01, 0.025, 0.05,
+	0.1, 0.25, 0.5,
+	1, 2.5, 5,
+	10, 30, 60,
+	300, 900, 3600,
+)
+
+
+class Histogram(object):
+	'''
+	fixed bucket histogram of durations in seconds
+	- recording a value is a bisect and a counter increment, so it can be done on every tick
+	- percentiles are approximated by the upper bound of the bucket they fall in
+	'''
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._counts = [0] * (len(BUCKET_BOUNDS) + 1)
+		self._count = 0
+		self._sum = 0.0
+		self._max = 0.0
+
+	def record(self, seconds):
+		seconds = max(0.0, seconds)
+		i = bisect.bisect_left(BUCKET_BOUNDS, seconds)
+		with self._lock:
+			self._counts[i] += 1
+			self._count += 1
+			self._sum += seconds
+			if seconds > self._max:
+				self._max = seconds
+
+	@property
+	def count(self):
+		return self._count
+
+	def merge(self, other):
+		'''add the values of 'other' to this histogram'''
+		with other._lock:
+			counts, count, total, mx = list(other._counts), other._count, other._sum, other._max
+		with self._lock:
+			self._counts = [a + b for a, b in zip(self._counts, counts)]
+			self._count += count
+			self._sum += total
+			self._max = max(self._max, mx)
+		return self
+
+	def snapshot(self):
+		'''
+		consistent copy of the histogram as ([(upper bound, cumulative count), ..], count, sum)
+		- cumulative counts are the number of values at or below each bound, as in OpenMetrics histograms
+		'''
+		with self._lock:
+			counts, count, total = list(self._counts), self._count, self._sum
+		cumulative, seen = [], 0
+		for bound, c in zip(BUCKET_BOUNDS + (float('inf'),), counts):
+			seen += c
+			cumulative.append((bound, seen))
+		return cumulative, count, total
+
+	def percentile(self, p):
+		'''approximate value below which 'p' percent of the recorded values fall. None if empty'''
+		with self._lock:
+			if self._count == 0:
+				return None
+			rank = p / 100 * self._count
+			seen = 0
+			for i, c in enumerate(self._counts):
+				seen += c
+				if seen >= rank and c > 0:
+					return min(BUCKET_BOUNDS[i], self._max) if i < len(BUCKET_BOUNDS) else self._max
+			return self._max
+
+	def to_dict(self):
+		with self._lock:
+			count, total, mx = self._count, self._sum, self._max
+		return dict(
+			count=count,
+			mean=round(total / count, 6) if count else None,
+			max=round(mx, 6) if count else None,
+			p50=self.percentile(50),
+			p90=self.percentile(90),
+			p99=self.percentile(99),
+		)
@@ -0,0 +1,250 @@
+import os
+import re
+import gzip
+import time
+import shutil
+import threading
+from collections import deque, OrderedDict
+
+from .print_logger import LOG_FORMATTER
+from ._log_queue import _QueuedHandler, _Dropped, LOG_QUEUE_SIZE, LOG_BATCH_SIZE
+
+
+JOB_LOG_MAXSIZE = 5*1024*1024 # bytes per segment of a job log before it is rotated
+CURRENT_SEGMENT = 'current.log'
+ARCHIVE_RE = re.compile(r'^(\d{8}-\d{6})(?:-(\d+))?\.log(\.gz)?$') # rotated segments, named after the time they were rotated (UTC)
+STREAM_CHUNK = 64*1024
+JOB_LOG_OPEN_FILES = 64 # job log files kept open at once. the least recently written one is closed past it
+
+
+def _archive_key(name):
+	'''sort key of rotated segments, oldest first'''
+	m = ARCHIVE_RE.match(name)
+	return (m.group(1), int(m.group(2) or 0))
+
+
+
+class _Archiver(object):
+	'''
+	compresses rotated segments on a background thread, then deletes the oldest archives past 'backups'
+	- segments are renamed on rotation and compressed later, so the log writer never waits for gzip
+	'''
+
+	def __init__(self, backups=None):
+		self._backups = backups
+		self._paths = deque()
+		self._cond = threading.Condition()
+		self._busy = False
+		self._thread = None
+
+	def submit(self, path):
+		with self._cond:
+			self._paths.append(path)
+			if self._thread is None:
+				self._thread = threading.Thread(target=self._loop, name='flask_production_log_archiver', daemon=True)
+				self._thread.start()
+			self._cond.notify()
+
+	def _loop(self):
+		while True:
+			with self._cond:
+				while not self._paths:
+					self._cond.wait()
+				path = self._paths.popleft()
+				self._busy = True
+			try:
+				self._compress(path)
+				self._prune(os.path.dirname(path))
+			except OSError as e:
+				print(f"unable to archive job log {path}: {e}")
+			finally:
+				with self._cond:
+					self._busy = False
+					self._cond.notify_all()
+
+	def _compress(self, path):
+		tmp = path + '.gz.tmp'
+		with open(path, 'rb') as src, gzip.open(tmp, 'wb') as dst:
+			shutil.copyfileobj(src, dst, STREAM_CHUNK)
+		os.replace(tmp, path + '.gz') # readers never see a partial archive
+		os.remove(path)
+
+	def _prune(self, directory):
+		if self._backups is None:
+			return
+		archives = sorted((f for f in os.listdir(directory) if ARCHIVE_RE.match(f) and f.endswith('.gz')), key=_archive_key)
+		for f in archives[:max(0, len(archives) - self._backups)]:
+			os.remove(os.path.join(directory, f))
+
+	def wait(self, timeout=None):
+		with self._cond:
+			return self._cond.wait_for(lambda: not self._paths and not self._busy, timeout)
+
+
+
+class _JobLogFile(object):
+	'''
+	current segment of the log of a job. rotated when it reaches 'maxsize' bytes, or when a write falls in a new
+	'interval' (seconds, counted from the epoch. ex: 86400 rotates at midnight UTC)
+	'''
+
+	def __init__(self, directory, archiver, maxsize, interval):
+		self.directory = directory
+		self._path = os.path.join(directory, CURRENT_SEGMENT)
+		self._archiver = archiver
+		self._maxsize = maxsize
+		self._interval = interval
+		self._file = None
+		self._size = 0
+		self._period = None # interval of the last write
+		os.makedirs(directory, exist_ok=True)
+		for f in os.listdir(directory): # rotated, but not compressed before the last shutdown
+			if ARCHIVE_RE.match(f) and not f.endswith('.gz'):
+				archiver.submit(os.path.join(directory, f))
+
+	def _open(self):
+		self._file = open(self._path, 'a', encoding='utf-8', errors='replace')
+		stat = os.fstat(self._file.fileno())
+		self._size = stat.st_size
+		if self._size > 0 and self._interval:
+			self._period = int(stat.st_mtime // self._interval)
+
+	def write(self, text, now):
+		if self._file is None:
+			self._open()
+		size = len(text.encode('utf-8', errors='replace'))
+		period = int(now // self._interval) if self._interval else None
+		if self._size > 0 and ((self._maxsize and self._size + size > self._maxsize) or period != self._period):
+			self.rotate(now)
+			self._open()
+		self._file.write(text)
+		self._size += size
+		self._period = period
+
+	def flush(self):
+		if self._file is not None:
+			self._file.flush()
+
+	def rotate(self, now):
+		'''close the current segment and hand it to the archiver'''
+		self.close()
+		name = time.strftime('%Y%m%d-%H%M%S', time.gmtime(now))
+		dest, n = os.path.join(self.directory, f"{name}.log"), 0
+		while os.path.exists(dest) or os.path.exists(dest + '.gz'):
+			n += 1
+			dest = os.path.join(self.directory, f"{name}-{n}.log")
+		os.replace(self._path, dest)
+		self._archiver.submit(dest)
+
+	def close(self):
+		if self._file is not None:
+			self._file.close()
+			self._file = None
+
+
+
+class JobLogHandler(_QueuedHandler):
+	'''
+	writes the log lines of every job to files of its own, <directory>/<Job.signature_hash()>/current.log
+	- records are routed on their 'job_signature' attribute (see print_logger._PrintLogger). other records are ignored
+	- segments are rotated on size (maxsize bytes, 0 to disable) and/or time (interval seconds, None to disable),
+		then gzip-compressed in the background. backups (`int`) limits the number of archives kept per job (None keeps all)
+	- writes happen on the writer thread of _QueuedHandler, one flush per job per batch
+	- at most open_files (`int`) job logs are kept open. the least recently written one is closed, and reopened on its next write
+	'''
+
+	def __init__(self, directory, maxsize=JOB_LOG_MAXSIZE, interval=None, backups=None, queue_size=LOG_QUEUE_SIZE, batch_size=LOG_BATCH_SIZE, open_files=JOB_LOG_OPEN_FILES):
+		self.directory = directory
+		self._maxsize = maxsize
+		self._interval = interval
+		self._archiver = _Archiver(backups)
+		self._files = {} # job signature: _JobLogFile
+		self._open_files = OrderedDict() # job signature: _JobLogFile with an open file, least recently written first
+		self._max_open = max(1, open_files)
+		super().__init__(queue_size=queue_size, batch_size=batch_size)
+		self.setFormatter(LOG_FORMATTER)
+
+	def _job_dir(self, signature):
+		if not re.match(r'^[0-9a-f]+$', signature):
+			raise ValueError("Invalid job signature")
+		return os.path.join(self.directory, signature)
+
+	def _write(self, batch):
+		now = time.time()
+		touched = set()
+		for record in batch:
+			signature = getattr(record, 'job_signature', None)
+			if signature is None or isinstance(record, _Dropped): # drops are counted in self.dropped
+				continue
+			try:
+				f = self._files.get(signature)
+				if f is None:
+					f = self._files[signature] = _JobLogFile(self._job_dir(signature), self._archiver, self._maxsize, self._interval)
+					self._describe(f.directory, record)
+				f.write(self.format(record) + '\n', now)
+				touched.add(f)
+				self._open_files[signature] = f
+				self._open_files.move_to_end(signature)
+				if len(self._open_files) > self._max_open:
+					self._open_files.popitem(last=False)[1].close() # flushed on close
+			except Exception:
+				self.handleError(record)
+		for f in touched:
+			f.flush()
+
+	def _describe(self, directory, record):
+		'''job.txt tells which job the directory belongs to'''
+		path = os.path.join(directory, 'job.txt')
+		if not os.path.exists(path):
+			with open(path, 'w', encoding='utf-8') as f:
+				f.write(f"{getattr(record, 'job_name', '')}\n")
+
+	def flush(self, timeout=None):
+		'''wait until queued records are written and rotated segments are compressed'''
+		return super().flush(timeout) and self._archiver.wait(timeout)
+
+	def _close_target(self):
+		for f in self._files.values():
+			f.close()
+		self._open_files.clear()
+		self._archiver.wait()
+
+	def segments(self, signature):
+		'''
+		segments of the log of a job, oldest first
+		- list of dict with 'name', 'size' (bytes on disk), 'modified' (timestamp) and 'archived' (compressed)
+		'''
+		directory = self._job_dir(signature)
+		if not os.path.isdir(directory):
+			return []
+		names = sorted((f for f in os.listdir(directory) if ARCHIVE_RE.match(f)), key=_archive_key)
+		if os.path.exists(os.path.join(directory, CURRENT_SEGMENT)):
+			names.append(CURRENT_SEGMENT)
+		segments = []
+		for name in names:
+			try:
+				stat = os.stat(os.path.join(directory, name))
+			except OSError: # compressed or pruned in the meantime
+				continue
+			segments.append(dict(name=name, size=stat.st_size, modified=stat.st_mtime, archived=name.endswith('.gz')))
+		return segments
+
+	def iter_segment(self, signature, name):
+		'''
+		text of one segment of the log of a job, in chunks, without loading it in memory
+		- raises ValueError for an unknown segment name, FileNotFoundError if the segment doesn't exist (anymore)
+		'''
+		if name != CURRENT_SEGMENT and not ARCHIVE_RE.match(name):
+			raise ValueError("Invalid log segment")
+		path = os.path.join(self._job_dir(signature), name)
+		if name == CURRENT_SEGMENT:
+			self.flush(timeout=5)
+		f = gzip.open(path, 'rt', encoding='utf-8', errors='replace') if name.endswith('.gz') else open(path, 'r', encoding='utf-8', errors='replace')
+		def _chunks():
+			with f:
+				while True:
+					chunk = f.read(STREAM_CHUNK)
+					if not chunk:
+						return
+					yield chunk
+		return _chunks()
@@ -0,0 +1,170 @@
+import abc
+import logging
+import threading
+from collections import deque
+
+from .print_logger import LOGGER_NAME
+
+
+LOG_QUEUE_SIZE = 10000 # log records waiting to be written. see QueuedFileHandler
+LOG_BATCH_SIZE = 500 # records written per flush of the log file
+
+
+
+class _Dropped(object):
+	'''stands in the queue for consecutive records that were dropped because the queue was full'''
+
+	def __init__(self):
+		self.count = 1
+
+	def to_record(self):
+		return logging.makeLogRecord(dict(
+			name=LOGGER_NAME,
+			levelno=logging.WARNING,
+			levelname='WARNING',
+			msg=f"*** {self.count} log records dropped: log queue full ***",
+		))
+
+
+
+class _QueuedHandler(logging.Handler, abc.ABC):
+	'''
+	logging handler that hands records to a writer thread, so that printing jobs never wait on the disk
+	- queue_size (`int`): records waiting to be written. past it, records are dropped and counted (see self.dropped),
+		and a _Dropped note with the number of dropped records is queued in their place
+	- batch_size (`int`): records handed to self._write() at once, to be written with a single flush
+	- flush() waits for queued records to be written. close() writes them and stops the writer
+	- errors while writing a batch are reported with handleError() and the writer moves on to the next batch
+	'''
+
+	def __init__(self, queue_size=LOG_QUEUE_SIZE, batch_size=LOG_BATCH_SIZE):
+		super().__init__()
+		self._queue_size = queue_size
+		self._batch_size = batch_size
+		self._records = deque()
+		self._cond = threading.Condition()
+		self._writing = False # a batch is being written
+		self._closed = False
+		self._stopped = False # the writer thread exited
+		self.dropped = 0 # records dropped since the handler was created
+		self._writer = threading.Thread(target=self._write_loop, name='flask_production_log_writer', daemon=True)
+		self._writer.start()
+
+	@property
+	def pending(self):
+		'''records waiting to be written'''
+		with self._cond:
+			return len(self._records)
+
+	def emit(self, record):
+		if record.args: # format now, args may change before the record is written
+			record.msg, record.args = record.getMessage(), None
+		with self._cond:
+			if self._closed:
+				self.dropped += 1
+				return
+			if len(self._records) >= self._queue_size:
+				self.dropped += 1
+				if self._records and isinstance(self._records[-1], _Dropped):
+					self._records[-1].count += 1
+				else:
+					self._records.append(_Dropped())
+				return
+			self._records.append(record)
+			self._cond.notify()
+
+	def _write_loop(self):
+		try:
+			while True:
+				with self._cond:
+					while not self._records and not self._closed:
+						self._cond.wait()
+					if not self._records: # closed and all written
+						return
+					batch = [self._records.popleft() for _ in range(min(len(self._records), self._batch_size))]
+					self._writing = True
+				try:
+					self._write(batch)
+				except Exception: # ex: disk full. the batch is lost, the writer keeps going
+					record = next((r for r in batch if isinstance(r, logging.LogRecord)), None)
+					self.handleError(record if record is not None else _Dropped().to_record())
+				finally:
+					with self._cond:
+						self._writing = False
+						self._cond.notify_all()
+		finally:
+			with self._cond: # flush() must not wait on a writer that is gone
+				self._stopped = True
+				self._cond.notify_all()
+
+	@abc.abstractmethod
+	def _write(self, batch):
+		'''write records and _Dropped notes. runs on the writer thread'''
+		pass
+
+	def _close_target(self):
+		pass
+
+	def flush(self, timeout=None):
+		'''
+		wait until queued records are written
+		- returns False if 'timeout' seconds passed first, or if the writer thread exited with records left
+		'''
+		if threading.current_thread() is self._writer:
+			return True
+		with self._cond:
+			self._cond.wait_for(lambda: self._stopped or (not self._records and not self._writing), timeout)
+			return not self._records and not self._writing
+
+	def close(self):
+		with self._cond:
+			self._closed = True
+			self._cond.notify_all()
+		if threading.current_thread() is not self._writer:
+			self._writer.join()
+		self._close_target()
+		super().close()
+
+
+
+class QueuedFileHandler(_QueuedHandler):
+	'''
+	log file written by a background thread. see _QueuedHandler
+	- target (`logging.handlers.RotatingFileHandler`): handler that formats, writes and rotates the file
+	'''
+
+	def __init__(self, target, queue_size=LOG_QUEUE_SIZE, batch_size=LOG_BATCH_SIZE):
+		self._target = target
+		super().__init__(queue_size=queue_size, batch_size=batch_size)
+
+	def _write(self, batch):
+		'''write records with a single flush. rotates the file like RotatingFileHandler.emit() would'''
+		h = self._target
+		h.acquire()
+		try:
+			pos = None
+			for record in batch:
+				if isinstance(record, _Dropped):
+					record = record.to_record()
+				try:
+					if h.stream is None:
+						h.stream = h._open()
+					if pos is None:
+						pos = h.stream.tell()
+					msg = h.format(record) + h.terminator
+					size = len(msg.encode(h.stream.encoding or 'utf-8', errors='replace'))
+					if h.maxBytes > 0 and pos > 0 and pos + size >= h.maxBytes:
+						h.doRollover()
+						if h.stream is None:
+							h.stream = h._open()
+						pos = 0
+					h.stream.write(msg)
+					pos += size
+				except Exception:
+					h.handleError(record)
+			h.flush()
+		finally:
+			h.release()
+
+	def _close_target(self):
+		self._target.close()
@@ -0,0 +1,45 @@
+import functools
+from datetime import timezone
+
+from dateutil import tz
+
+try:
+	from zoneinfo import ZoneInfo # python 3.9+
+except ImportError:
+	ZoneInfo = None
+
+
+
+TZ_BACKENDS = ('dateutil', 'zoneinfo')
+
+
+@functools.lru_cache(maxsize=None)
+def get_tz(tzname, backend='dateutil'):
+	'''
+	cached lookup of a tzinfo object
+	- 'dateutil': dateutil.tz.gettz(tzname)
+	- 'zoneinfo': stdlib zoneinfo.ZoneInfo(tzname). falls back to dateutil if zoneinfo (or its tz database)
+		is not available, or does not know tzname (ex: local timezone abbreviations)
+	- returns None for unknown timezones
+	'''
+	if backend == 'zoneinfo' and ZoneInfo is not None and tzname:
+		try:
+			return ZoneInfo(tzname)
+		except Exception:
+			pass
+	return tz.gettz(tzname)
+
+
+def resolve_imaginary(d):
+	'''
+	shift a datetime that falls in a daylight savings gap forward by the size of the gap
+	- same as dateutil.tz.resolve_imaginary(), which only supports dateutil timezones
+	'''
+	if ZoneInfo is None or not isinstance(d.tzinfo, ZoneInfo):
+		return tz.resolve_imaginary(d)
+	# a wall time in a gap does not survive the round trip through UTC. fold=0 uses the offset from before
+	# the transition, so the round trip lands after the gap
+	resolved = d.astimezone(timezone.utc).astimezone(d.tzinfo)
+	if resolved.replace(tzinfo=None) != d.replace(tzinfo=None):
+		return resolved
+	return d
@@ -0,0 +1,98 @@
+import abc
+import time
+import threading
+from datetime import datetime as dt
+
+
+
+def _to_seconds(t):
+	return t.timestamp() if isinstance(t, dt) else float(t)
+
+
+
+class Clock(abc.ABC):
+	'''
+	source of the current time for TaskScheduler and its jobs
+	- time(): seconds since the epoch, like time.time()
+	- monotonic(): seconds that never go back when the wall clock is set, like time.monotonic()
+	- now(tz): current datetime in timezone 'tz', like datetime.now(tz)
+	- sleep(seconds): wait, like time.sleep()
+	'''
+
+	@abc.abstractmethod
+	def time(self):
+		pass
+
+	def monotonic(self):
+		return self.time()
+
+	def now(self, tz=None):
+		return dt.fromtimestamp(self.time(), tz=tz)
+
+	@abc.abstractmethod
+	def sleep(self, seconds):
+		pass
+
+
+class SystemClock(Clock):
+	'''wall clock. default clock of TaskScheduler'''
+
+	def time(self):
+		return time.time()
+
+	def monotonic(self):
+		return time.monotonic()
+
+	def now(self, tz=None):
+		return dt.now(tz=tz)
+
+	def sleep(self, seconds):
+		time.sleep(seconds)
+
+
+class VirtualClock(Clock):
+	'''
+	clock that only moves when it is told to
+	- used by TaskScheduler.simulate(), and to drive TaskScheduler.check() through time in tests without sleeping
+	- sleep() returns right away after moving the clock forward
+	- start (`datetime` or timestamp): initial time. defaults to the current time
+	'''
+
+	def __init__(self, start=None):
+		self._lock = threading.Lock()
+		self._now = time.time() if start is None else _to_seconds(start)
+		self._monotonic = 0.0
+
+	def time(self):
+		return self._now
+
+	def monotonic(self):
+		return self._monotonic
+
+	def set(self, t):
+		'''
+		move the clock to 't' (`datetime` or timestamp). naive datetimes are in local time
+		- moving forward counts as elapsed time. moving back is a wall clock step (see self.jump())
+		'''
+		with self._lock:
+			t = _to_seconds(t)
+			self._monotonic += max(0, t - self._now)
+			self._now = t
+
+	def advance(self, seconds):
+		'''move the clock forward by 'seconds' '''
+		with self._lock:
+			self._now += seconds
+			self._monotonic += seconds
+
+	def jump(self, seconds):
+		'''step the wall clock by 'seconds' without any time passing (ex: an NTP correction)'''
+		with self._lock:
+			self._now += seconds
+
+	def sleep(self, seconds):
+		self.advance(seconds)
+
+
+
+SYSTEM_CLOCK = SystemClock()
@@ -0,0 +1,130 @@
+import threading
+
+from .clock import SYSTEM_CLOCK
+
+
+
+class JobGraph(object):
+	'''
+	dependencies between jobs. see TaskScheduler.after()
+	- a dependent job is triggered once all of its upstream jobs completed successfully since its previous trigger
+	- a failed upstream holds back its dependents (and everything downstream of them) until it succeeds again
+	- the upstream that completed last before a trigger is recorded as the critical upstream.
+		following critical upstreams back from a job gives the critical path of the pipeline run that ended with it
+	'''
+
+	def __init__(self, clock=None):
+		self._clock = clock or SYSTEM_CLOCK # see TaskScheduler clock. run times are in this clock, so simulated pipelines time like live ones
+		self._lock = threading.Lock()
+		self.upstreams = {} # jobid -> list of upstream jobids
+		self.downstreams = {} # jobid -> list of dependent jobids
+		self._succeeded = {} # dependent jobid -> upstream jobids that succeeded since the previous trigger
+		self._blocked_by = {} # dependent jobid -> jobid of the upstream that failed
+		self._triggers = {} # dependent jobid -> (timestamp, critical upstream jobid) of the pending trigger
+		self._runs = {} # jobid -> latest completed run. see self.on_complete()
+
+	def __len__(self):
+		with self._lock:
+			return len(set(self.upstreams) | set(self.downstreams))
+
+	def __contains__(self, jobid):
+		with self._lock:
+			return jobid in self.upstreams or jobid in self.downstreams
+
+	def add(self, jobid, upstream_ids):
+		'''register a dependent job. upstream jobs are always registered first, so the graph can't have cycles'''
+		with self._lock:
+			self.upstreams[jobid] = list(upstream_ids)
+			self.downstreams.setdefault(jobid, [])
+			for u in upstream_ids:
+				self.downstreams.setdefault(u, []).append(jobid)
+
+	def on_complete(self, job):
+		'''
+		record a completed run of a job in the graph
+		- returns the jobids of dependents that are ready to run
+		'''
+		failed = job.did_fail()
+		run_info = job._run_info
+		end = self._clock.time() # the run just completed
+		start = None
+		if run_info.started_at is not None and run_info.ended_at is not None:
+			start = end - (run_info.ended_at - run_info.started_at).total_seconds()
+		with self._lock:
+			triggered_at, critical_upstream = self._triggers.pop(job.jobid, (None, None))
+			self._runs[job.jobid] = dict(
+				start=start,
+				end=end,
+				triggered_at=triggered_at,
+				critical_upstream=critical_upstream,
+				failed=failed,
+			)
+			ready = []
+			for d in self.downstreams.get(job.jobid, []):
+				succeeded = self._succeeded.setdefault(d, set())
+				if failed:
+					succeeded.discard(job.jobid)
+					self._blocked_by[d] = job.jobid
+					continue
+				succeeded.add(job.jobid)
+				if succeeded.issuperset(self.upstreams[d]):
+					self._succeeded[d] = set()
+					self._blocked_by.pop(d, None)
+					self._triggers[d] = (self._clock.time(), job.jobid)
+					ready.append(d)
+			return ready
+
+	def levels(self):
+		'''jobid -> depth in the graph. jobs without upstreams are at level 0'''
+		with self._lock:
+			levels = {}
+			def _level(jobid):
+				if jobid not in levels:
+					levels[jobid] = 1 + max([_level(u) for u in self.upstreams.get(jobid, [])], default=-1)
+				return levels[jobid]
+			for jobid in set(self.upstreams) | set(self.downstreams):
+				_level(jobid)
+			return levels
+
+	def critical_paths(self):
+		'''
+		critical path of the latest pipeline run ending at each job without dependents
+		- each step has its start, end, duration and wait (time between its trigger and its start)
+		- wall_time is the time from the start of the first step to the end of the last step
+		'''
+		with self._lock:
+			sinks = [jobid for jobid, down in self.downstreams.items() if not down and jobid in self._runs]
+			paths = []
+			for sink in sinks:
+				steps = []
+				jobid = sink
+				while jobid is not None and jobid in self._runs and len(steps) <= len(self._runs):
+					run = self._runs[jobid]
+					wait = None
+					if run['triggered_at'] is not None and run['start'] is not None and run['start'] >= run['triggered_at']:
+						wait = run['start'] - run['triggered_at']
+					steps.insert(0, dict(
+						jobid=jobid,
+						start=run['start'],
+						end=run['end'],
+						duration=(run['end'] - run['start']) if run['start'] is not None else None,
+						wait=wait,
+						failed=run['failed'],
+					))
+					jobid = run['critical_upstream']
+				first_start = steps[0]['start']
+				paths.append(dict(
+					sink=sink,
+					steps=steps,
+					wall_time=(steps[-1]['end'] - first_start) if first_start is not None else None,
+					busy_time=sum(s['duration'] or 0 for s in steps),
+				))
+			return paths
+
+	def to_dict(self):
+		with self._lock:
+			return dict(
+				edges=[[u, d] for u, down in self.downstreams.items() for d in down],
+				blocked_by=dict(self._blocked_by),
+				waiting_on={d: sorted(set(self.upstreams[d]) - self._succeeded.get(d, set())) for d in self.upstreams},
+			)
@@ -0,0 +1,150 @@
+import queue
+import threading
+import traceback
+
+
+
+class ExecutorSaturatedError(RuntimeError):
+	pass
+
+
+
+class JobExecutor(object):
+	'''
+	bounded pool of worker threads that runs parallel jobs and reruns
+
+	- max_workers (`int`): maximum number of worker threads. workers are started lazily
+	- max_queue (`int`): maximum number of runs waiting for a free worker. 0 means unbounded
+	- saturation_policy (`str`): what happens when all workers are busy and the queue is full
+		- 'reject': raise ExecutorSaturatedError (TaskScheduler retries the job once a worker is free)
+		- 'block': wait for room in the queue
+		- 'caller-runs': run in the calling thread
+	- name (`str`): prefix used for worker thread names
+	'''
+
+	SATURATION_POLICIES = ('reject', 'block', 'caller-runs')
+
+	def __init__(self, max_workers: int=32, max_queue: int=0, saturation_policy: str='reject', name: str='fp-worker'):
+		if not isinstance(max_workers, int) or max_workers <= 0:
+			raise ValueError("max_workers should be a positive integer")
+		if saturation_policy not in self.SATURATION_POLICIES:
+			raise ValueError(f"saturation_policy should be one of {self.SATURATION_POLICIES}")
+		self.max_workers = max_workers
+		self.max_queue = max_queue
+		self.saturation_policy = saturation_policy
+		self.name = name
+		self._queue = queue.Queue(maxsize=max_queue)
+		self._lock = threading.Lock()
+		self._idle_semaphore = threading.Semaphore(0)
+		self._workers = []
+		self._active = 0
+		self._shutting_down = False
+		self._on_task_done_cbs = []
+		self._counts = {'submitted': 0, 'completed': 0, 'rejected': 0}
+
+	def __repr__(self):
+		return "{}({}, workers={}/{}, active={}, queued={})".format(
+			self.__class__.__name__, self.name, len(self._workers), self.max_workers, self.active_workers, self.queue_length
+		)
+
+	@property
+	def queue_length(self):
+		'''number of runs waiting for a free worker'''
+		return self._queue.qsize()
+
+	@property
+	def active_workers(self):
+		'''number of workers currently running a job'''
+		with self._lock:
+			return self._active
+
+	def stats(self):
+		with self._lock:
+			return dict(
+				max_workers=self.max_workers,
+				max_queue=self.max_queue,
+				saturation_policy=self.saturation_policy,
+				workers=len(self._workers),
+				active=self._active,
+				queued=self._queue.qsize(),
+				**self._counts
+			)
+
+	def register_callback(self, cb):
+		'''register a function (without arguments) to be called every time a worker completes a run'''
+		self._on_task_done_cbs.append(cb)
+
+	def submit(self, fn, *args, **kwargs):
+		'''queue fn(*args, **kwargs) to be run by a worker thread'''
+		if self._shutting_down:
+			raise ExecutorSaturatedError(f"{self.name} is shutting down")
+		item = (fn, args, kwargs)
+		if self.saturation_policy == 'block':
+			self._queue.put(item)
+		else:
+			try:
+				self._queue.put_nowait(item)
+			except queue.Full:
+				if self.saturation_policy == 'reject':
+					with self._lock:
+						self._counts['rejected'] += 1
+					raise ExecutorSaturatedError(f"{self.name} is saturated ({self.max_workers} workers busy, {self.queue_length} runs queued)")
+				fn(*args, **kwargs) # caller-runs
+				return
+		with self._lock:
+			self._counts['submitted'] += 1
+		self._adjust_workers()
+
+	def _adjust_workers(self):
+		if self._idle_semaphore.acquire(blocking=False):
+			return # an idle worker will pick it up
+		with self._lock:
+			if len(self._workers) < self.max_workers:
+				t = threading.Thread(target=self._worker, name=f"{self.name}-{len(self._workers)}")
+				t.daemon = True
+				self._workers.append(t)
+				t.start()
+
+	def _worker(self):
+		while True:
+			item = self._queue.get()
+			if item is None: # shutdown sentinel
+				self._queue.task_done()
+				return
+			fn, args, kwargs = item
+			with self._lock:
+				self._active += 1
+			try:
+				fn(*args, **kwargs)
+			except Exception:
+				traceback.print_exc()
+			finally:
+				with self._lock:
+					self._active -= 1
+					self._counts['completed'] += 1
+				self._queue.task_done()
+			for cb in self._on_task_done_cbs:
+				try:
+					cb()
+				except Exception as e:
+					print("executor-cb-error:", str(e))
+			self._idle_semaphore.release()
+
+	def shutdown(self):
+		'''
+		wait for queued and running jobs to complete, then stop all workers
+		- new runs are refused while shutting down. the executor can be reused afterwards
+		'''
+		self._shutting_down = True
+		try:
+			self._queue.join()
+			with self._lock:
+				workers = self._workers
+				self._workers = []
+			for _ in workers:
+				self._queue.put(None)
+			for t in workers:
+				t.join()
+			self._idle_semaphore = threading.Semaphore(0)
+		finally:
+			self._shutting_down = False
@@ -1,7 +1,6 @@
 import time
 from datetime import timedelta, datetime as dt
 from monthdelta import monthdelta
-from dateutil import tz
 import re
 import threading
 import inspect
@@ -10,8 +9,18 @@ import traceback
 import socket
 import subprocess
 import sys
+import asyncio
+import random
+import copy
+import math
+import itertools
 
 from . import print_logger
+from . import _tz
+from .clock import SYSTEM_CLOCK
+from ._calendar_index import CALENDAR_INDEX, MAX_LOOKAHEAD_YEARS
+from ._cron import CronExpression
+from ._histogram import Histogram
 
 
 
@@ -19,6 +28,16 @@ class BadScheduleError(Exception):
 	pass
 
 
+class JobTimeoutError(Exception):
+	pass
+
+
+STAGGER_MODES = ('hash', 'random')
+MISFIRE_POLICIES = ('once', 'all', 'skip')
+
+MAX_PREVIEW_RUNS = 10000 # upper bound on the number of runs of one job returned by upcoming_runs() and runs_between()
+
+
 
 def _get_eom(d):
 	return ((d + monthdelta(1)).replace(day=1) - timedelta(days=1))
@@ -41,6 +60,16 @@ def _is_eom_businessday(d, hols):
 
 
 
+def _to_timestamp(t, tzinfo):
+	'''timestamp of a datetime or timestamp. naive datetimes are interpreted in tzinfo'''
+	if isinstance(t, dt):
+		if t.tzinfo is None:
+			t = t.replace(tzinfo=tzinfo)
+		return t.timestamp()
+	return float(t)
+
+
+
 RUNABLE_DAYS = {
 	'day': lambda d, hols : True,
 	'weekday': lambda d, hols : d.isoweekday() < 6,
@@ -114,14 +143,45 @@ class Job(object):
 		self.interval = every
 		self.time_string = at
 		self.tzname = None
+		self._tz_backend = 'dateutil'
+		self._tzinfo_key = None # (tzname, backend) that self._tzinfo was resolved for. see self.tzinfo
+		self._tzinfo = None
+		self._clock = SYSTEM_CLOCK # see TaskScheduler(clock=..)
 		self.func = func
 		self.kwargs = kwargs
-		self.is_running = False
+		self.is_queued = False # waiting for a free worker. see AsyncJobWrapper
+		self.priority = 0 # jobs due at the same time are dispatched in order of priority (highest first)
+		self.group = None # name of the concurrency group. see TaskScheduler.group()
+		self._on_schedule_cbs = [] # called every time next_timestamp changes
+		self._stagger_window = 0
+		self._stagger_mode = 'hash'
+		self._start_offset = 0 # seconds between the nominal schedule (next_timestamp) and the actual start. see self.stagger()
 		self.next_timestamp = 0
 		self._is_disabled = False
 		self._run_silently = False
 		self._generic_err_handler = None
 		self._err_handler = None
+		self._timeout = None
+		self._overlap = 'skip' # see self.overlap()
+		self._skipped_ticks = 0
+		self._coalesced_ticks = 0
+		self._run_lock = threading.Lock()
+		self._run_token = 0 # incremented for every run. identifies a run (instance) of the job
+		self._active_runs = {} # run_token -> (_PrintLogger, is_rerun) of every run in progress
+		self._abandoned_runs = set() # run tokens of runs that were abandoned after a timeout
+		self._timed_out_runs = [] # (run_token, is_rerun, msg) of abandoned runs not cleaned up yet. see self._finish_timed_out_runs()
+		self._on_timeout_cbs = [] # called from the timer thread when a run is abandoned. see TaskScheduler._index_job()
+		self._cancelled_runs = set() # run tokens of runs whose script or worker process was killed after a timeout
+		self._last_start = None # clock time at which the last scheduled run started
+		self._last_scheduled = None # nominal time of the last scheduled run that started
+		self._misfire = None # (policy, max_lateness) applied to runs missed while the app was down. see self.misfire()
+		self._misfire_runs = [] # nominal times of missed runs that are still to be caught up
+		self._misfire_resume = None # next_timestamp of the regular schedule, restored once catch-up runs are done
+		# start lateness, run duration and scheduling overhead, in seconds. see TaskScheduler.stats()
+		self._histograms = {'lateness': Histogram(), 'duration': Histogram(), 'schedule': Histogram(), 'callbacks': Histogram()}
+		self._runs_total = 0 # completed runs, including reruns and failures
+		self._failures_total = 0
+		self._last_success = None # clock time at which the last successful run completed
 		self._func_src_code = inspect.getsource(self.func)
 		# signatures for setters and getters
 		self._func_signature = None
@@ -130,16 +190,27 @@ class Job(object):
 		self._on_enable_cbs = []
 		self._on_disable_cbs = []
 
-	def init(self, calendar, tzname=None, generic_err_handler=None, startup_grace_mins=0):
+	def init(self, calendar, tzname=None, generic_err_handler=None, startup_grace_mins=0, tz_backend='dateutil', clock=None, log_memory_limit=None):
 		'''initialize extra attributes of job'''
 		self.calendar = calendar
+		self._clock = clock or SYSTEM_CLOCK
 		self.tzname = tzname
+		self._tz_backend = tz_backend
 		self._generic_err_handler = generic_err_handler
 		self._startup_grace_mins = startup_grace_mins # look back on tasks if task scheduler just started
-		self._run_info = print_logger._PrintLogger(tzname=tzname)
+		self._log_memory_limit = log_memory_limit # see print_logger._PrintLogger
+		self._run_info = self._new_run_info()
 		self.schedule_next_run()
 		return self
 
+	def _new_run_info(self):
+		return print_logger._PrintLogger(
+			tzname=self.tzname,
+			tz_backend=self._tz_backend,
+			memory_limit=getattr(self, '_log_memory_limit', None),
+			log_context=dict(jobid=self.jobid, job_signature=self.signature_hash(), job_name=self.func_signature()),
+		)
+
 	def silently(self, run_silently=True):
 		'''
 		Mark the job to not print any info lines to console.
@@ -153,6 +224,77 @@ class Job(object):
 		self._err_handler = err_handler
 		return self
 
+	def timeout(self, seconds):
+		'''
+		fail the job if a run takes longer than 'seconds'
+		- script and worker process jobs are killed, coroutine jobs are cancelled
+		- jobs running in a thread can't be interrupted. the run is marked as timed out and
+			abandoned, so that the job can be scheduled again. the error handler, rescheduling and
+			on-complete callbacks of the abandoned run are called on the scheduler loop (see TaskScheduler.check())
+		- jobs registered with .do() / .run_script() that would run inline on the scheduler loop run on the 'default'
+			serial lane instead, so that the loop doesn't wait for them (see TaskScheduler serial_lanes).
+			a job run directly with .run() blocks its caller until the function returns
+		'''
+		if not isinstance(seconds, (int, float)) or seconds <= 0:
+			raise BadScheduleError("timeout should be a positive number of seconds")
+		self._timeout = seconds
+		return self
+
+	def overlap(self, policy):
+		'''
+		what to do when the job is due while a previous run is still in progress
+		- 'skip': drop the tick (default)
+		- 'queue': run once as soon as the previous run completes. further ticks are coalesced into it
+		- n (`int`): allow up to n concurrent runs, each with its own log. further ticks are skipped
+		- skipped and coalesced ticks are counted (see to_dict()) to show jobs that can't keep up with their interval
+		'''
+		if policy not in ('skip', 'queue') and not (isinstance(policy, int) and not isinstance(policy, bool) and policy >= 1):
+			raise BadScheduleError("overlap policy should be 'skip', 'queue' or a positive number of concurrent runs")
+		self._overlap = 'skip' if policy == 1 else policy
+		return self
+
+	def misfire(self, policy='once', max_lateness=None):
+		'''
+		what to do at startup with the runs that were missed while the app was down
+		- needs a state handler (see TaskScheduler(persist_states=True)), which keeps the last scheduled and actual fire times
+		- 'once': run once for all missed runs (default)
+		- 'all': run every missed run, back to back
+		- 'skip': drop the missed runs and wait for the next one
+		- max_lateness (`int`): drop missed runs that are more than this many seconds late, then apply the policy to the rest
+		- replaces startup_grace_mins for jobs that ran before. dropped and coalesced runs are counted (see to_dict())
+		'''
+		if policy not in MISFIRE_POLICIES:
+			raise BadScheduleError(f"misfire policy should be one of {MISFIRE_POLICIES}")
+		if max_lateness is not None and (not isinstance(max_lateness, (int, float)) or max_lateness <= 0):
+			raise BadScheduleError("max_lateness should be a positive number of seconds")
+		self._misfire = (policy, max_lateness)
+		return self
+
+	def stagger(self, window, mode='hash'):
+		'''
+		start the job up to 'window' seconds after its nominal schedule, to spread out jobs scheduled at round times
+		- 'hash': fixed offset derived from signature_hash(). the same job always starts at the same offset
+		- 'random': new random offset for every run
+		- next_timestamp (and so TaskMonitor) still shows the nominal schedule. see self.due_timestamp
+		- window of 0 disables staggering
+		'''
+		if not isinstance(window, (int, float)) or window < 0:
+			raise BadScheduleError("stagger window should be a non-negative number of seconds")
+		if mode not in STAGGER_MODES:
+			raise BadScheduleError(f"stagger mode should be one of {STAGGER_MODES}")
+		self._stagger_window = window
+		self._stagger_mode = mode
+		self.next_timestamp = self.next_timestamp # recompute offset and reindex
+		return self
+
+	def _compute_start_offset(self):
+		if self._stagger_window <= 0:
+			return 0
+		if self._stagger_mode == 'random':
+			return random.uniform(0, self._stagger_window)
+		millis = int(self._stagger_window * 1000)
+		return (int(self.signature_hash(), 16) % millis) / 1000 if millis > 0 else 0
+
 	def register_callback(self, cb, cb_type="oncomplete"):
 		'''
 		register a callback function to be called when job completes
@@ -165,10 +307,45 @@ class Job(object):
 				self._on_enable_cbs.append(cb)
 			elif cb_type == 'onenable':
 				self._on_disable_cbs.append(cb)
+			elif cb_type == 'onschedule':
+				self._on_schedule_cbs.append(cb)
+			elif cb_type == 'ontimeout':
+				self._on_timeout_cbs.append(cb)
 			else:
 				raise ValueError("unsupported cb_type")
 		return self
 
+	@property
+	def next_timestamp(self):
+		return self._next_timestamp
+
+	@next_timestamp.setter
+	def next_timestamp(self, ts):
+		self._next_timestamp = ts
+		self._start_offset = self._compute_start_offset()
+		# call any registered onschedule callbacks (used by TaskScheduler to keep its due-job index up to date)
+		for cb in self._on_schedule_cbs:
+			cb(self)
+
+	@property
+	def due_timestamp(self):
+		'''timestamp at which the job actually starts. differs from next_timestamp only if the job is staggered'''
+		return self._next_timestamp + self._start_offset if self._next_timestamp > 0 else self._next_timestamp
+
+	@property
+	def is_running(self):
+		return len(self._active_runs) > 0
+
+	@property
+	def running_instances(self):
+		'''number of runs in progress'''
+		return len(self._active_runs)
+
+	@property
+	def max_instances(self):
+		'''maximum number of concurrent runs allowed by the overlap policy'''
+		return self._overlap if isinstance(self._overlap, int) else 1
+
 	@property
 	def is_disabled(self):
 		return self._is_disabled
@@ -177,6 +354,7 @@ class Job(object):
 	def is_disabled(self, disable: bool):
 		if disable is True:
 			self._is_disabled = True
+			self._misfire_runs, self._misfire_resume = [], None # drop pending catch-up runs
 			self.next_timestamp = 0 # remove next schedule
 			# call any registered ondisable callbacks
 			for cb in self._on_disable_cbs:
@@ -203,18 +381,27 @@ class Job(object):
 		return self
 
 	# important datetime and timezone management methods
+	@property
+	def tzinfo(self):
+		'''tzinfo of self.tzname. resolved once, and again only if tzname changes'''
+		key = (self.tzname, self._tz_backend)
+		if self._tzinfo_key != key:
+			self._tzinfo = _tz.get_tz(self.tzname, self._tz_backend)
+			self._tzinfo_key = key
+		return self._tzinfo
+
 	def to_timestamp(self, d: dt):
 		return d.timestamp()
 
 	def to_datetime(self, t: float):
-		return dt.fromtimestamp(t, tz=tz.gettz(self.tzname))
+		return dt.fromtimestamp(t, tz=self.tzinfo)
 
 	def tz_now(self):
-		return dt.now(tz=tz.gettz(self.tzname))
+		return self._clock.now(tz=self.tzinfo)
 
 	def tz_dt(self, year, month, day, hour=0, minute=0, second=0, microsecond=0):
-		d = dt(int(year), int(month), int(day), int(hour), int(minute), int(second), int(microsecond), tzinfo=tz.gettz(self.tzname))
-		return tz.resolve_imaginary(d) # handles time that falls in the transition to/from daylight savings
+		d = dt(int(year), int(month), int(day), int(hour), int(minute), int(second), int(microsecond), tzinfo=self.tzinfo)
+		return _tz.resolve_imaginary(d) # handles time that falls in the transition to/from daylight savings
 	#
 
 	def attach_upcoming_run_time(self, d: dt, just_ran: bool=False):
@@ -250,21 +437,188 @@ class Job(object):
 	def schedule_next_run(self, just_ran=False):
 		'''compute timestamp of the next run'''
 		d = self.tz_now()
-		upcoming = self.attach_upcoming_run_time(d, just_ran=just_ran)
-		if not self._job_must_run_today() or upcoming is None:
-			next_day = d + timedelta(days=1)
-			while not self._job_must_run_today(next_day):
-				next_day += timedelta(days=1)
+		upcoming = self.attach_upcoming_run_time(d, just_ran=just_ran) if self._job_must_run_today(d) else None
+		if upcoming is None:
+			next_date = CALENDAR_INDEX.next_runnable(RUNABLE_DAYS[self.interval], self.calendar, d.date() + timedelta(days=1))
+			if next_date is None:
+				raise BadScheduleError(f"'{self.interval}' has no runnable days in the next {MAX_LOOKAHEAD_YEARS} years")
+			next_day = d + timedelta(days=(next_date - d.date()).days)
 			upcoming = self.attach_upcoming_run_time(next_day)
 
 		self.next_timestamp = self.to_timestamp(upcoming)
 
+	def _run_times(self):
+		'''sorted (hour, minute) tuples of self.time_string'''
+		at = self.time_string if isinstance(self.time_string, (list,set,tuple)) else [self.time_string]
+		for t in at:
+			if not isinstance(t, str):
+				raise BadScheduleError(f"Invalid time string '{self.time_string}'")
+		return sorted(tuple(int(x) for x in t.split(':')) for t in at)
+
+	def _iter_runs(self, start_ts):
+		'''
+		generator of the timestamps of the nominal runs at or after start_ts, in order
+		- runnable days are read from the shared calendar index, so no per-day rescheduling is needed
+		- job types that don't run on a calendar (ex: NeverJob) yield nothing
+		'''
+		if self.interval not in RUNABLE_DAYS:
+			return
+		times = self._run_times()
+		start = self.to_datetime(start_ts)
+		for d in CALENDAR_INDEX.iter_runnable(RUNABLE_DAYS[self.interval], self.calendar, start.date()):
+			for h, m in times:
+				ts = self.to_timestamp(self.tz_dt(d.year, d.month, d.day, h, m))
+				if ts >= start_ts:
+					yield ts
+
+	def upcoming_runs(self, n: int=None, until=None):
+		'''
+		preview the next runs of the job
+		- n (`int`): number of runs to return
+		- until (`datetime` or timestamp): return runs up to this time. naive datetimes are in the job's timezone
+		- returns timezone aware datetimes of the nominal schedule (see self.stagger()), starting with the next run
+		- disabled and on-demand jobs return an empty list. at most MAX_PREVIEW_RUNS runs are returned
+		'''
+		if n is None and until is None:
+			raise ValueError("upcoming_runs() requires n or until")
+		if self.is_disabled or self.next_timestamp <= 0:
+			return []
+		until_ts = _to_timestamp(until, self.tzinfo) if until is not None else None
+		limit = min(n, MAX_PREVIEW_RUNS) if n is not None else MAX_PREVIEW_RUNS
+		runs = []
+		for ts in self._iter_runs(self.next_timestamp):
+			if len(runs) >= limit or (until_ts is not None and ts > until_ts):
+				break
+			runs.append(self.to_datetime(ts))
+		return runs
+
 	def _job_must_run_today(self, date=None):
-		return RUNABLE_DAYS[self.interval](date or self.tz_now(), self.calendar)
+		return CALENDAR_INDEX.is_runnable(RUNABLE_DAYS[self.interval], self.calendar, date or self.tz_now())
 
 	def is_due(self):
 		'''test if job should run now'''
-		return self.next_timestamp > 0 and (time.time() >= self.next_timestamp) and not self.is_running and not self.is_disabled
+		return self.next_timestamp > 0 and (self._clock.time() >= self.due_timestamp) and self.running_instances < self.max_instances and not self.is_disabled
+
+	def is_stale(self):
+		'''test if the due tick should be dropped instead of run. see RepeatJob.align()'''
+		return False
+
+	def skip_tick(self):
+		'''
+		drop the tick that is due now and schedule the next one
+		- called by the scheduler when a job is due while it is already running max_instances runs
+		'''
+		self._skipped_ticks += 1
+		started = time.perf_counter()
+		self.schedule_next_run(just_ran=True)
+		self._histograms['schedule'].record(time.perf_counter() - started)
+
+	def _fast_forward(self, now):
+		'''
+		schedule the first run after 'now'
+		- returns number of ticks that were passed over and the timestamp of the last one
+		'''
+		missed, last_missed = 0, None
+		while 0 < self.next_timestamp <= now:
+			last_missed = self.next_timestamp
+			self.schedule_next_run(just_ran=True)
+			missed += 1
+			if self.next_timestamp == last_missed:
+				break # schedule did not move forward
+		return missed, last_missed
+
+	def _handle_missed_ticks(self):
+		'''apply the overlap policy to ticks that came due while the job was running'''
+		if self.max_instances > 1:
+			return # ticks are skipped by the scheduler as they come due. see self.skip_tick()
+		if self._misfire_runs:
+			return # catching up runs missed while the app was down. see self.misfire()
+		missed, last_missed = self._fast_forward(self._clock.time())
+		if missed == 0:
+			return
+		if self._overlap == 'queue':
+			self._coalesced_ticks += missed - 1
+			self.next_timestamp = last_missed # one pending run, due right away
+		else:
+			self._skipped_ticks += missed
+
+	def _iter_runs_after(self, since):
+		'''generator of the timestamps of the nominal runs after 'since', in order'''
+		for ts in self._iter_runs(since):
+			if ts > since:
+				yield ts
+
+	def _collect_misfires(self, now):
+		'''
+		apply the misfire policy to the runs missed between the last persisted scheduled run and 'now'
+		- returns nominal times of the runs to catch up, oldest first. see self.misfire()
+		- at most MAX_PREVIEW_RUNS missed runs are considered
+		'''
+		if self._misfire is None or self._last_scheduled is None or self.is_disabled or self._misfire_resume is not None:
+			return []
+		missed = list(itertools.islice(itertools.takewhile(lambda ts: ts <= now, self._iter_runs_after(self._last_scheduled)), MAX_PREVIEW_RUNS))
+		if len(missed) == 0:
+			return []
+		self._fast_forward(now) # the regular schedule resumes after now, even within startup_grace_mins
+		policy, max_lateness = self._misfire
+		runs = missed
+		if max_lateness is not None:
+			runs = [ts for ts in runs if now - ts <= max_lateness]
+		coalesced = 0
+		if policy == 'skip':
+			runs = []
+		elif policy == 'once' and len(runs) > 1:
+			coalesced = len(runs) - 1
+			runs = runs[-1:]
+		self._coalesced_ticks += coalesced
+		self._skipped_ticks += len(missed) - len(runs) - coalesced
+		self._misfire_runs = runs
+		if len(runs) == 0:
+			self._last_scheduled = missed[-1] # handled. not counted again on the next restart
+		return runs
+
+	def _schedule_catchup(self, release_ts):
+		'''start catching up missed runs at release_ts. see TaskScheduler.restore_all_job_logs()'''
+		self._misfire_resume = self.next_timestamp
+		self.next_timestamp = release_ts
+
+	def _schedule_after_run(self):
+		'''schedule the next run once a scheduled run started (overlap) or completed'''
+		started = time.perf_counter()
+		if self._misfire_runs:
+			self.next_timestamp = self._clock.time() # next missed run, due right away
+		elif self._misfire_resume is not None:
+			self.next_timestamp, self._misfire_resume = self._misfire_resume, None # back to the regular schedule
+		else:
+			self.schedule_next_run(just_ran=True)
+		self._histograms['schedule'].record(time.perf_counter() - started)
+
+	def _fire_times_to_dict(self):
+		return {'scheduled': self._last_scheduled, 'fired': self._last_start}
+
+	def _fire_times_from_dict(self, times):
+		self._last_scheduled = times.get('scheduled')
+		self._last_start = times.get('fired')
+
+	def _sim_copy(self, clock):
+		'''
+		shallow copy of the job that reads time from 'clock' and is detached from the scheduler
+		- no callbacks, so rescheduling the copy does not touch the scheduler's due-job index
+		- see TaskScheduler.simulate()
+		'''
+		j = copy.copy(self)
+		j._clock = clock
+		j._on_schedule_cbs, j._on_complete_cbs, j._on_enable_cbs, j._on_disable_cbs = [], [], [], []
+		j._on_timeout_cbs = []
+		j._startup_grace_mins = 0
+		return j
+
+	def _schedule_key(self):
+		'''jobs with equal keys run at the same (nominal) times. see TaskScheduler.simulate()'''
+		if type(self).__module__ != __name__:
+			return id(self) # external job classes may keep more schedule state
+		at = tuple(sorted(self.time_string)) if isinstance(self.time_string, (list,set,tuple)) else self.time_string
+		return (type(self), self.interval, at, self.tzname, self._tz_backend, id(self.calendar), getattr(self, '_strict_date', None), getattr(self, '_align', None))
 
 	def did_fail(self):
 		'''test if job failed'''
@@ -306,9 +660,123 @@ class Job(object):
 		return self._job_signature_hash
 
 
-	def _run(self, is_rerun: bool, kwargs: dict=None):
+	def _call_func(self, kw, run_token):
+		'''execute the job function, enforcing self._timeout if set'''
+		if inspect.iscoroutinefunction(self.func):
+			coro = self.func(**kw)
+			if self._timeout is not None:
+				coro = asyncio.wait_for(coro, self._timeout)
+			try:
+				return asyncio.run(coro)
+			except asyncio.TimeoutError:
+				raise JobTimeoutError(f"timed out after {self._timeout} seconds") from None
+
+		if callable(getattr(self.func, 'cancel', None)): # ScriptFunc, ProcessFunc. cancelled per run, see self._on_timeout()
+			kw = dict(kw, _run_token=run_token)
+		if self._timeout is None:
+			return self.func(**kw)
+
+		timer = threading.Timer(self._timeout, self._on_timeout, args=(run_token, ))
+		timer.daemon = True
+		timer.start()
+		try:
+			return self.func(**kw)
+		except Exception as e:
+			if run_token in self._cancelled_runs:
+				raise JobTimeoutError(f"timed out after {self._timeout} seconds") from e
+			raise
+		finally:
+			timer.cancel()
+			self._cancelled_runs.discard(run_token)
+
+	def _on_timeout(self, run_token):
+		'''
+		called from a timer thread when a run exceeds self._timeout
+		- the clean up of abandoned runs is handed to the scheduler loop through the 'ontimeout' callbacks,
+			so that it never runs concurrently with TaskScheduler.check(). see self._finish_timed_out_runs()
+		'''
+		if run_token not in self._active_runs:
+			return
+		if callable(getattr(self.func, 'cancel', None)): # ScriptFunc, ProcessFunc
+			self._cancelled_runs.add(run_token)
+			self.func.cancel(run_token) # only this run fails. the error is handled in self._run()
+			return
+
+		# plain function in a thread. it can't be stopped, so abandon the run
+		with self._run_lock:
+			if run_token not in self._active_runs:
+				return
+			run_info, is_rerun = self._active_runs[run_token]
+			self._abandoned_runs.add(run_token) # the abandoned run will skip its own clean up when (if ever) it returns
+			timed_out_info = self._new_run_info() # abandoned run keeps writing to the old logger
+			timed_out_info.from_dict(run_info.to_dict())
+			if self._run_info is run_info:
+				self._run_info = timed_out_info
+				run_info.discard(keep_spill=True) # the spilled log is shown by timed_out_info now
+			msg = f"Job {self.func_signature()} timed out after {self._timeout} seconds\n"
+			self._timed_out_runs.append((run_token, is_rerun, msg))
+		timed_out_info.set_timeout(msg)
+		if not self._on_timeout_cbs: # not registered with a TaskScheduler
+			self._finish_timed_out_runs()
+		for cb in self._on_timeout_cbs:
+			cb(self)
+
+	def _finish_timed_out_runs(self):
+		'''report, reschedule and release the slot of runs abandoned by self._on_timeout()'''
+		with self._run_lock:
+			timed_out, self._timed_out_runs = self._timed_out_runs, []
+		for run_token, is_rerun, msg in timed_out:
+			self._record_outcome(failed=True, duration=self._timeout)
+			self._report_error(msg)
+			if not is_rerun and self.max_instances == 1:
+				self._schedule_after_run()
+			self._active_runs.pop(run_token, None)
+			self._handle_missed_ticks()
+			self._call_complete_cbs()
+
+	def _record_outcome(self, failed, duration):
+		'''update run counters once a run completes or is abandoned'''
+		self._histograms['duration'].record(duration)
+		with self._run_lock:
+			self._runs_total += 1
+			if failed:
+				self._failures_total += 1
+			else:
+				self._last_success = self._clock.time()
+
+	def _report_error(self, err_msg):
+		'''call error handlers registered through .catch() or the scheduler'''
+		try:
+			if self._err_handler is not None:
+				self._err_handler(err_msg) # job specific error callback registered through .catch()
+			elif self._generic_err_handler is not None:
+				self._generic_err_handler(err_msg) # generic error callback from scheduler
+		except:
+			traceback.print_exc(file=sys.stderr) # prints to stderr
+
+	def _call_complete_cbs(self):
+		started = time.perf_counter()
+		for cb in self._on_complete_cbs: # call any registered on-complete callbacks
+			try:
+				cb(self)
+			except Exception as e:
+				print("on-complete-cb-error:", str(e))
+		self._histograms['callbacks'].record(time.perf_counter() - started)
+
+	def _run(self, run_token: int, run_info: print_logger._PrintLogger, is_rerun: bool, kwargs: dict=None):
 		'''this is an internal runner. see self.run() for more'''
-		self.is_running = True
+		if not is_rerun and self._misfire_runs: # catch-up of a run missed while the app was down. see self.misfire()
+			self._last_scheduled = self._misfire_runs.pop(0)
+			self._last_start = self._clock.time()
+			run_info.set_jitter(self._last_start - self._last_scheduled)
+			self._histograms['lateness'].record(self._last_start - self._last_scheduled)
+		elif not is_rerun and self.next_timestamp > 0:
+			self._last_scheduled = self.next_timestamp
+			self._last_start = self._clock.time()
+			run_info.set_jitter(self._last_start - self.due_timestamp) # how late the run started
+			self._histograms['lateness'].record(self._last_start - self.due_timestamp)
+		if not is_rerun and self.max_instances > 1:
+			self._schedule_after_run() # schedule right away so that the next tick can start another run
 		try:
 
 			kw = self.kwargs.copy() # start with default kwargs
@@ -330,9 +798,9 @@ class Job(object):
 			print("*") # job log seperator
 
 			start_time = time.time()
-			return self.func(**kw) # actual job execution
+			return self._call_func(kw, run_token) # actual job execution
 
-		except Exception:
+		except Exception as e:
 			traceback.print_exc()
 			print("Job", self.func_signature(), "failed!")
 			_server_info = _get_server_info()
@@ -343,18 +811,17 @@ class Job(object):
 				git_url=_server_info['git_url'],
 				tb=traceback.format_exc()
 			)
-			self._run_info.set_error()
-			try:
-				if self._err_handler is not None:
-					self._err_handler(err_msg) # job specific error callback registered through .catch()
-				elif self._generic_err_handler is not None:
-					self._generic_err_handler(err_msg) # generic error callback from scheduler
-			except:
-				traceback.print_exc(file=sys.stderr) # prints to stderr
+			run_info.set_error()
+			if isinstance(e, JobTimeoutError):
+				run_info.set_timeout()
+			self._report_error(err_msg)
 		finally:
+			if run_token in self._abandoned_runs:
+				return # run was abandoned after a timeout. see self._on_timeout()
+
 			# if the job was forced to rerun, we should not schedule the next run
-			if not is_rerun:
-				self.schedule_next_run(just_ran=True)
+			if not is_rerun and self.max_instances == 1:
+				self._schedule_after_run()
 
 			# add print statements
 			print("*") # job log seperator
@@ -365,24 +832,39 @@ class Job(object):
 				"Rerun End" if is_rerun else "End",
 				self.tz_now().strftime("%Y-%m-%d %H:%M:%S %Z")
 			))
-			self.is_running = False
+			self._active_runs.pop(run_token, None)
+			self._handle_missed_ticks()
 
 
 	def run(self, is_rerun: bool=False, kwargs: dict=None):
 		'''
 		begin job run
 		- redirected all print statements to _PrintLogger
+		- every concurrent run (see self.overlap()) gets its own _PrintLogger. the latest one is shown, the others can be
+			read by run_id while they are in progress (see self.read_log()). once an older run completes, its log is only
+			kept in the log files (log_filepath, job_log_dir, json_log_filepath), where its lines are tagged with its run_id
 		- call error handlers if provided
 		- execute registered callback functions
 		'''
-		with self._run_info.start_capture(silently=self._run_silently): # captures all writes to stdout
-			self._run(is_rerun=is_rerun, kwargs=kwargs)
-
-		for cb in self._on_complete_cbs: # call any registered on-complete callbacks
-			try:
-				cb(self)
-			except Exception as e:
-				print("on-complete-cb-error:", str(e))
+		with self._run_lock:
+			self._run_token += 1
+			run_token = self._run_token
+			run_info = self._run_info
+			if self._active_runs: # another run is in progress
+				run_info = self._new_run_info()
+				self._run_info.discard() # its spilled log is deleted once its run ends
+				self._run_info = run_info
+			self._active_runs[run_token] = (run_info, is_rerun)
+
+		started = time.perf_counter()
+		with run_info.start_capture(silently=self._run_silently): # captures all writes to stdout
+			self._run(run_token, run_info, is_rerun=is_rerun, kwargs=kwargs)
+
+		if run_token in self._abandoned_runs: # the run was abandoned after a timeout and callbacks were already called
+			self._abandoned_runs.discard(run_token)
+			return
+		self._record_outcome(failed=run_info.error != '', duration=time.perf_counter() - started)
+		self._call_complete_cbs()
 
 
 	def _next_run_dt(self):
@@ -395,6 +877,26 @@ class Job(object):
 		if hasattr(self, '_run_info'):
 			self._run_info.from_dict(logs_dict)
 
+	@property
+	def active_run_ids(self):
+		'''run_id of every run in progress, oldest first'''
+		with self._run_lock:
+			infos = [info for info, _ in self._active_runs.values()]
+		return [info.run_id for info in infos]
+
+	def read_log(self, offset=0, size=print_logger.LOG_PAGE_SIZE, run_id=None):
+		'''
+		page through the full log of the latest run. see print_logger._PrintLogger.read_log()
+		- run_id (`str`): read the log of another run in progress instead (see self.active_run_ids). raises ValueError if unknown
+		'''
+		run_info = self._run_info
+		if run_id is not None and run_info.run_id != run_id:
+			with self._run_lock:
+				run_info = next((info for info, _ in self._active_runs.values() if info.run_id == run_id), None)
+			if run_info is None:
+				raise ValueError("Unknown run, or run completed")
+		return run_info.read_log(offset=offset, size=size)
+
 	def to_dict(self):
 		'''property to access job info dict'''
 		return dict(
@@ -408,6 +910,16 @@ class Job(object):
 			at=self.time_string,
 			tzname=self.tzname,
 			is_running=self.is_running,
+			is_queued=self.is_queued,
+			priority=self.priority,
+			group=self.group,
+			start_offset=round(self._start_offset, 3),
+			overlap=self._overlap,
+			running_instances=self.running_instances,
+			active_run_ids=self.active_run_ids,
+			skipped_ticks=self._skipped_ticks,
+			coalesced_ticks=self._coalesced_ticks,
+			misfire={'policy': self._misfire[0], 'max_lateness': self._misfire[1], 'pending': len(self._misfire_runs)} if self._misfire else None,
 			is_disabled=self.is_disabled,
 			next_run=self._next_run_dt(),
 			logs=self._logs_to_dict(),
@@ -444,6 +956,13 @@ class OneTimeJob(Job):
 		else:
 			self.next_timestamp = self.to_timestamp(upcoming)
 
+	def _iter_runs(self, start_ts):
+		Y, m, d = self.interval.split('-')
+		for h, mi in self._run_times():
+			ts = self.to_timestamp(self.tz_dt(int(Y), int(m), int(d), h, mi))
+			if ts >= start_ts:
+				yield ts
+
 	def is_due(self):
 		if self.next_timestamp==0:
 			return False
@@ -451,20 +970,122 @@ class OneTimeJob(Job):
 
 
 class RepeatJob(Job):
-	'''type of job that runs every n seconds'''
+	'''
+	type of job that runs every n seconds
+	- by default, each run is scheduled 'interval' seconds after the previous one was due
+	- aligned jobs run on wall clock boundaries instead (ex: every 60 seconds at :00). see self.align()
+	'''
+
+	def __init__(self, jobid, every, at, func, kwargs):
+		super().__init__(jobid, every, at, func, kwargs)
+		self._align = None # (offset, catchup) of an aligned job. see self.align()
+		self._catchup_runs = 0 # consecutive catch-up runs of an aligned job
 
 	@classmethod
 	def is_valid_interval(cls, interval, time_string):
 		return isinstance(interval, (int, float)) and time_string is None
 
+	@property
+	def is_aligned(self):
+		return self._align is not None
+
+	def align(self, offset=0, catchup='once'):
+		'''
+		run on multiples of the interval on the wall clock of the job's timezone, plus 'offset' seconds
+		- ex: every(60) runs at :00 of every minute, every(3600) at the top of every hour
+		- runs are spaced by boundary arithmetic, so start times don't drift with run durations or polling
+		- catchup: what to do with boundaries that passed without a run (long runs, suspends, a wall clock step forward)
+			- 'once': run once, right away, for all missed boundaries (default)
+			- 'skip': drop them and wait for the next boundary. a run that is late by a full interval is skipped too
+			- n (`int`): run up to n of the missed boundaries back to back, then drop the rest
+		- TaskScheduler re-anchors aligned jobs when the wall clock is set back
+		'''
+		if not isinstance(offset, (int, float)) or not 0 <= offset < self.interval:
+			raise BadScheduleError("align offset should be a number of seconds between 0 and the interval")
+		if catchup not in ('once', 'skip') and not (isinstance(catchup, int) and not isinstance(catchup, bool) and catchup >= 1):
+			raise BadScheduleError("catchup should be 'once', 'skip' or a positive number of runs")
+		self._align = (offset, catchup)
+		self._catchup_runs = 0
+		self.schedule_next_run()
+		return self
+
 	def schedule_next_run(self, just_ran=False):
 		if not isinstance(self.interval, (int, float)) or self.interval <= 0:
 			raise BadScheduleError("Illegal interval for repeating job. Expected number of seconds")
 
-		if just_ran:
+		if self.is_aligned:
+			self._schedule_aligned(just_ran)
+		elif just_ran:
 			self.next_timestamp += self.interval
 		else:
-			self.next_timestamp = time.time() + self.interval
+			self.next_timestamp = self._clock.time() + self.interval
+
+	def _boundary_after(self, t):
+		'''first aligned time after t'''
+		base = self.to_datetime(t).utcoffset().total_seconds() - self._align[0] # boundaries are at k * interval + offset on the local wall clock
+		return (math.floor((t + base) / self.interval) + 1) * self.interval - base
+
+	def _schedule_aligned(self, just_ran):
+		now = self._clock.time()
+		nominal = self.next_timestamp
+		if not just_ran or nominal <= 0:
+			self._catchup_runs = 0
+			self.next_timestamp = self._boundary_after(now)
+			return
+		catchup = self._align[1]
+		backlog = max(0, math.floor((now - nominal) / self.interval)) # boundaries after the last tick that have passed
+		if backlog == 0:
+			self._catchup_runs = 0
+			self.next_timestamp = self._boundary_after(nominal)
+		elif catchup == 'once':
+			started = self._last_start if self._last_start is not None else now
+			covered = min(backlog, max(0, math.floor((started - nominal) / self.interval))) # passed before the run started
+			during = backlog - covered
+			self._coalesced_ticks += covered + max(0, during - 1)
+			next_ts = self._boundary_after(now)
+			self.next_timestamp = next_ts - self.interval if during > 0 else next_ts # one pending run, due right away
+		elif catchup == 'skip' or self._catchup_runs >= catchup:
+			self._skipped_ticks += backlog
+			self._catchup_runs = 0
+			self.next_timestamp = self._boundary_after(now)
+		else:
+			self._catchup_runs += 1
+			self.next_timestamp = self._boundary_after(nominal) # first missed boundary, due right away
+
+	def is_stale(self):
+		if self._align is None or self._align[1] != 'skip' or self.next_timestamp <= 0:
+			return False
+		return self._clock.time() - self.due_timestamp >= self.interval
+
+	def _iter_runs(self, start_ts):
+		if self.next_timestamp <= 0:
+			return
+		ts = self.next_timestamp
+		if start_ts > ts:
+			ts += -((ts - start_ts) // self.interval) * self.interval # first run at or after start_ts
+		while True:
+			yield ts
+			ts += self.interval
+
+	def _iter_runs_after(self, since):
+		ts = self._boundary_after(since) if self.is_aligned else since + self.interval
+		while True:
+			yield ts
+			ts = self._boundary_after(ts) if self.is_aligned else ts + self.interval
+
+	def _fast_forward(self, now):
+		'''same as Job._fast_forward(), without stepping through every missed tick'''
+		if self.is_aligned or not 0 < self.next_timestamp <= now:
+			return 0, None # missed ticks of aligned jobs are handled by the catchup policy. see self.align()
+		missed = int((now - self.next_timestamp) // self.interval) + 1
+		last_missed = self.next_timestamp + (missed - 1) * self.interval
+		self.next_timestamp = last_missed + self.interval
+		return missed, last_missed
+
+	def to_dict(self):
+		d = super().to_dict()
+		d['align'] = {'offset': self._align[0], 'catchup': self._align[1]} if self.is_aligned else None
+		return d
 
 
 class MonthlyJob(Job):
@@ -522,6 +1143,21 @@ class MonthlyJob(Job):
 		n = self.attach_upcoming_run_time(sched_day.replace(day=interval))
 		self.next_timestamp = self.to_timestamp(n)
 
+	def _iter_runs(self, start_ts):
+		interval = int(self.PATTERN.match(self.interval).groups()[0])
+		times = self._run_times()
+		start = self.to_datetime(start_ts)
+		year, month = start.year, start.month
+		for _ in range(12 * MAX_LOOKAHEAD_YEARS):
+			last_day = _get_eom(dt(year, month, 1)).day
+			if interval <= last_day or self._strict_date == False:
+				day = min(interval, last_day)
+				for h, m in times:
+					ts = self.to_timestamp(self.tz_dt(year, month, day, h, m))
+					if ts >= start_ts:
+						yield ts
+			year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
 	def __repr__(self):
 		r = super().__repr__()
 		if self._strict_date:
@@ -529,11 +1165,129 @@ class MonthlyJob(Job):
 		return r
 
 
+class CronJob(Job):
+	'''
+	type of job that runs at the times of a cron expression
+	- 5 fields (minute hour day-of-month month day-of-week), or 6 fields with seconds first. see _cron.CronExpression
+	- the interval still decides which days are runnable (ex: 'businessday' skips holidays). use 'day' to only apply the expression
+	- example: .every('businessday').cron('*/15 9-15 * * *')
+	'''
+
+	@classmethod
+	def is_valid_interval(cls, interval, time_string):
+		return interval in RUNABLE_DAYS and isinstance(time_string, str) and len(time_string.split()) in (5, 6)
+
+	def __init__(self, jobid, every, at, func, kwargs):
+		try:
+			self._cron = CronExpression(at)
+		except ValueError as e:
+			raise BadScheduleError(str(e))
+		super().__init__(jobid, every, at, func, kwargs)
+
+	def schedule_next_run(self, just_ran=False):
+		now = self.tz_now()
+		if just_ran:
+			start_ts = int(now.timestamp()) + 1
+		else:
+			start = now.replace(microsecond=0) if self._cron.has_seconds else now.replace(second=0, microsecond=0)
+			start_ts = start.timestamp() - self._startup_grace_mins * 60
+		upcoming = next(self._iter_runs(start_ts), None)
+		if upcoming is None:
+			raise BadScheduleError(f"'{self.time_string}' has no '{self.interval}' runs in the next {MAX_LOOKAHEAD_YEARS} years")
+		self.next_timestamp = upcoming
+
+	def _iter_runs(self, start_ts):
+		start = self.to_datetime(start_ts)
+		last = None
+		for d in CALENDAR_INDEX.iter_runnable(RUNABLE_DAYS[self.interval], self.calendar, start.date()):
+			if not self._cron.matches_day(d):
+				continue
+			from_time = (start.hour, start.minute, start.second) if d == start.date() else (0, 0, 0)
+			for h, m, s in self._cron.times_from(*from_time):
+				ts = self.to_timestamp(self.tz_dt(d.year, d.month, d.day, h, m, s))
+				if ts >= start_ts and (last is None or ts > last): # wall times in a daylight savings gap resolve to the same time
+					last = ts
+					yield ts
+
+
+class WindowJob(Job):
+	'''
+	type of job that runs every n seconds within a time window, on the days of the interval
+	- time_string is of the form 'HH:MM-HH:MM/seconds'. the window includes its start and excludes its end
+	- a window that ends before it starts runs past midnight. it belongs to the day it starts on
+	- the next run is computed from the offset into the window, without listing the runs of the day
+	- example: .every('businessday').between('09:30', '16:00', 300)
+	'''
+	PATTERN = re.compile(r'^(\d{1,2}):(\d{2})-(\d{1,2}):(\d{2})/(\d+)$')
+
+	@classmethod
+	def is_valid_interval(cls, interval, time_string):
+		return interval in RUNABLE_DAYS and isinstance(time_string, str) and cls.PATTERN.match(time_string) is not None
+
+	def __init__(self, jobid, every, at, func, kwargs):
+		h1, m1, h2, m2, step = (int(x) for x in self.PATTERN.match(at).groups())
+		if h1 > 23 or h2 > 23 or m1 > 59 or m2 > 59:
+			raise BadScheduleError(f"Invalid time window '{at}'")
+		if step <= 0:
+			raise BadScheduleError("window interval should be a positive number of seconds")
+		self._window_start = h1 * 3600 + m1 * 60 # seconds after midnight
+		self._window_length = (h2 * 3600 + m2 * 60 - self._window_start) % 86400 or 86400
+		self._window_step = step
+		self._window_slots = -(-self._window_length // step) # runs per window
+		super().__init__(jobid, every, at, func, kwargs)
+
+	def schedule_next_run(self, just_ran=False):
+		now = self.tz_now()
+		if just_ran:
+			start_ts = int(now.timestamp()) + 1
+		else:
+			start_ts = now.replace(microsecond=0).timestamp() - self._startup_grace_mins * 60
+		upcoming = next(self._iter_runs(start_ts), None)
+		if upcoming is None:
+			raise BadScheduleError(f"'{self.interval}' has no runnable days in the next {MAX_LOOKAHEAD_YEARS} years")
+		self.next_timestamp = upcoming
+
+	def _slot_timestamp(self, d, k):
+		'''timestamp of run k of the window that starts on date d'''
+		days, secs = divmod(self._window_start + k * self._window_step, 86400)
+		d = d + timedelta(days=days)
+		h, rem = divmod(secs, 3600)
+		return self.to_timestamp(self.tz_dt(d.year, d.month, d.day, h, rem // 60, rem % 60))
+
+	def _iter_runs(self, start_ts):
+		start = self.to_datetime(start_ts)
+		wall = start.replace(tzinfo=None)
+		first_day = start.date()
+		if self._window_start + self._window_length > 86400:
+			first_day -= timedelta(days=1) # yesterday's window may still be open
+		last = None
+		for d in CALENDAR_INDEX.iter_runnable(RUNABLE_DAYS[self.interval], self.calendar, first_day):
+			offset = (wall - dt(d.year, d.month, d.day)).total_seconds() - self._window_start
+			k = max(0, -int(-offset // self._window_step)) # first run at or after 'start'
+			while k < self._window_slots:
+				ts = self._slot_timestamp(d, k)
+				if ts >= start_ts and (last is None or ts > last): # wall times in a daylight savings gap resolve to the same time
+					last = ts
+					yield ts
+				k += 1
+
+	def to_dict(self):
+		d = super().to_dict()
+		start, end = self.time_string.split('/')[0].split('-')
+		d['window'] = {'start': start, 'end': end, 'interval': self._window_step}
+		return d
+
+
 class AsyncJobWrapper(object):
-	'''wrapper to run the job on a parallel thread'''
+	'''
+	wrapper to run the job on a parallel thread
+	- if an executor (see executor.JobExecutor) is provided, the run is submitted to its worker pool
+	- otherwise a new thread is started for every run
+	'''
 
-	def __init__(self, job:Job):
+	def __init__(self, job:Job, executor=None):
 		self.job = job
+		self.executor = executor
 		self.proc = None
 
 	def __repr__(self):
@@ -555,14 +1309,46 @@ class AsyncJobWrapper(object):
 
 	def run(self, *args, **kwargs):
 		'''non-blocking'''
-		self.proc = threading.Thread(target=self.job.run, args=args, kwargs=kwargs)
-		self.proc.daemon = True
-		self.proc.start()
+		if self.executor is None:
+			self.proc = threading.Thread(target=self.job.run, args=args, kwargs=kwargs)
+			self.proc.daemon = True
+			self.proc.start()
+			return
+		self.job.is_queued = True
+		try:
+			self.executor.submit(self._run_queued, *args, **kwargs)
+		except Exception:
+			self.job.is_queued = False
+			raise
+
+	def _run_queued(self, *args, **kwargs):
+		self.job.is_queued = False
+		self.job.run(*args, **kwargs)
 
 	def catch(self, err_handler):
 		'''register job specific error handler'''
 		return self.job.catch(err_handler=err_handler)
 
+	def timeout(self, seconds):
+		'''fail the job if a run takes longer than 'seconds'. see Job.timeout()'''
+		return self.job.timeout(seconds=seconds)
+
+	def overlap(self, policy):
+		'''what to do when the job is due while a previous run is still in progress. see Job.overlap()'''
+		return self.job.overlap(policy=policy)
+
+	def stagger(self, window, mode='hash'):
+		'''start the job up to 'window' seconds after its nominal schedule. see Job.stagger()'''
+		return self.job.stagger(window=window, mode=mode)
+
+	def align(self, offset=0, catchup='once'):
+		'''run a repeating job on wall clock boundaries. see RepeatJob.align()'''
+		return self.job.align(offset=offset, catchup=catchup)
+
+	def misfire(self, policy='once', max_lateness=None):
+		'''what to do at startup with the runs that were missed while the app was down. see Job.misfire()'''
+		return self.job.misfire(policy=policy, max_lateness=max_lateness)
+
 	def silently(self, run_silently=True):
 		'''
 		Mark the job to not print any info lines to console.
@@ -582,3 +1368,50 @@ class NeverJob(Job):
 
 	def is_due(self):
 		return False
+
+
+class DependentJob(Job):
+	'''
+	type of job that runs when all of its upstream jobs complete successfully
+	- see TaskScheduler.after() and dag.JobGraph
+	'''
+
+	def __init__(self, jobid, every, at, func, kwargs, upstreams):
+		self.upstreams = list(upstreams)
+		self._pending_trigger = False # triggered while running. runs again once the current run completes
+		super().__init__(jobid, every, at, func, kwargs)
+
+	@classmethod
+	def is_valid_interval(cls, interval, time_string):
+		return interval == 'dependent' and time_string is None
+
+	def schedule_next_run(self, just_ran=False):
+		with self._run_lock:
+			pending, self._pending_trigger = self._pending_trigger, False
+		self.next_timestamp = self._clock.time() if pending else 0 # waits for the next trigger
+
+	def trigger(self):
+		'''
+		mark the job due now. called by TaskScheduler once all upstream jobs succeeded
+		- a trigger received while the job is running is kept, so the job runs again once the current run completes
+		'''
+		if self.is_disabled:
+			return
+		with self._run_lock:
+			if self._active_runs:
+				self._pending_trigger = True
+		self.next_timestamp = self._clock.time()
+
+	def _handle_missed_ticks(self):
+		pass # triggers are not ticks. a trigger received during a run is kept by self.trigger()
+
+	def _run(self, run_token, run_info, is_rerun, kwargs=None):
+		if not is_rerun:
+			with self._run_lock:
+				self._pending_trigger = False # triggers received before the run started are served by this run
+		return super()._run(run_token, run_info, is_rerun, kwargs=kwargs)
+
+	def to_dict(self):
+		d = super().to_dict()
+		d['after'] = self.upstreams
+		return d
@@ -0,0 +1,87 @@
+'''
+OpenMetrics text exposition of TaskScheduler counters. see TaskMonitor /metrics
+- only reads counters and histograms that jobs maintain as they run, so a scrape is O(jobs)
+'''
+
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+PREFIX = 'flask_production'
+
+
+def _escape(value):
+	return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+	if not labels:
+		return ''
+	return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+
+
+def _num(v):
+	if v == float('inf'):
+		return '+Inf'
+	return repr(v) if isinstance(v, float) else str(v)
+
+
+class _Family(object):
+	'''samples of one metric family'''
+
+	def __init__(self, name, mtype, help_text, unit=None):
+		self.name = f"{PREFIX}_{name}"
+		self.mtype = mtype
+		self.help_text = help_text
+		self.unit = unit
+		self.lines = []
+
+	def add(self, value, labels=None, suffix=''):
+		self.lines.append(f"{self.name}{suffix}{_labels(labels)} {_num(value)}")
+
+	def add_histogram(self, histogram, labels=None):
+		cumulative, count, total = histogram.snapshot()
+		for bound, c in cumulative:
+			self.add(c, dict(labels or {}, le=_num(float(bound))), suffix='_bucket')
+		self.add(count, labels, suffix='_count')
+		self.add(total, labels, suffix='_sum')
+
+	def render(self):
+		head = [f"# TYPE {self.name} {self.mtype}"]
+		if self.unit is not None:
+			head.append(f"# UNIT {self.name} {self.unit}")
+		head.append(f"# HELP {self.name} {self.help_text}")
+		return head + self.lines
+
+
+def render(sched):
+	'''OpenMetrics text for the jobs of 'sched' (`TaskScheduler`)'''
+	runs = _Family('job_runs', 'counter', 'Completed runs, including reruns and failed runs')
+	failures = _Family('job_failures', 'counter', 'Failed or timed out runs')
+	skipped = _Family('job_skipped_ticks', 'counter', 'Scheduled runs that were dropped')
+	duration = _Family('job_duration_seconds', 'histogram', 'Run duration', unit='seconds')
+	lateness = _Family('job_lateness_seconds', 'histogram', 'Time between the due time of a scheduled run and its start', unit='seconds')
+	running = _Family('job_running', 'gauge', 'Runs in progress')
+	disabled = _Family('job_disabled', 'gauge', '1 if the job is disabled')
+	last_success = _Family('job_last_success_timestamp_seconds', 'gauge', 'Time at which the last successful run completed', unit='seconds')
+	tick = _Family('scheduler_tick_seconds', 'histogram', 'Time spent checking for due jobs, excluding jobs that run inline', unit='seconds')
+	log_dropped = _Family('log_dropped', 'counter', 'Log lines not written to log files because the log queue was full')
+
+	for j in list(sched.jobs):
+		labels = {'jobid': j.jobid, 'job': j.func.__qualname__}
+		runs.add(j._runs_total, labels, suffix='_total')
+		failures.add(j._failures_total, labels, suffix='_total')
+		skipped.add(j._skipped_ticks, labels, suffix='_total')
+		duration.add_histogram(j._histograms['duration'], labels)
+		lateness.add_histogram(j._histograms['lateness'], labels)
+		running.add(j.running_instances, labels)
+		disabled.add(int(j.is_disabled), labels)
+		if j._last_success is not None:
+			last_success.add(round(j._last_success, 3), labels)
+	tick.add_histogram(sched._tick_histogram)
+	if sched._log_queues:
+		log_dropped.add(sum(h.dropped for h in sched._log_queues), suffix='_total')
+
+	lines = []
+	for family in [runs, failures, skipped, duration, lateness, running, disabled, last_success, tick, log_dropped]:
+		lines.extend(family.render())
+	lines.append('# EOF')
+	return '\n'.join(lines) + '\n'
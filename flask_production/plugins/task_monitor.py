@@ -1,18 +1,21 @@
-from datetime import datetime as dt, date
+from datetime import datetime as dt, date, timedelta
 from collections import OrderedDict
 from enum import Enum
 import json
 import random
 import string
 import inspect
+from urllib.parse import quote
 
-from dateutil import tz
-from flask import Flask, Blueprint, request, send_file, redirect
+from flask import Flask, Blueprint, Response, request, send_file, redirect
 
 
 from .html_templates import * # pylint: disable=unused-wildcard-import
+from . import _openmetrics
 from ..sched import TaskScheduler
 from ..script_func import ScriptFunc
+from ..print_logger import LOG_PAGE_SIZE
+from .._tz import get_tz
 
 
 class TaskMonitor:
@@ -48,7 +51,7 @@ class TaskMonitor:
 		enhanced_rerun=True, # set False to disable enhanced rerun feature with ability to edit function arguments
 		):
 		self.tzname = sched._tz_default
-		self._init_dt = dt.now(tz.gettz(self.tzname)).strftime("%m/%d/%Y %I:%M %p %Z") # preformatted start time
+		self._init_dt = dt.now(get_tz(self.tzname, sched._tz_backend)).strftime("%m/%d/%Y %I:%M %p %Z") # preformatted start time
 		self.app = app
 		self.sched = sched
 		self._endpoint = endpoint
@@ -70,7 +73,20 @@ class TaskMonitor:
 		bp.add_url_rule("/enable_disable", view_func=self.__enable_disable_job, methods=['POST'])
 		bp.add_url_rule("/json/all", view_func=self.__get_all_json, methods=['GET'])
 		bp.add_url_rule("/json/summary", view_func=self.__get_summary_json, methods=['GET'])
+		bp.add_url_rule("/json/stagger", view_func=self.__get_stagger_json, methods=['GET'])
+		bp.add_url_rule("/json/stats", view_func=self.__get_stats_json, methods=['GET'])
+		bp.add_url_rule("/metrics", view_func=self.__get_metrics, methods=['GET'])
+		bp.add_url_rule("/json/dag", view_func=self.__get_dag_json, methods=['GET'])
+		bp.add_url_rule("/dag", view_func=self.__show_dag, methods=['GET'])
+		bp.add_url_rule("/json/runs", view_func=self.__get_runs_json, methods=['GET'])
+		bp.add_url_rule("/json/<int:n>/upcoming", view_func=self.__get_upcoming_json, methods=['GET'])
+		bp.add_url_rule("/calendar", view_func=self.__show_calendar, methods=['GET'])
 		bp.add_url_rule("/json/<int:n>", view_func=self.__get_one_json, methods=['GET'])
+		bp.add_url_rule("/json/<int:n>/log", view_func=self.__get_log_json, methods=['GET'])
+		bp.add_url_rule("/log", view_func=self.__show_log, methods=['GET'])
+		bp.add_url_rule("/json/<int:n>/archives", view_func=self.__get_archives_json, methods=['GET'])
+		bp.add_url_rule("/archives", view_func=self.__show_archives, methods=['GET'])
+		bp.add_url_rule("/archive", view_func=self.__stream_archive, methods=['GET'])
 
 		bp.add_url_rule("/static/<type>/<filename>", view_func=self.__serve_file, methods=['GET'])
 		self.app.register_blueprint(bp)
@@ -128,6 +144,14 @@ class TaskMonitor:
 		if jdict['is_running']:
 			state['state'] = "RUNNING"
 			state['css'] = "yellow"
+		elif jdict.get('is_queued'):
+			state['state'] = "QUEUED"
+			state['css'] = "yellow"
+			state['title'] = "waiting for a free worker"
+		elif jdict['logs'].get('timed_out'):
+			state['state'] = "TIMEOUT"
+			state['css'] = "orange"
+			state['title'] = "timed out after {}".format(self.__duration(jdict) or '-')
 		elif jdict['logs']['err'].strip()!='':
 			state['state'] = "ERROR"
 			state['css'] = "red"
@@ -159,7 +183,7 @@ class TaskMonitor:
 	def __scheduleTD(self, jdict):
 		tz_str = ''
 		if isinstance(jdict['tzname'], str):
-			tz_str = dt.now(tz.gettz(jdict['tzname'])).strftime("[%Z]")
+			tz_str = dt.now(get_tz(jdict['tzname'], self.sched._tz_backend)).strftime("[%Z]")
 
 		if isinstance(jdict['every'], int): # jdict['type']=='RepeatJob'
 			out = "every {} seconds {}".format(jdict['every'], tz_str)
@@ -173,6 +197,19 @@ class TaskMonitor:
 			out = 'on-demand'
 			return TD(out)
 
+		elif jdict['type']=='WindowJob':
+			w = jdict['window']
+			out = "every {} seconds from {} to {} on {} {}".format(w['interval'], w['start'], w['end'], jdict['every'], tz_str)
+			return TD(out.strip())
+
+		elif jdict['type']=='CronJob':
+			out = "every {} cron '{}' {}".format(jdict['every'], jdict['at'], tz_str)
+			return TD(out.strip())
+
+		elif jdict['type']=='DependentJob':
+			out = "after {}".format(', '.join(f"[{u:03}]" for u in jdict['after']))
+			return TD(out)
+
 		elif isinstance(jdict['at'], (list,set,tuple)):
 			full_str = "every {} at {} {}".format(jdict['every'], ', '.join(jdict['at']), tz_str)
 
@@ -187,6 +224,14 @@ class TaskMonitor:
 			return TD(out.strip())
 
 
+	def __overlapTD(self, jdict):
+		out = "{} | {} skipped, {} coalesced".format(jdict['overlap'], jdict['skipped_ticks'], jdict['coalesced_ticks'])
+		if jdict['running_instances'] > 1:
+			out += " | {} running".format(jdict['running_instances'])
+		title = "ticks that were due while the job was still running"
+		return TD(out, css='orange' if jdict['skipped_ticks'] > 0 else [], attrs={'title': title})
+
+
 	def __date_fmt(self, d):
 		fallback = '-'+('&nbsp;'*30) # a hiphen and some html spaces
 		return d.strftime("%Y-%m-%d %H:%M:%S %Z") if d is not None else fallback
@@ -243,9 +288,325 @@ class TaskMonitor:
 					'prev_run': jd['logs']['start'],
 					'next_run': jd['next_run'],
 				})
-			out = {'name': self._display_name, 'summary': summary, 'details': details}
+			out = {
+				'name': self._display_name,
+				'summary': summary,
+				'details': details,
+				'executor': self.sched.executor.stats(),
+				'lanes': {name: lane.stats() for name, lane in self.sched.lanes.items()},
+				'groups': self.sched.group_stats(),
+			}
 			return json.dumps({'success': out}, default=str)
 
+	def __get_stagger_json(self):
+		return json.dumps({'success': self.sched.stagger_report()}, default=str)
+
+	def __get_stats_json(self):
+		return json.dumps({'success': self.sched.stats()}, default=str)
+
+	def __get_metrics(self):
+		'''OpenMetrics (Prometheus) text of job counters. see _openmetrics.render()'''
+		return Response(_openmetrics.render(self.sched), content_type=_openmetrics.CONTENT_TYPE)
+
+	def __seconds_fmt(self, s):
+		if s is None:
+			return '-'
+		return f"{s*1000:.1f}ms" if s < 1 else f"{s:.2f}s"
+
+	def __stats_line(self):
+		'''one line summary of TaskScheduler.stats() for the home page'''
+		st = self.sched.stats()
+		utilization = f"{st['utilization']*100:.1f}%" if st['utilization'] is not None else '-'
+		text = "start lateness p50 {} / p99 {} &middot; loop tick p99 {} &middot; loop utilization {}".format(
+			self.__seconds_fmt(st['lateness']['p50']),
+			self.__seconds_fmt(st['lateness']['p99']),
+			self.__seconds_fmt(st['tick']['p99']),
+			utilization,
+		)
+		return SMALL(f"{text} (<a href='./json/stats'>details</a>)")
+
+	def __dag_info(self):
+		'''job graph with the state of every job. see TaskScheduler.after()'''
+		graph = self.sched.dag.to_dict()
+		levels = self.sched.dag.levels()
+		nodes = []
+		for jobid in sorted(levels):
+			jd = self.sched.get_job_by_id(jobid).to_dict()
+			state = self.__state(jd)
+			nodes.append({
+				'id': jobid,
+				'level': levels[jobid],
+				'func': jd['func'],
+				'signature': jd['signature'],
+				'state': state['state'],
+				'css': state['css'],
+				'waiting_on': graph['waiting_on'].get(jobid, []),
+				'blocked_by': graph['blocked_by'].get(jobid),
+			})
+		return {'nodes': nodes, 'edges': graph['edges'], 'critical_paths': self.sched.dag.critical_paths()}
+
+	def __get_dag_json(self):
+		if len(self.sched.dag)==0:
+			return json.dumps({'error':'No job dependencies'})
+		return json.dumps({'success': self.__dag_info()}, default=str)
+
+	def __dag_svg(self, info):
+		'''draw the job graph as an svg. one column per level, critical path edges highlighted'''
+		fills = {'grey': '#9a9a9a', 'yellow': 'rgb(255, 255, 76)', 'green': '#a9dda2', 'red': 'rgb(255, 68, 68)', 'orange': 'rgb(255, 153, 51)', 'blue': 'rgb(75, 75, 255)'}
+		w, h, col_w, row_h = 180, 40, 240, 70
+		pos, rows = {}, {}
+		for n in info['nodes']:
+			row = rows.get(n['level'], 0)
+			rows[n['level']] = row + 1
+			pos[n['id']] = (20 + n['level'] * col_w, 20 + row * row_h)
+		critical = set()
+		for path in info['critical_paths']:
+			for a, b in zip(path['steps'], path['steps'][1:]):
+				critical.add((a['jobid'], b['jobid']))
+
+		elems = []
+		for u, d in info['edges']:
+			(ux, uy), (dx, dy) = pos[u], pos[d]
+			elems.append('<line x1="{}" y1="{}" x2="{}" y2="{}" class="{}"></line>'.format(
+				ux + w, uy + h//2, dx, dy + h//2, 'critical' if (u, d) in critical else ''
+			))
+		node_svg = '<a href="./{id}"><g><title>{title}</title><rect x="{x}" y="{y}" width="{w}" height="{h}" rx="4" style="fill:{fill}"></rect><text x="{tx}" y="{ty}">[{id:03}] {label}</text></g></a>'
+		for n in info['nodes']:
+			x, y = pos[n['id']]
+			label = html_escape(n['func'] if len(n['func']) <= 24 else n['func'][:22] + '..')
+			title = html_escape(f"[{n['id']:03}] {n['signature']} - {n['state']}")
+			if n['blocked_by'] is not None:
+				title += f" (blocked by failed job [{n['blocked_by']:03}])"
+			elems.append(node_svg.format(
+				id=n['id'], title=title, x=x, y=y, w=w, h=h, fill=fills.get(n['css'], fills['grey']), tx=x + 8, ty=y + h//2 + 4, label=label
+			))
+		width = 40 + (max(rows) + 1) * col_w if rows else 0
+		height = 40 + max(rows.values(), default=0) * row_h
+		return '<svg class="dag-svg" width="{}" height="{}">{}</svg>'.format(width, height, ''.join(elems))
+
+	def __show_dag(self):
+		if len(self.sched.dag)==0:
+			return 'No job dependencies'
+		info = self.__dag_info()
+		names = {n['id']: html_escape(n['func']) for n in info['nodes']}
+		secs = lambda v: '-' if v is None else "{:.1f} seconds".format(v)
+		rows = []
+		for path in info['critical_paths']:
+			rows.append(TR([
+				TD(f"[{path['sink']:03}] {names[path['sink']]}"),
+				TD(' &rarr; '.join(f"{names[st['jobid']]} ({secs(st['duration'])})" for st in path['steps'])),
+				TD(secs(path['wall_time'])),
+				TD(secs(path['busy_time'])),
+				TD(secs(sum(st['wait'] or 0 for st in path['steps']))),
+			]))
+		head = [TH(th) for th in ['Last Job', 'Critical Path', 'Wall Time', 'Busy Time', 'Waiting']]
+		paths_table = TABLE(thead=THEAD(head), tbody=TBODY(rows), css='all-jobs')
+		container = DIV(
+			'\n'.join([
+				H(2, "{} - Job Dependencies".format(self._display_name)),
+				SPAN("<a href='./'>all jobs</a>"), # use relating url. see self.__redirect_root
+				self.__dag_svg(info),
+				paths_table,
+			]),
+			css=["container", "container-vertical", 'center']
+		)
+		return HTML(
+			title=self.title,
+			stylesheets=[
+				self.__css_src_wrap('dark_theme.css'),
+				self.__css_src_wrap('taskmonitor.css'),
+			],
+			body=[container]
+		)
+
+	def __parse_dt(self, s):
+		'''parse an ISO date or datetime from a query string. naive values are in the scheduler's default timezone'''
+		d = dt.fromisoformat(s)
+		return d if d.tzinfo is not None else d.replace(tzinfo=get_tz(self.tzname, self.sched._tz_backend))
+
+	def __preview_range(self):
+		'''start and end of a preview from the 'start' and 'days' or 'end' query parameters. defaults to the next 7 days'''
+		zone = get_tz(self.tzname, self.sched._tz_backend)
+		start = self.__parse_dt(request.args['start']) if request.args.get('start') else dt.now(zone)
+		if request.args.get('end'):
+			end = self.__parse_dt(request.args['end'])
+		else:
+			end = start + timedelta(days=int(request.args.get('days', 7)))
+		return start, end
+
+	def __get_upcoming_json(self, n):
+		j = self.sched.get_job_by_id(n)
+		if j is None:
+			return json.dumps({'error':'Invalid job id'})
+		try:
+			if request.args.get('until'):
+				runs = j.upcoming_runs(until=self.__parse_dt(request.args['until']))
+			else:
+				runs = j.upcoming_runs(n=int(request.args.get('n', 10)))
+		except ValueError as e:
+			return json.dumps({'error': str(e)})
+		return json.dumps({'success': {'jobid': n, 'signature': j.func_signature(), 'runs': runs}}, default=str)
+
+	def __get_runs_json(self):
+		try:
+			start, end = self.__preview_range()
+		except ValueError as e:
+			return json.dumps({'error': str(e)})
+		runs = [{'run_at': d, 'jobid': j.jobid, 'signature': j.func_signature()} for d, j in self.sched.runs_between(start, end)]
+		return json.dumps({'success': {'start': start, 'end': end, 'runs': runs}}, default=str)
+
+	def __show_calendar(self):
+		'''one column per day with the upcoming runs of all jobs. jobs that run many times a day are summarized'''
+		zone = get_tz(self.tzname, self.sched._tz_backend)
+		try:
+			start = self.__parse_dt(request.args['start']) if request.args.get('start') else dt.now(zone)
+			days = min(int(request.args.get('days', 7)), 31)
+		except ValueError as e:
+			return str(e)
+		first_day = start.astimezone(zone).replace(hour=0, minute=0, second=0, microsecond=0)
+		day_keys = [(first_day + timedelta(days=i)).date() for i in range(days)]
+		per_day = OrderedDict((d, OrderedDict()) for d in day_keys) # day -> jobid -> run datetimes
+		for d, j in self.sched.runs_between(start, first_day + timedelta(days=days)):
+			local = d.astimezone(zone)
+			if local.date() in per_day:
+				per_day[local.date()].setdefault(j.jobid, []).append(local)
+
+		names = {j.jobid: html_escape(j.func.__qualname__) for j in self.sched.jobs}
+		cells = []
+		for day, jobs in per_day.items():
+			lines = []
+			for jobid, runs in sorted(jobs.items(), key=lambda kv: kv[1][0]):
+				link = f"<a href='./{jobid}' title='[{jobid:03}]'>{names[jobid]}</a>" # use relating url. see self.__redirect_root
+				if len(runs) > 4:
+					lines.append(f"{runs[0].strftime('%H:%M')}-{runs[-1].strftime('%H:%M')} {link} &times;{len(runs)}")
+				else:
+					lines.extend(f"{r.strftime('%H:%M')} {link}" for r in runs)
+			cells.append(TD('<br>'.join(lines) or '-', attrs={'style': 'vertical-align:top'}))
+		head = [TH(d.strftime("%a %m/%d")) for d in day_keys]
+		calendar_table = TABLE(thead=THEAD(head), tbody=TBODY([TR(cells)]), css='all-jobs')
+
+		container = DIV(
+			'\n'.join([
+				H(2, "{} - Upcoming Runs".format(self._display_name)),
+				SPAN("<a href='./'>all jobs</a>"), # use relating url. see self.__redirect_root
+				SMALL("times in {}".format(dt.now(zone).strftime("%Z"))),
+				calendar_table,
+			]),
+			css=["container", "container-vertical", 'center']
+		)
+		return HTML(
+			title=self.title,
+			stylesheets=[
+				self.__css_src_wrap('dark_theme.css'),
+				self.__css_src_wrap('taskmonitor.css'),
+			],
+			body=[container]
+		)
+
+	def __log_page(self, j):
+		'''
+		page of the full log of a job from the 'offset' and 'size' query parameters. see Job.read_log()
+		- 'run' selects another run in progress by its run_id (see Job.active_run_ids). the latest run by default
+		'''
+		size = min(int(request.args.get('size', LOG_PAGE_SIZE)), 16 * LOG_PAGE_SIZE)
+		return j.read_log(offset=int(request.args.get('offset', 0)), size=size, run_id=request.args.get('run') or None)
+
+	def __get_log_json(self, n):
+		j = self.sched.get_job_by_id(n)
+		if j is None:
+			return json.dumps({'error':'Invalid job id'})
+		try:
+			page = self.__log_page(j)
+		except ValueError as e:
+			return json.dumps({'error': str(e)})
+		return json.dumps({'success': dict(page, jobid=n)}, default=str)
+
+	def __show_log(self):
+		'''full log of the latest run of a job, one page at a time'''
+		try:
+			n = int(request.args.get('job', ''))
+			j = self.sched.get_job_by_id(n)
+			if j is None:
+				return 'Not found'
+			page = self.__log_page(j)
+		except ValueError as e:
+			return str(e)
+		size = int(request.args.get('size', LOG_PAGE_SIZE))
+		run = request.args.get('run', '')
+		query = f"job={n}&run={quote(run)}" if run else f"job={n}"
+		links = [f"<a href='./{n}'>back to job</a>"] # use relating url. see self.__redirect_root
+		if page['offset'] > 0:
+			links.append(f"<a href='./log?{query}&offset={max(0, page['offset'] - size)}&size={size}'>previous page</a>")
+		if page['next_offset'] is not None:
+			links.append(f"<a href='./log?{query}&offset={page['next_offset']}&size={size}'>next page</a>")
+			links.append(f"<a href='./log?{query}&offset={max(0, page['size'] - size)}&size={size}'>last page</a>")
+		container = DIV(
+			'\n'.join([
+				H(2, "{} - Log".format(html_escape(j.func.__qualname__))),
+				SPAN(' &middot; '.join(links)),
+				SMALL("bytes {} - {} of {}".format(page['offset'], page['offset'] + len(page['text'].encode('utf-8')), page['size'])),
+				DIV( CODE(html_escape(page['text']), css='accesslog'), css=['console-div', 'console-color']),
+			]),
+			css=["container", "container-vertical"]
+		)
+		return HTML(
+			title=self.title,
+			stylesheets=[
+				self.__css_src_wrap('dark_theme.css'),
+				self.__css_src_wrap('taskmonitor.css'),
+			],
+			body=[container]
+		)
+
+	def __get_archives_json(self, n):
+		try:
+			segments = self.sched.job_log_segments(n)
+		except (IndexError, RuntimeError, ValueError) as e:
+			return json.dumps({'error': str(e)})
+		return json.dumps({'success': segments})
+
+	def __show_archives(self):
+		'''segments of the log file of a job. see TaskScheduler.job_log_segments()'''
+		try:
+			n = int(request.args.get('job', ''))
+			segments = self.sched.job_log_segments(n)
+		except (IndexError, RuntimeError, ValueError) as e:
+			return str(e)
+		j = self.sched.get_job_by_id(n)
+		rows = [
+			TR([
+				TD(f"<a href='./archive?job={n}&segment={seg['name']}'>{seg['name']}</a>"), # use relating url. see self.__redirect_root
+				TD(self.__date_fmt(dt.fromtimestamp(seg['modified'], tz=get_tz(self.tzname, self.sched._tz_backend)))),
+				TD(f"{seg['size']:,} bytes" + (" (gzip)" if seg['archived'] else "")),
+			])
+			for seg in reversed(segments) # latest first
+		]
+		container = DIV(
+			'\n'.join([
+				H(2, "{} - Log Archives".format(html_escape(j.func.__qualname__))),
+				SPAN(f"<a href='./{n}'>back to job</a>"),
+				TABLE(thead=THEAD([TH('Segment'), TH('Last Write'), TH('Size')]), tbody=TBODY(rows), css='info_table') if rows else SPAN('No logs yet'),
+			]),
+			css=["container", "container-vertical"]
+		)
+		return HTML(
+			title=self.title,
+			stylesheets=[
+				self.__css_src_wrap('dark_theme.css'),
+				self.__css_src_wrap('taskmonitor.css'),
+			],
+			body=[container]
+		)
+
+	def __stream_archive(self):
+		'''one segment of the log file of a job as plain text. archives are decompressed as they are sent'''
+		try:
+			n = int(request.args.get('job', ''))
+			chunks = self.sched.iter_job_log(n, request.args.get('segment', ''))
+		except (IndexError, RuntimeError, ValueError, FileNotFoundError) as e:
+			return Response(str(e), status=404, content_type='text/plain; charset=utf-8')
+		return Response(chunks, content_type='text/plain; charset=utf-8')
+
 	def __get_one_json(self, n):
 		j = self.sched.get_job_by_id(n)
 		if j is None:
@@ -296,6 +657,9 @@ class TaskMonitor:
 			'\n'.join([
 				H(2, "{} - Task Monitor".format(self._display_name)),
 				SPAN("Running since {}".format(self._init_dt)),
+				SPAN("<a href='./calendar'>upcoming runs</a>"),
+				SPAN("<a href='./dag'>job dependencies</a>") if len(self.sched.dag) > 0 else '',
+				self.__stats_line(),
 				refresh_text,
 				filter_input,
 				all_jobs_table,
@@ -343,7 +707,7 @@ class TaskMonitor:
 						Rerun
 						</button>'''.format(
 			name=job_funcname, jobid=n, # rerun_trigger params
-			btn_disabled="disabled" if state['state']=="RUNNING" or jobd['is_disabled'] else ""
+			btn_disabled="disabled" if state['state'] in ("RUNNING", "QUEUED") or jobd['is_disabled'] else ""
 		)
 		rows = [
 			TR([ titleTD("Schedule"), self.__scheduleTD(jobd), ]),
@@ -351,6 +715,7 @@ class TaskMonitor:
 			TR([ titleTD("Start Time"), TD(self.__date_fmt(jobd['logs']['start'])) ]),
 			TR([ titleTD("End Time"), TD(self.__date_fmt(jobd['logs']['end'])) ]),
 			TR([ titleTD("Time Taken"), TD(self.__duration(jobd)) ]),
+			TR([ titleTD("Overlap"), self.__overlapTD(jobd) ]) if jobd['overlap'] != 'skip' or jobd['skipped_ticks'] > 0 else '',
 			TR([ titleTD("Next Run In"), TD("-", attrs={'id':'next-run-in'}) ]),
 			TR([ TD(enable_disable_btn, colspan=2, css=['monitor-btn']) ]) if self._can_disable else '',
 			TR([ TD(rerun_btn, colspan=2, css=['monitor-btn']) ]) if self._can_rerun else ''
@@ -368,7 +733,15 @@ class TaskMonitor:
 			TD( DIV( CODE(html_escape(jobd['logs']['log']), css='accesslog'), css='console-div'), css="console-color"),
 			TD( DIV( CODE(html_escape(jobd['logs']['err']), css='accesslog'), css='console-div'), css="console-color"),
 		])
-		logs_table = TABLE(thead=THEAD([TH('Logs'), TH('Traceback')]), tbody=TBODY(logs_row), css='log_table')
+		logs_head = 'Logs'
+		if jobd['logs'].get('log_file') is not None: # log did not fit in memory. see print_logger._PrintLogger
+			logs_head += f" <small><a href='./log?job={n}'>full log</a></small>" # use relating url. see self.__redirect_root
+		for run_id in jobd['active_run_ids']: # older concurrent runs. see Job.overlap()
+			if run_id is not None and run_id != jobd['logs'].get('run_id'):
+				logs_head += f" <small><a href='./log?job={n}&run={quote(run_id)}'>run {html_escape(run_id[:8])}</a></small>"
+		if self.sched._job_log_handler is not None: # per-job log files. see TaskScheduler job_log_dir
+			logs_head += f" <small><a href='./archives?job={n}'>log archives</a></small>"
+		logs_table = TABLE(thead=THEAD([TH(logs_head), TH('Traceback')]), tbody=TBODY(logs_row), css='log_table')
 		logs_div = DIV( logs_table, css="logs_div" )
 
 		container = DIV(
@@ -438,7 +811,7 @@ class TaskMonitor:
 					elif str(typ).endswith('<enum>'):
 						# for custom enum types, we need to get the enum class either from function annotation or kwarg value
 						# j = self.sched.get_job_by_id(data['jobid'])
-						argspec = inspect.getfullargspec(_job.func)
+						argspec = inspect.getfullargspec(inspect.unwrap(_job.func))
 						_class = argspec.annotations.get(k)
 						if not _class:
 							val = _job.kwargs.get(k)
@@ -560,7 +933,7 @@ class TaskMonitor:
 		body_section = ''
 
 		if self._enhanced_rerun:
-			argspec = inspect.getfullargspec(func)
+			argspec = inspect.getfullargspec(inspect.unwrap(func)) # unwrap ProcessFunc
 			total_args = len(argspec.args)
 			total_with_defaults = len(argspec.defaults) if argspec.defaults else 0
 
@@ -1,13 +1,18 @@
+import os
 import sys
-from datetime import datetime as dt
+import uuid
+import tempfile
+from collections import deque
+from datetime import datetime as dt, timezone
 import threading
 
-from dateutil import tz
 from contextlib import contextmanager
 import traceback
 import logging
+import json
 
 from ._capture import print_capture
+from ._tz import get_tz
 
 
 # default logging configuration
@@ -19,6 +24,35 @@ LOGGER.setLevel(logging.INFO)
 # stop propagting to root logger
 LOGGER.propagate = False
 
+LOG_MEMORY_LIMIT = 1024*1024 # characters of a run log kept in memory. see _PrintLogger
+LOG_SPILL_DIR = os.path.join(tempfile.gettempdir(), 'flask_production_logs') # full logs of runs that exceed the limit
+LOG_PAGE_SIZE = 64*1024 # default page size of _PrintLogger.read_log(), in bytes
+
+
+
+class JsonLinesFormatter(logging.Formatter):
+	'''
+	formats a record as one line of JSON, for log pipelines. see TaskScheduler json_log_filepath
+	- keys: timestamp (ISO 8601, UTC), level, jobid, signature (Job.signature_hash()), run_id, stream and message
+	- timestamp is when the line was printed, not when its captured batch was logged (record attribute 'written_at'
+		set by _PrintLogger. lines of a batch share the time of its first write). other records use their creation time
+	- stream is 'stdout' for printed lines and 'traceback' for errors. context keys are null for records outside of job runs
+	- a single encoder is reused for every record. no indentation, no escaping of non-ascii characters
+	'''
+
+	_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=str)
+
+	def format(self, record):
+		return self._encoder.encode({
+			'timestamp': dt.fromtimestamp(getattr(record, 'written_at', None) or record.created, tz=timezone.utc).isoformat(timespec='microseconds'),
+			'level': record.levelname,
+			'jobid': getattr(record, 'jobid', None),
+			'signature': getattr(record, 'job_signature', None),
+			'run_id': getattr(record, 'run_id', None),
+			'stream': getattr(record, 'stream', None),
+			'message': record.getMessage(),
+		})
+
 
 
 
@@ -26,23 +60,65 @@ class _PrintLogger(object):
 	'''
 	logging class to capture any print statements within a job
 	also captures start time, end time and error traceback
+	- at most 'memory_limit' characters of the log are kept in memory: the first quarter (head) and the latest output (tail)
+	- once a run prints more than that, the whole log is spilled to a file in LOG_SPILL_DIR. see self.read_log()
+	- chunks are joined only when the log is read, so capturing is linear in the size of the output
+	- log_context (`dict`): attributes added to the LOGGER records of the run (ex: job_signature, used to route
+		lines to per-job log files. see _job_logs.JobLogHandler), along with the run_id of the run and the stream
 	'''
 
-	def __init__(self, tzname=None):
+	def __init__(self, tzname=None, tz_backend='dateutil', memory_limit=None, log_context=None):
 		self._lock = threading.Lock()
+		self._log_context = log_context or {}
+		self._limit = memory_limit or LOG_MEMORY_LIMIT
+		self._head_limit = self._limit // 4
+		self._spill_path = None
+		self._spill_file = None
+		self._capturing = False
+		self._discarded = False # replaced by another _PrintLogger. see self.discard()
+		self._kept_spill = None # spilled file handed over to the replacement
 		self._reset()
 		self._tzname = tzname
+		self._tzinfo = get_tz(tzname, tz_backend)
 
 	@property
 	def log(self):
+		'''log kept in memory. the middle of the log is replaced by a note if the run printed more than memory_limit'''
+		with self._lock:
+			head, tail = ''.join(self._head), ''.join(self._tail)
+			omitted = self._size - self._head_len - self._tail_len
+			if omitted <= 0:
+				return head + tail
+			where = f"see {self._spill_path}" if self._spill_path is not None else "not saved"
+			return f"{head}\n... {omitted} characters not shown ({where}) ...\n{tail}"
+
+	@property
+	def spill_path(self):
+		'''file with the full log of the run, or None if the log fits in memory'''
 		with self._lock:
-			return self._run_log
+			return self._spill_path
+
+	@property
+	def run_id(self):
+		'''identifies the run. see Job.read_log()'''
+		with self._lock:
+			return self._run_id
 
 	@property
 	def error(self):
 		with self._lock:
 			return self._err_log
 
+	@property
+	def timed_out(self):
+		with self._lock:
+			return self._timed_out
+
+	@property
+	def jitter(self):
+		with self._lock:
+			return self._jitter
+
 	@property
 	def started_at(self):
 		with self._lock:
@@ -56,24 +132,165 @@ class _PrintLogger(object):
 	def _reset(self):
 		'''clear previous run info'''
 		with self._lock:
-			self._run_log = ''
+			self._remove_spill()
+			self._head = [] # chunks of the start of the log
+			self._head_len = 0
+			self._tail = deque() # chunks of the latest output. older chunks are dropped past the limit
+			self._tail_len = 0
+			self._size = 0 # characters written during the run
+			self._spill_file = None
 			self._err_log = ''
+			self._run_id = None
+			self._timed_out = False
+			self._jitter = None
 			self._started_at = None
 			self._ended_at = None
 
-	def _log_callback(self, msg:str, silently:bool=False):
+	def _log_callback(self, msg:str, written_at:float=None, silently:bool=False):
 		'''
 		writting to stderr since stdout is being redirected here. Using print() will be circular
 		log to file using the logging library if LOGGER handler is set by TaskScheduler
+		written_at is the time the batch of lines was printed. see _capture._LineBatcher
 		'''
 		if msg.strip()=='':return
 		msg = msg.replace('\r\n', '\n') # replace line endings to work correctly
 		if not silently:
 			sys.stderr.write(msg)
 		if len(LOGGER.handlers)>0:
-			LOGGER.info(msg.strip())
+			extra = dict(self._log_context, run_id=self._run_id, stream='stdout', written_at=written_at)
+			for line in msg.splitlines(): # msg is a batch of lines. one record per line, as rotation can't split a record
+				if line.strip():
+					LOGGER.info(line.strip(), extra=extra)
 		with self._lock:
-			self._run_log += msg
+			self._append(msg)
+
+	def _append(self, msg):
+		'''add msg to the log. caller holds self._lock'''
+		self._size += len(msg)
+		if self._spill_path is not None:
+			self._spill_write(msg)
+		if self._head_len < self._head_limit and not self._tail:
+			room = self._head_limit - self._head_len
+			self._head.append(msg[:room])
+			self._head_len += min(room, len(msg))
+			msg = msg[room:]
+			if not msg:
+				return
+		self._tail.append(msg)
+		self._tail_len += len(msg)
+		tail_limit = self._limit - self._head_len
+		if self._tail_len <= tail_limit:
+			return
+		if self._spill_path is None:
+			self._start_spill() # before anything is dropped, so that the file has the full log
+		while len(self._tail) > 1 and self._tail_len - len(self._tail[0]) >= tail_limit:
+			self._tail_len -= len(self._tail.popleft())
+		excess = self._tail_len - tail_limit
+		if excess > 0:
+			self._tail[0] = self._tail[0][excess:]
+			self._tail_len -= excess
+
+	def _start_spill(self):
+		try:
+			os.makedirs(LOG_SPILL_DIR, exist_ok=True)
+			self._spill_path = os.path.join(LOG_SPILL_DIR, f"{uuid.uuid4().hex}.log")
+			self._spill_file = open(self._spill_path, 'w', encoding='utf-8', errors='replace')
+			self._spill_file.writelines(self._head)
+			self._spill_file.writelines(self._tail)
+		except OSError as e:
+			sys.stderr.write(f"unable to spill job log to file: {e}\n") # stdout is redirected here
+			self._spill_path = self._spill_file = None
+
+	def _spill_write(self, msg):
+		try:
+			if self._spill_file is None: # closed at the end of the run
+				self._spill_file = open(self._spill_path, 'a', encoding='utf-8', errors='replace')
+			self._spill_file.write(msg)
+		except (OSError, ValueError) as e:
+			sys.stderr.write(f"unable to write job log to file: {e}\n")
+			self._remove_spill() # incomplete
+
+	def _close_spill(self):
+		if self._spill_file is not None:
+			try:
+				self._spill_file.close()
+			except OSError:
+				pass
+			self._spill_file = None
+
+	def _remove_spill(self):
+		'''delete the full log of the previous run'''
+		self._close_spill()
+		if self._spill_path is not None:
+			try:
+				os.remove(self._spill_path)
+			except OSError:
+				pass
+			self._spill_path = None
+
+	def discard(self, keep_spill=False):
+		'''
+		called when the run info is replaced by another _PrintLogger (see Job.run). deletes the spilled log,
+		right away or when the capture of the run ends
+		- keep_spill (`bool`): the current spilled file was handed to the replacement with from_dict(). only a file
+			spilled after this call is deleted
+		'''
+		with self._lock:
+			self._discarded = True
+			self._kept_spill = self._spill_path if keep_spill else None
+			if not self._capturing:
+				self._discard_spill()
+
+	def _discard_spill(self):
+		'''caller holds self._lock'''
+		if self._spill_path is not None and self._spill_path == self._kept_spill:
+			self._close_spill() # owned by the replacement
+			self._spill_path = None
+		else:
+			self._remove_spill()
+
+	def read_log(self, offset=0, size=LOG_PAGE_SIZE):
+		'''
+		page through the full log, without loading it in memory
+		- offset and size are in bytes of utf-8 text. pages end on a line break when possible
+		- reads the spilled file if the log did not fit in memory (see self.spill_path)
+		- returns dict with 'text', 'offset', 'next_offset' (None at the end of the log) and 'size' (bytes in the log)
+		'''
+		offset, size = max(0, int(offset)), max(1, int(size))
+		with self._lock:
+			path = self._spill_path
+			if self._spill_file is not None:
+				self._spill_file.flush()
+			data = None if path is not None else (''.join(self._head) + ''.join(self._tail)).encode('utf-8', errors='replace')
+		if data is not None:
+			total = len(data)
+			page = data[offset:offset + size + 1]
+		else:
+			try:
+				with open(path, 'rb') as f:
+					total = os.fstat(f.fileno()).st_size
+					f.seek(offset)
+					page = f.read(size + 1) # one more byte tells if there is more to read
+			except OSError:
+				total, page = 0, b''
+		more = len(page) > size
+		page = page[:size]
+		if more:
+			end = page.rfind(b'\n') + 1
+			if end <= 0: # no line break. don't cut a multi-byte character
+				end = len(page)
+				while end > 0 and (page[end - 1] & 0xC0) == 0x80:
+					end -= 1
+				if end > 0 and page[end - 1] >= 0xC0:
+					end -= 1
+				end = end or len(page)
+			page = page[:end]
+		return dict(
+			text=page.decode('utf-8', errors='replace'),
+			offset=offset,
+			next_offset=offset + len(page) if more else None,
+			size=total,
+		)
 
 	@contextmanager
 	def start_capture(self, silently:bool=False):
@@ -82,22 +299,56 @@ class _PrintLogger(object):
 		'''
 		self._reset() # clear previous run info
 		with self._lock:
-			self._started_at = dt.now(tz=tz.gettz(self._tzname))
-		with print_capture(callback=lambda msg: self._log_callback(msg, silently=silently)):
-			yield
-		with self._lock:
-			self._ended_at = dt.now(tz=tz.gettz(self._tzname))
+			self._run_id = uuid.uuid4().hex # tags the LOGGER records of the run
+			self._started_at = dt.now(tz=self._tzinfo)
+			self._capturing = True
+		try:
+			with print_capture(callback=lambda msg, written_at: self._log_callback(msg, written_at, silently=silently), timestamps=True):
+				yield
+		finally:
+			with self._lock:
+				self._ended_at = dt.now(tz=self._tzinfo)
+				self._capturing = False
+				if self._discarded:
+					self._discard_spill()
+				else:
+					self._close_spill()
 
 	def set_error(self):
 		'''called when job throws error'''
 		with self._lock:
 			self._err_log = traceback.format_exc()
+		if len(LOGGER.handlers)>0:
+			LOGGER.error(self._err_log.rstrip(), extra=dict(self._log_context, run_id=self._run_id, stream='traceback'))
+
+	def set_jitter(self, seconds):
+		'''seconds between the time the run was due and the time it started'''
+		with self._lock:
+			self._jitter = round(seconds, 6)
+
+	def set_timeout(self, msg=None):
+		'''
+		called when job exceeds its timeout
+		- msg is recorded as the error if the run was abandoned without a traceback
+		'''
+		with self._lock:
+			self._timed_out = True
+			if msg is not None:
+				self._append(msg)
+				self._close_spill()
+				self._err_log = msg
+				self._ended_at = dt.now(tz=self._tzinfo)
 
 	def to_dict(self):
+		log = self.log
 		with self._lock:
 			return dict(
-				log=self._run_log,
+				log=log,
+				log_file=self._spill_path,
+				run_id=self._run_id,
 				err=self._err_log,
+				timed_out=self._timed_out,
+				jitter=self._jitter,
 				start=self._started_at,
 				end=self._ended_at,
 			)
@@ -105,7 +356,16 @@ class _PrintLogger(object):
 	def from_dict(self, info_dict):
 		if info_dict.get('start') is not None:
 			with self._lock:
-				self._run_log = info_dict['log']
+				self._remove_spill()
+				log = info_dict['log'] or ''
+				self._head, self._head_len = [log], len(log) # kept as is. may already be truncated
+				self._tail, self._tail_len = deque(), 0
+				self._size = len(log)
+				log_file = info_dict.get('log_file')
+				self._spill_path = log_file if log_file is not None and os.path.isfile(log_file) else None
 				self._err_log = info_dict['err']
+				self._run_id = info_dict.get('run_id')
+				self._timed_out = info_dict.get('timed_out', False)
+				self._jitter = info_dict.get('jitter')
 				self._started_at = info_dict['start']
 				self._ended_at = info_dict['end']
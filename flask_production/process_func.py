@@ -0,0 +1,205 @@
+import os
+import sys
+import queue
+import pickle
+import itertools
+import threading
+import traceback
+import functools
+import multiprocessing
+
+
+
+class _QueueWriter(object):
+	'''stdout replacement inside worker processes. sends complete lines back to the parent process'''
+
+	def __init__(self, result_q, task_id):
+		self._result_q = result_q
+		self._task_id = task_id
+		self._buf = ''
+
+	def write(self, s):
+		self._buf += s
+		if '\n' in self._buf:
+			idx = self._buf.rfind('\n') + 1
+			self._result_q.put((self._task_id, 'out', self._buf[:idx]))
+			self._buf = self._buf[idx:]
+		return len(s)
+
+	def flush(self):
+		if self._buf:
+			self._result_q.put((self._task_id, 'out', self._buf))
+			self._buf = ''
+
+
+def _worker_main(task_q, result_q):
+	'''entry point of ProcessPool worker processes'''
+	while True:
+		task = task_q.get()
+		if task is None:
+			break
+		task_id, func, kwargs = task
+		writer = _QueueWriter(result_q, task_id)
+		sys.stdout = writer
+		try:
+			func(**kwargs)
+			writer.flush()
+			result_q.put((task_id, 'done', None))
+		except BaseException:
+			writer.flush()
+			result_q.put((task_id, 'error', traceback.format_exc()))
+		finally:
+			sys.stdout = sys.__stdout__
+
+
+
+class _Worker(object):
+
+	def __init__(self, ctx, result_q):
+		self.task_q = ctx.Queue()
+		self.process = ctx.Process(target=_worker_main, args=(self.task_q, result_q), daemon=True)
+		self.process.start()
+
+	def stop(self, timeout=5):
+		if self.process.is_alive():
+			self.task_q.put(None)
+			self.process.join(timeout)
+		if self.process.is_alive():
+			self.process.terminate()
+			self.process.join()
+
+
+
+class ProcessPool(object):
+	'''
+	persistent pool of worker processes used to run CPU bound jobs outside of the GIL
+	- workers are started lazily using the 'spawn' start method and reused across runs
+	- max_workers (`int`): maximum number of worker processes. defaults to os.cpu_count()
+	'''
+
+	def __init__(self, max_workers: int=None):
+		self.max_workers = max_workers or os.cpu_count() or 1
+		self._ctx = multiprocessing.get_context('spawn')
+		self._lock = threading.Lock()
+		self._slots = threading.BoundedSemaphore(self.max_workers)
+		self._idle = []
+		self._busy = set()
+		self._listeners = {} # task_id -> queue.Queue
+		self._task_ids = itertools.count()
+		self._result_q = None
+		self._collector = None
+
+	def __repr__(self):
+		return "{}(workers={}/{}, busy={})".format(self.__class__.__name__, len(self._idle)+len(self._busy), self.max_workers, len(self._busy))
+
+	def _ensure_collector(self):
+		'''start the thread that routes worker messages to the waiting callers. caller should hold the lock'''
+		if self._collector is None or not self._collector.is_alive():
+			self._result_q = self._ctx.Queue()
+			self._collector = threading.Thread(target=self._collect, args=(self._result_q,), daemon=True)
+			self._collector.start()
+
+	def _collect(self, result_q):
+		while True:
+			msg = result_q.get()
+			if msg is None:
+				break
+			listener = self._listeners.get(msg[0])
+			if listener is not None:
+				listener.put(msg[1:])
+
+	def _acquire_worker(self):
+		self._slots.acquire()
+		with self._lock:
+			self._ensure_collector()
+			w = self._idle.pop() if self._idle else _Worker(self._ctx, self._result_q)
+			self._busy.add(w)
+		return w
+
+	def _release_worker(self, w):
+		with self._lock:
+			self._busy.discard(w)
+			if w.process.is_alive():
+				self._idle.append(w)
+		self._slots.release()
+
+	def run(self, func, kwargs, active_workers=None):
+		'''
+		blocking call that runs func(**kwargs) in a worker process
+		- output printed by func is printed again in the calling thread as it arrives
+		- raises an Exception with the worker traceback if func fails
+		- active_workers (`set`): the worker is added to this set while running. see ProcessFunc.cancel()
+		'''
+		w = self._acquire_worker()
+		if active_workers is not None:
+			active_workers.add(w)
+		task_id = next(self._task_ids)
+		listener = queue.Queue()
+		self._listeners[task_id] = listener
+		try:
+			w.task_q.put((task_id, func, kwargs))
+			while True:
+				try:
+					kind, payload = listener.get(timeout=0.5)
+				except queue.Empty:
+					if not w.process.is_alive():
+						raise Exception(f"worker process exited unexpectedly (exitcode {w.process.exitcode})")
+					continue
+				if kind == 'out':
+					print(payload, end='')
+				elif kind == 'done':
+					return None
+				else:
+					err = payload.strip()
+					raise Exception(f"{err.split(chr(10))[-1]}\n\nraised from worker process:\n{err}")
+		finally:
+			if active_workers is not None:
+				active_workers.discard(w)
+			self._listeners.pop(task_id, None)
+			self._release_worker(w)
+
+	def shutdown(self):
+		'''stop all worker processes. the pool can be reused afterwards'''
+		with self._lock:
+			workers = self._idle + list(self._busy)
+			self._idle = []
+			self._busy = set()
+			collector, result_q = self._collector, self._result_q
+			self._collector = None
+		for w in workers:
+			w.stop()
+		if collector is not None:
+			result_q.put(None)
+			collector.join()
+
+
+
+class ProcessFunc(object):
+	'''
+	callable used as the job function for TaskScheduler.do_in_process()
+	- runs the wrapped function in a ProcessPool worker
+	- function name, module, docstring and source are taken from the wrapped function
+	'''
+
+	def __init__(self, func, pool: ProcessPool):
+		try:
+			pickle.dumps(func)
+		except Exception:
+			raise ValueError(f"'{getattr(func, '__qualname__', func)}' cannot be sent to a worker process. Use a module level function")
+		functools.update_wrapper(self, func)
+		self.pool = pool
+		self._active_workers = {} # run token -> workers of every run in progress
+
+	def __call__(self, _run_token=None, **kwargs):
+		'''run the wrapped function in a worker. '_run_token' identifies the run of the job, see self.cancel()'''
+		workers = self._active_workers[_run_token] = set()
+		try:
+			return self.pool.run(self.__wrapped__, kwargs, active_workers=workers)
+		finally:
+			if self._active_workers.get(_run_token) is workers:
+				del self._active_workers[_run_token]
+
+	def cancel(self, run_token=None):
+		'''terminate the worker process of the run 'run_token'. used to enforce Job.timeout()'''
+		for w in list(self._active_workers.get(run_token, ())):
+			w.process.terminate()
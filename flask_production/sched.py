@@ -1,16 +1,23 @@
 from typing import Union, Callable, List
+import threading
 import time
 from datetime import datetime as dt
 from logging.handlers import RotatingFileHandler
 import warnings
+import pickle
+import heapq
 
 import holidays
 from dateutil import tz
 
 from .print_logger import (
 	LOGGER,
-	LOG_FORMATTER
+	LOG_FORMATTER,
+	LOG_MEMORY_LIMIT,
+	JsonLinesFormatter,
 )
+from ._log_queue import QueuedFileHandler, LOG_QUEUE_SIZE
+from ._job_logs import JobLogHandler, JOB_LOG_MAXSIZE
 
 from .jobs import (
 	# job types
@@ -18,14 +25,28 @@ from .jobs import (
 	OneTimeJob,
 	RepeatJob,
 	MonthlyJob,
+	CronJob,
+	WindowJob,
 	AsyncJobWrapper,
 	NeverJob,
+	DependentJob,
+	STAGGER_MODES,
+	MISFIRE_POLICIES,
+	MAX_PREVIEW_RUNS,
+	_to_timestamp,
 
 	# exceptions
 	BadScheduleError
 )
 
 from .script_func import ScriptFunc
+from .process_func import ProcessFunc, ProcessPool
+from ._due_queue import _DueJobQueue
+from .executor import JobExecutor, ExecutorSaturatedError
+from .dag import JobGraph
+from ._tz import get_tz, TZ_BACKENDS
+from .clock import Clock, VirtualClock, SYSTEM_CLOCK
+from ._histogram import Histogram
 
 from .state import (
 	BaseStateHandler,
@@ -36,6 +57,10 @@ from .state import (
 
 USHolidays = holidays.US()
 
+MAX_WAKEUP_SLEEP = 60 # event_wakeup: upper bound on a single sleep. guards against wall clock jumps
+CLOCK_STEP_TOLERANCE = 1 # seconds the wall clock can fall behind the monotonic clock before aligned jobs are re-anchored
+LOG_FLUSH_TIMEOUT = 10 # seconds stop() and join() wait for queued log lines to be written
+
 
 def get_local_timezone_name():
 	return tz.gettz(None).tzname(dt.now())
@@ -47,37 +72,120 @@ class TaskScheduler:
 	TaskScheduler: main class to setup, run and manage jobs
 
 	- check_interval (`int`): how often to check for pending jobs
+	- event_wakeup (`bool`): sleep until the next job is due instead of polling every 'check_interval' seconds
+		- the scheduler is woken up early when a job is added, enabled, rerun or rescheduled
 	- holidays_calendar (`holidays.HolidayBase`): calendar to use for intervals like 'businessday'
 	- tzname (`str`): name of timezone as supported by dateutil.tz
+	- tz_backend (`str`): 'dateutil' or 'zoneinfo' (stdlib, faster). zoneinfo falls back to dateutil for names it doesn't know
 	- on_job_error (`function(exc)`): function to call if any job fail
+	- max_workers (`int`): size of the worker pool used for parallel jobs and reruns
+	- max_queue (`int`): number of parallel runs that can wait for a free worker. 0 for unbounded
+	- saturation_policy (`str`): 'reject', 'block' or 'caller-runs'. see executor.JobExecutor
+	- serial_lanes (`bool`): run jobs registered with do() / run_script() on serial execution lanes instead of inline
+		- jobs on the same lane run one at a time in the order they became due. see .lane()
+		- the scheduler loop never waits for these jobs to complete
+		- do() / run_script() jobs with a timeout (see Job.timeout()) always run on the 'default' lane
+	- stagger_window (`int`): start jobs scheduled at a time of day (ex: .at("09:00")) up to this many seconds late,
+		to flatten load spikes at round times. 0 disables staggering. see Job.stagger() and self.stagger_report()
+	- stagger_mode (`str`): 'hash' for a fixed offset per job, derived from its signature, or 'random' for a new offset every run
+	- clock (`clock.Clock`): source of the current time for the scheduler and its jobs. defaults to the wall clock
+		- a clock.VirtualClock can be moved forward by hand to test schedules without waiting. see also self.simulate()
+	- process_workers (`int`): number of worker processes for jobs registered with do_in_process(). defaults to cpu count
 	- log_filepath (`path`): file to write logs to
+	- json_log_filepath (`path`): file to write logs to as JSON lines, one record per printed line, tagged with
+		the job id, Job.signature_hash(), run id, timestamp, level and stream. see print_logger.JsonLinesFormatter
+		- rotated with log_maxsize and log_backups, and written in the background like log_filepath
 	- log_maxsize (`int`): byte limit per log file
 	- log_backups (`int`): number of backups of logs to retain
+	- log_queue_size (`int`): log lines waiting to be written to each log file (log_filepath, json_log_filepath, job_log_dir). a background thread writes them in batches,
+		so that printing jobs never wait on the disk. past the limit, lines are dropped and counted (see self.stats())
+	- job_log_dir (`path`): directory to write the log of every job to a file of its own, <job_log_dir>/<Job.signature_hash()>/
+		- segments are rotated on size and/or time, then gzip-compressed in the background. see self.job_log_segments()
+	- job_log_maxsize (`int`): bytes per job log segment before it is rotated. 0 rotates on time only
+	- job_log_interval (`int`): seconds per job log segment, counted from the epoch (ex: 86400 rotates at midnight UTC). None rotates on size only
+	- job_log_backups (`int`): number of compressed segments to retain per job. None keeps all
+	- log_memory_limit (`int`): characters of each run log kept in memory (the start and the latest output)
+		- longer logs are spilled to a file and can be paged through with Job.read_log(). see print_logger._PrintLogger
 	- startup_grace_mins (`int`): grace period for tasks in case a schedule was missed because of app restart
+	- misfire_spread (`int`): seconds over which the catch-up runs of jobs with a misfire policy are spread at startup,
+		oldest miss first, so that they don't all start at once. see self.misfire()
 	- persist_states (`bool`): store job logs and read back on app restart
 	- state_handler (`.state.BaseStateHandler`): different handler backends to store job logs
 	"""
 
 	def __init__(self,
 		check_interval: int=5,
+		event_wakeup: bool=False,
 		holidays_calendar: Union[holidays.HolidayBase, None]=None,
 		tzname: Union[str, None]=None,
+		tz_backend: str='dateutil',
 		on_job_error: Union[Callable, None]=None,
+		max_workers: int=32,
+		max_queue: int=0,
+		saturation_policy: str='reject',
+		process_workers: Union[int, None]=None,
+		serial_lanes: bool=False,
+		stagger_window: int=0,
+		stagger_mode: str='hash',
+		clock: Union[Clock, None]=None,
 		log_filepath: Union[str, None]=None,
+		json_log_filepath: Union[str, None]=None,
 		log_maxsize: int=5*1024*1024,
 		log_backups: int=1,
+		log_queue_size: int=LOG_QUEUE_SIZE,
+		job_log_dir: Union[str, None]=None,
+		job_log_maxsize: int=JOB_LOG_MAXSIZE,
+		job_log_interval: Union[int, None]=None,
+		job_log_backups: Union[int, None]=None,
+		log_memory_limit: int=LOG_MEMORY_LIMIT,
 		startup_grace_mins: int=0,
+		misfire_spread: int=60,
 		persist_states: bool=True,
 		state_handler: Union[BaseStateHandler, None]=None) -> None:
 
 		self.jobs:list[Job] = []
+		self._due_queue = _DueJobQueue() # jobs indexed on next_timestamp. see self.check()
+		self._indexed_jobs = set() # id() of jobs that are registered with self._due_queue
+		self._parked_jobs = {} # due jobs that could not start yet. pushed back to the due-job index when any job completes
+		self._parked_lock = threading.Lock()
+		self._timed_out_jobs = {} # jobs with runs abandoned after a timeout, cleaned up by self.check(). see Job.timeout()
 		self._check_interval = check_interval
+		self._event_wakeup = event_wakeup
+		self._wakeup_cond = threading.Condition()
+		self._wakeup_pending = False
 		self._last_checked = None
+		self._clock_offset = None # wall clock minus monotonic clock at the last check. see self._check_clock_step()
+		self._tick_histogram = Histogram() # time spent in self.check(), excluding inline job runs. see self.stats()
+		self._busy_seconds = 0.0
+		self._first_check = None # time.perf_counter() at the first check
 		self._startup_grace_mins = startup_grace_mins
+		if not isinstance(misfire_spread, (int, float)) or misfire_spread < 0:
+			raise ValueError("misfire_spread should be a non-negative number of seconds")
+		self._misfire_spread = misfire_spread
 		self.on_job_error = on_job_error
 
+		# worker pool for parallel jobs and reruns
+		self.executor = JobExecutor(max_workers=max_workers, max_queue=max_queue, saturation_policy=saturation_policy)
+		self.executor.register_callback(self._unpark_jobs) # a worker is free. retry jobs that were rejected
+		self._process_pool = ProcessPool(max_workers=process_workers) # worker processes are started on first use
+		self._serial_lanes = serial_lanes
+		self.lanes = {} # name -> single worker JobExecutor. see self._get_lane()
+		self.groups = {} # concurrency group name -> limit. see self.group()
+		if not isinstance(stagger_window, (int, float)) or stagger_window < 0:
+			raise ValueError("stagger_window should be a non-negative number of seconds")
+		if stagger_mode not in STAGGER_MODES:
+			raise ValueError(f"stagger_mode should be one of {STAGGER_MODES}")
+		self._stagger_window = stagger_window
+		self._stagger_mode = stagger_mode
+		self.clock = clock or SYSTEM_CLOCK
+		self._group_members = {} # concurrency group name -> jobs
+		self.dag = JobGraph(clock=self.clock) # dependencies between jobs. see self.after()
+
+		if tz_backend not in TZ_BACKENDS:
+			raise ValueError(f"tz_backend should be one of {TZ_BACKENDS}")
+		self._tz_backend = tz_backend
 		tzname = tzname or get_local_timezone_name() # if None, default to local timezone
-		if tz.gettz(tzname) is None:
+		if get_tz(tzname, self._tz_backend) is None:
 			raise ValueError(f"unknown timezone '{tzname}'")
 		self._tz_default = tzname
 		print("* Default Timezone:", self._tz_default, "*")
@@ -88,7 +196,13 @@ class TaskScheduler:
 			self.holidays_calendar = USHolidays
 
 		# setup logging
+		if not isinstance(log_memory_limit, int) or log_memory_limit <= 0:
+			raise ValueError("log_memory_limit should be a positive number of characters")
+		self._log_memory_limit = log_memory_limit
 		self.log_filepath = log_filepath
+		self._log_handler = None
+		if not isinstance(log_queue_size, int) or log_queue_size <= 0:
+			raise ValueError("log_queue_size should be a positive number of lines")
 		if self.log_filepath is not None:
 			fh = RotatingFileHandler(
 				filename=self.log_filepath,
@@ -96,7 +210,37 @@ class TaskScheduler:
 				backupCount=log_backups
 			)
 			fh.setFormatter(LOG_FORMATTER)
-			LOGGER.addHandler(fh)
+			self._log_handler = QueuedFileHandler(fh, queue_size=log_queue_size)
+			LOGGER.addHandler(self._log_handler)
+		self._json_log_handler = None
+		if json_log_filepath is not None:
+			fh = RotatingFileHandler(
+				filename=json_log_filepath,
+				maxBytes=log_maxsize,
+				backupCount=log_backups,
+				encoding='utf-8',
+			)
+			fh.setFormatter(JsonLinesFormatter())
+			self._json_log_handler = QueuedFileHandler(fh, queue_size=log_queue_size)
+			LOGGER.addHandler(self._json_log_handler)
+		self._job_log_handler = None
+		if job_log_dir is not None:
+			if not isinstance(job_log_maxsize, int) or job_log_maxsize < 0:
+				raise ValueError("job_log_maxsize should be a number of bytes")
+			if job_log_interval is not None and (not isinstance(job_log_interval, int) or job_log_interval <= 0):
+				raise ValueError("job_log_interval should be a positive number of seconds")
+			if job_log_maxsize == 0 and job_log_interval is None:
+				raise ValueError("job logs need job_log_maxsize or job_log_interval to rotate")
+			if job_log_backups is not None and (not isinstance(job_log_backups, int) or job_log_backups < 0):
+				raise ValueError("job_log_backups should be a number of segments")
+			self._job_log_handler = JobLogHandler(
+				job_log_dir,
+				maxsize=job_log_maxsize,
+				interval=job_log_interval,
+				backups=job_log_backups,
+				queue_size=log_queue_size,
+			)
+			LOGGER.addHandler(self._job_log_handler)
 
 		# setup state persistance over app restarts
 		self._state_handler = None
@@ -115,6 +259,12 @@ class TaskScheduler:
 		self.temp_time = None
 		self.tzname = self._tz_default # timezone default
 		self._strict_monthly = None
+		self._lane = None
+		self._priority = 0
+		self._group = None
+		self._upstreams = None
+		self._align = None
+		self._misfire = None
 		self.job_calendar = None
 
 
@@ -151,6 +301,67 @@ class TaskScheduler:
 		self._strict_monthly = strict
 		return self
 
+	def after(self, *upstream_jobs):
+		'''
+		run the job every time all of the upstream jobs complete successfully
+		- used instead of .every(). a failed upstream job holds back the job until it succeeds (or is rerun successfully)
+		- dependent jobs run on the worker pool, so that independent branches run in parallel
+		- example: c = sched.after(a, b).do(func)
+		'''
+		if self.interval is not None:
+			raise BadScheduleError("dependent jobs are triggered by their upstream jobs. .every() can't be used with .after()")
+		if len(upstream_jobs) == 0:
+			raise BadScheduleError(".after() requires at least one upstream job")
+		upstream_ids = []
+		for u in upstream_jobs:
+			if self.get_job_by_id(getattr(u, 'jobid', None)) is None:
+				raise BadScheduleError(f"upstream job {u} is not registered with this scheduler")
+			upstream_ids.append(u.jobid)
+		self.interval = 'dependent'
+		self._upstreams = upstream_ids
+		return self
+
+	def lane(self, name:str):
+		'''
+		run the job on the named serial execution lane
+		- jobs on the same lane never overlap and run in the order they became due
+		- different lanes run independently of each other
+		- only applies to .do() and .run_script()
+		'''
+		if not isinstance(name, str) or not name:
+			raise BadScheduleError("lane name should be a non-empty string")
+		self._lane = name
+		return self
+
+	def priority(self, priority:int):
+		'''
+		jobs that are due at the same time are started in order of priority, highest first
+		- defaults to 0. negative values are allowed
+		'''
+		if not isinstance(priority, int) or isinstance(priority, bool):
+			raise BadScheduleError("priority should be an integer")
+		self._priority = priority
+		return self
+
+	def group(self, name:str, limit:Union[int, None]=None):
+		'''
+		add the job to a named concurrency group
+		- at most 'limit' jobs of the group run (or wait for a worker) at the same time
+		- due jobs of a saturated group are held back until a job of the group completes
+		- limit is required the first time a group is used. passing it again updates the limit for the whole group
+		- example: .group("db", limit=3)
+		'''
+		if not isinstance(name, str) or not name:
+			raise BadScheduleError("group name should be a non-empty string")
+		if limit is None and name not in self.groups:
+			raise BadScheduleError(f"limit required for new group '{name}'. ex: .group('{name}', limit=3)")
+		if limit is not None:
+			if not isinstance(limit, int) or isinstance(limit, bool) or limit <= 0:
+				raise BadScheduleError("group limit should be a positive integer")
+			self.groups[name] = limit
+		self._group = name
+		return self
+
 	def at(self, time_string):
 		'''
 		24 hour time string of when to run job
@@ -161,13 +372,70 @@ class TaskScheduler:
 		self.temp_time = time_string
 		return self
 
+	def align(self, offset:int=0, catchup='once'):
+		'''
+		run a repeating job on wall clock boundaries (ex: every(60) at :00 of every minute), plus 'offset' seconds
+		- catchup: 'once', 'skip' or a number of runs. what to do with boundaries that passed without a run
+		- the scheduler loop wakes up on the boundary, even between polls, and re-anchors the job if the wall clock is set back
+		- see jobs.RepeatJob.align()
+		- example: .every(60).align().do(func)
+		'''
+		if not RepeatJob.is_valid_interval(self.interval, time_string=None) or self.interval <= 0:
+			raise BadScheduleError(".align() is only used with a repeating schedule. ex: .every(60).align()..")
+		if not isinstance(offset, (int, float)) or not 0 <= offset < self.interval:
+			raise BadScheduleError("align offset should be a number of seconds between 0 and the interval")
+		if catchup not in ('once', 'skip') and not (isinstance(catchup, int) and not isinstance(catchup, bool) and catchup >= 1):
+			raise BadScheduleError("catchup should be 'once', 'skip' or a positive number of runs")
+		self._align = (offset, catchup)
+		return self
+
+	def misfire(self, policy:str='once', max_lateness:Union[int, None]=None):
+		'''
+		what to do at startup with the runs that were missed while the app was down
+		- policy: 'once' (run once for all of them), 'all' (run each of them) or 'skip'
+		- max_lateness (`int`): drop missed runs that are more than this many seconds late
+		- missed runs are found from the last scheduled run saved by the state handler. see jobs.Job.misfire()
+		- example: .every('day').at('09:00').misfire('once', max_lateness=3600).do(func)
+		'''
+		if policy not in MISFIRE_POLICIES:
+			raise BadScheduleError(f"misfire policy should be one of {MISFIRE_POLICIES}")
+		if max_lateness is not None and (not isinstance(max_lateness, (int, float)) or max_lateness <= 0):
+			raise BadScheduleError("max_lateness should be a positive number of seconds")
+		self._misfire = (policy, max_lateness)
+		return self
+
+	def cron(self, expr:str):
+		'''
+		run the job at the times of a cron expression (see jobs.CronJob)
+		- 5 fields (minute hour day-of-month month day-of-week), or 6 fields with seconds first
+		- combine with .every() to also filter days by the holiday calendar. defaults to every 'day'
+		- example: .every('businessday').cron('*/15 9-15 * * *')
+		'''
+		if not isinstance(expr, str) or len(expr.split()) not in (5, 6):
+			raise BadScheduleError("cron expression should be a string with 5 or 6 fields. ex: '*/15 9-15 * * mon-fri'")
+		return self.at(expr)
+
+	def between(self, start:str, end:str, interval:int):
+		'''
+		run the job every 'interval' seconds from 'start' until 'end' (24 hour time strings), on the days of .every()
+		- the window includes start and excludes end. an end before start runs past midnight
+		- defaults to every 'day'
+		- example: .every('businessday').between('09:30', '16:00', 300)
+		'''
+		if not isinstance(interval, int) or isinstance(interval, bool) or interval <= 0:
+			raise BadScheduleError("window interval should be a positive number of seconds")
+		time_string = f"{start}-{end}/{interval}"
+		if not WindowJob.is_valid_interval('day', time_string):
+			raise BadScheduleError(f"Invalid time window '{start}' - '{end}'. ex: .between('09:30', '16:00', 300)")
+		return self.at(time_string)
+
 	def timezone(self, tzname):
 		'''
 		timezone string as defined in pytz module
 		- example US/Eastern
 		- defaults to system timezone
 		'''
-		test = tz.gettz(tzname)
+		test = get_tz(tzname, self._tz_backend)
 		if test is None:
 			raise BadScheduleError(f"unknown timezone '{tzname}'")
 		self.tzname = tzname
@@ -187,7 +455,7 @@ class TaskScheduler:
 		if self.interval is None:
 			raise Exception('Use .at()/.every().at() before .do()')
 		if self.temp_time is None:
-			self.temp_time = dt.now(tz.gettz(self.tzname)).strftime("%H:%M")
+			self.temp_time = self.clock.now(get_tz(self.tzname, self._tz_backend)).strftime("%H:%M")
 
 		new_jobid = len(self.jobs)
 		j = None
@@ -200,6 +468,12 @@ class TaskScheduler:
 			if RepeatJob.is_valid_interval(self.interval, time_string=None):
 				j = RepeatJob(new_jobid, every=self.interval, at=None, func=func, kwargs=kwargs)
 
+			elif WindowJob.is_valid_interval(self.interval, time_string=self.temp_time):
+				j = WindowJob(new_jobid, every=self.interval, at=self.temp_time, func=func, kwargs=kwargs)
+
+			elif CronJob.is_valid_interval(self.interval, time_string=self.temp_time):
+				j = CronJob(new_jobid, every=self.interval, at=self.temp_time, func=func, kwargs=kwargs)
+
 			elif OneTimeJob.is_valid_interval(self.interval, time_string=self.temp_time):
 				j = OneTimeJob(new_jobid, every=self.interval, at=self.temp_time, func=func, kwargs=kwargs)
 
@@ -212,6 +486,9 @@ class TaskScheduler:
 			elif NeverJob.is_valid_interval(self.interval, time_string=None):
 				j = NeverJob(new_jobid, every=self.interval, at=None, func=func, kwargs=kwargs)
 
+			elif DependentJob.is_valid_interval(self.interval, time_string=None) and self._upstreams:
+				j = DependentJob(new_jobid, every=self.interval, at=None, func=func, kwargs=kwargs, upstreams=self._upstreams)
+
 		if j is None:
 			raise BadScheduleError("{} is not valid\n".format(self.interval))
 
@@ -219,8 +496,21 @@ class TaskScheduler:
 			calendar=self.holidays_calendar if self.job_calendar is None else self.job_calendar,
 			tzname=self.tzname,
 			generic_err_handler=self.on_job_error,
-			startup_grace_mins=self._startup_grace_mins
+			startup_grace_mins=self._startup_grace_mins,
+			tz_backend=self._tz_backend,
+			clock=self.clock,
+			log_memory_limit=self._log_memory_limit,
 		)
+		j.priority = self._priority
+		j.group = self._group
+		if self._stagger_window > 0 and j.time_string is not None: # repeating and on-demand jobs are not staggered
+			j.stagger(self._stagger_window, mode=self._stagger_mode)
+		if self._align is not None and isinstance(j, RepeatJob):
+			j.align(*self._align)
+		if self._misfire is not None:
+			j.misfire(*self._misfire)
+		if isinstance(j, DependentJob):
+			self._add_dependencies(j)
 		# register callbacks to save job logs to file so it can be restored on app restart
 		if isinstance(self._state_handler, BaseStateHandler):
 			j.register_callback(self._state_handler.save_job_logs, cb_type="onenable")
@@ -232,7 +522,68 @@ class TaskScheduler:
 		return j
 
 
+	def _add_dependencies(self, j):
+		'''add a DependentJob to self.dag. completed runs of every job in the graph are reported to it'''
+		for jobid in j.upstreams:
+			if jobid not in self.dag:
+				self.get_job_by_id(jobid).register_callback(self._on_dag_job_complete, cb_type="oncomplete")
+		j.register_callback(self._on_dag_job_complete, cb_type="oncomplete")
+		self.dag.add(j.jobid, j.upstreams)
+
+
+	def _on_dag_job_complete(self, job):
+		for jobid in self.dag.on_complete(job):
+			self.get_job_by_id(jobid).trigger() # the dependent is picked up by self.check() on the scheduler loop
+
+
+	def _register_job(self, j):
+		'''add job to self.jobs and keep it indexed in the due-job queue whenever it is rescheduled'''
+		self._index_job(j)
+		self.jobs.append(j)
+		return j
+
+
+	def _index_job(self, j):
+		def _on_schedule(_job):
+			self._due_queue.push(j) # push j (and not _job) so that AsyncJobWrapper is preserved
+			self._wakeup()
+		def _on_complete(_job):
+			self._unpark_jobs()
+		def _on_timeout(_job):
+			with self._parked_lock:
+				self._timed_out_jobs[id(j)] = j
+			self._wakeup()
+		j.register_callback(_on_schedule, cb_type="onschedule")
+		j.register_callback(_on_complete, cb_type="oncomplete")
+		j.register_callback(_on_timeout, cb_type="ontimeout")
+		self._indexed_jobs.add(id(j))
+		if j.group is not None:
+			self._group_members.setdefault(j.group, []).append(j)
+		self._due_queue.push(j)
+		self._wakeup()
+
+
+	def _get_lane(self, name):
+		if name not in self.lanes:
+			self.lanes[name] = JobExecutor(max_workers=1, name=f"fp-lane-{name}")
+			self.lanes[name].register_callback(self._unpark_jobs)
+		return self.lanes[name]
+
+	def _wrap_serial(self, j, lane):
+		'''
+		put job on a serial lane if one was selected or serial_lanes is set
+		- dependent jobs without a lane run on the worker pool. see self.after()
+		'''
+		if lane is None and isinstance(j, DependentJob):
+			return AsyncJobWrapper(j, executor=self.executor)
+		if lane is None and self._serial_lanes:
+			lane = 'default'
+		if lane is not None:
+			j = AsyncJobWrapper(j, executor=self._get_lane(lane))
+		return j
+
 	def do(self, func, do_parallel=False, **kwargs):
+		lane = self._lane
 		j = self._create_job(func, **kwargs)
 		if do_parallel:
 			print("================================================")
@@ -240,41 +591,348 @@ class TaskScheduler:
 			print("==== use do_parallel() method  instead")
 			print("================================================")
 			warnings.warn("do_parallel boolean argument will be removed", category=DeprecationWarning)
-			j = AsyncJobWrapper(j)
-		self.jobs.append(j)
-		return j
+			j = AsyncJobWrapper(j, executor=self.executor)
+		else:
+			j = self._wrap_serial(j, lane)
+		return self._register_job(j)
 
 	def do_parallel(self, func, **kwargs):
 		'''helper function to run job in a separate thread'''
 		j = self._create_job(func, **kwargs)
-		j = AsyncJobWrapper(j)
-		self.jobs.append(j)
-		return j
+		j = AsyncJobWrapper(j, executor=self.executor)
+		return self._register_job(j)
+
+	def do_in_process(self, func, **kwargs):
+		'''
+		run job in a persistent worker process. useful for CPU bound jobs
+		- func and kwargs must be picklable (ex: module level function)
+		- printed output and errors are reported the same way as any other job
+		'''
+		try:
+			pickle.dumps(kwargs)
+		except Exception as e:
+			raise ValueError(f"job arguments cannot be sent to a worker process - {str(e)}")
+		j = self._create_job(ProcessFunc(func, self._process_pool), **kwargs)
+		j = AsyncJobWrapper(j, executor=self.executor)
+		return self._register_job(j)
 
 	def run_script(self, script_dir_path:str, script_name:str, script_args:List[str]=[]):
+		lane = self._lane
 		func = ScriptFunc(script_dir_path, script_name, script_args)
 		j = self._create_job(func)
-		self.jobs.append(j)
-		return j
+		j = self._wrap_serial(j, lane)
+		return self._register_job(j)
 
 	def run_script_parallel(self, script_dir_path:str, script_name:str, script_args:List[str]=[]):
 		func = ScriptFunc(script_dir_path, script_name, script_args)
 		j = self._create_job(func)
-		j = AsyncJobWrapper(j)
-		self.jobs.append(j)
-		return j
+		j = AsyncJobWrapper(j, executor=self.executor)
+		return self._register_job(j)
 
 	# -=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
 	# -=-=-=-=-=-=-=-= Scheduler control methods =-=-=-=-=-=-=-=-=-=-=
 	# -=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
 
 	def check(self):
-		'''check if a job is due'''
-		for j in self.jobs.copy(): # uses a shallow copy of this list - safer in case the list changes. TODO: maybe use locks instead?
-			if j.is_due() and not j.is_running:
-				j.run()
-
-		self._last_checked = time.time()
+		'''
+		check if a job is due
+		- only jobs whose next_timestamp has passed are popped from the due-job index,
+			so the cost of a tick does not depend on the total number of registered jobs
+		- the time spent here, less the time of jobs that run inline, is recorded. see self.stats()
+		'''
+		started = time.perf_counter()
+		if self._first_check is None:
+			self._first_check = started
+		inline = 0.0 # time spent running jobs that don't run in a worker
+		if len(self._indexed_jobs) != len(self.jobs): # jobs appended to self.jobs directly
+			for j in self.jobs.copy():
+				if id(j) not in self._indexed_jobs:
+					self._index_job(j)
+
+		self._check_clock_step()
+		self._finish_timed_out_runs()
+		due = self._due_queue.pop_due(self.clock.time())
+		due.sort(key=lambda j: -j.priority) # stable. jobs with equal priority keep their due order
+		group_active = {} # group name -> number of runs in progress or waiting for a worker
+		for j in due:
+			if j.group is not None and j.group not in group_active:
+				group_active[j.group] = self._group_active_count(j.group)
+
+		for j in due:
+			if j.is_queued:
+				self._park_job(j) # previous run has not started yet. check again once it completes
+			elif j.is_running and j.running_instances >= j.max_instances:
+				if j.max_instances == 1:
+					self._park_job(j) # overlap policy is applied once the run completes. see Job.overlap()
+				else:
+					j.skip_tick()
+			elif j.is_stale():
+				j.skip_tick()
+			elif j.is_due():
+				if j.group is not None:
+					if group_active[j.group] >= self.groups[j.group]:
+						self._park_job(j) # group is saturated. check again once any job completes
+						continue
+					group_active[j.group] += 1
+				run_started = time.perf_counter()
+				inline_run = not isinstance(j, AsyncJobWrapper)
+				try:
+					if inline_run and j._timeout is not None: # the loop must not wait for a run it is supposed to give up on
+						AsyncJobWrapper(j, executor=self._get_lane('default')).run()
+						inline_run = False
+					else:
+						j.run()
+				except ExecutorSaturatedError as e:
+					print(str(e), "- delaying", j)
+					self._park_job(j)
+				if inline_run:
+					inline += time.perf_counter() - run_started
+			else:
+				self._due_queue.push(j) # is_due() deferred the run (ex: external job classes). check again on the next tick
+
+		self._last_checked = self.clock.time()
+		overhead = time.perf_counter() - started - inline
+		self._busy_seconds += overhead
+		self._tick_histogram.record(overhead)
+
+
+	def _finish_timed_out_runs(self):
+		'''clean up runs that were abandoned after a timeout on a timer thread. see Job._on_timeout()'''
+		with self._parked_lock:
+			timed_out = list(self._timed_out_jobs.values())
+			self._timed_out_jobs.clear()
+		for j in timed_out:
+			j._finish_timed_out_runs()
+
+
+	@property
+	def _aligned_jobs(self):
+		'''jobs that run on wall clock boundaries, whether aligned with self.align() or with Job.align() after .do()'''
+		return [j for j in self.jobs if getattr(j, 'is_aligned', False)]
+
+
+	def _check_clock_step(self):
+		'''re-anchor aligned jobs if the wall clock was set back since the last check'''
+		offset = self.clock.time() - self.clock.monotonic()
+		last, self._clock_offset = self._clock_offset, offset
+		if last is None or offset >= last - CLOCK_STEP_TOLERANCE:
+			return # a step forward is handled as missed ticks. see RepeatJob.align()
+		print("* Wall clock was set back {:.1f} seconds. Re-anchoring aligned jobs *".format(last - offset))
+		for j in self._aligned_jobs:
+			if not j.is_disabled and not j.is_running and not j.is_queued:
+				j.schedule_next_run()
+
+
+	def _group_active_count(self, name):
+		return sum(j.running_instances + int(j.is_queued) for j in self._group_members.get(name, []))
+
+
+	def group_stats(self):
+		'''limit and number of active runs of every concurrency group'''
+		return {name: {'limit': limit, 'active': self._group_active_count(name)} for name, limit in self.groups.items()}
+
+
+	def runs_between(self, start, end):
+		'''
+		preview the runs of all jobs between start and end (inclusive)
+		- start, end (`datetime` or timestamp): naive datetimes are in the scheduler's default timezone
+		- only upcoming runs are included. runs before a job's next run are not
+		- returns a list of (datetime, job) tuples sorted by time. datetimes are in the job's timezone
+		- at most MAX_PREVIEW_RUNS runs are included per job
+		'''
+		zone = get_tz(self._tz_default, self._tz_backend)
+		start_ts, end_ts = _to_timestamp(start, zone), _to_timestamp(end, zone)
+		runs = []
+		for j in self.jobs:
+			if j.is_disabled or j.next_timestamp <= 0:
+				continue
+			count = 0
+			for ts in j._iter_runs(max(start_ts, j.next_timestamp)):
+				if ts > end_ts or count >= MAX_PREVIEW_RUNS:
+					break
+				runs.append((ts, j.jobid, j))
+				count += 1
+		runs.sort(key=lambda r: r[:2])
+		return [(j.to_datetime(ts), j) for ts, _, j in runs]
+
+
+	def simulate(self, start, end, jobs=None):
+		'''
+		replay the schedule from start to end on a virtual clock, without running any job
+		- start, end (`datetime` or timestamp): naive datetimes are in the scheduler's default timezone
+		- jobs (`list`): jobs to simulate. defaults to all jobs. disabled and on-demand jobs never fire
+		- jobs are rescheduled with their own schedule_next_run(), as they would be after each run,
+			so holidays, daylight savings and month ends are handled exactly as in production
+		- runs are assumed to succeed instantly. dependent jobs (see self.after()) fire with their last upstream job
+		- works on copies of the jobs. jobs that share a schedule are simulated once. the registered jobs are not changed
+		- returns a list of (datetime, job) tuples for the runs with a nominal time between start and end, sorted by time.
+			datetimes are the actual start times, including any stagger offset, in the job's timezone
+		'''
+		zone = get_tz(self._tz_default, self._tz_backend)
+		start_ts, end_ts = _to_timestamp(start, zone), _to_timestamp(end, zone)
+		clock = VirtualClock(start_ts)
+		originals = {} # jobid -> registered job
+		members = {} # schedule key -> ids of the jobs that share the schedule
+		dependents = {} # jobid -> ids of dependent jobs
+		waiting_on = {} # dependent jobid -> upstream jobids that have not fired since its last run
+		heap = []
+		for j in (self.jobs if jobs is None else jobs):
+			job = j.job if isinstance(j, AsyncJobWrapper) else j
+			if job.is_disabled:
+				continue
+			originals[job.jobid] = j
+			if isinstance(job, DependentJob):
+				waiting_on[job.jobid] = set(job.upstreams)
+				for u in job.upstreams:
+					dependents.setdefault(u, []).append(job.jobid)
+				continue
+			key = job._schedule_key()
+			if key in members:
+				members[key].append(job.jobid)
+				continue
+			members[key] = [job.jobid]
+			c = job._sim_copy(clock)
+			c._stagger_window = 0 # offsets are applied per job when it fires
+			c.schedule_next_run()
+			if c.next_timestamp > 0:
+				heapq.heappush(heap, (c.next_timestamp, len(heap), c, key))
+
+		fired = []
+		def _fire(ts, jobid):
+			fired.append((ts, jobid))
+			for d in dependents.get(jobid, []):
+				if d in waiting_on:
+					waiting_on[d].discard(jobid)
+					if not waiting_on[d]:
+						waiting_on[d] = set(originals[d].upstreams)
+						_fire(ts, d)
+
+		seq = len(heap)
+		while heap and heap[0][0] <= end_ts:
+			ts, _, c, key = heapq.heappop(heap)
+			if ts >= start_ts:
+				for jobid in members[key]:
+					_fire(ts + originals[jobid]._compute_start_offset(), jobid)
+			clock.set(max(ts, clock.time()))
+			last = c.next_timestamp
+			c.schedule_next_run(just_ran=True)
+			if c.next_timestamp > 0 and c.next_timestamp != last:
+				seq += 1
+				heapq.heappush(heap, (c.next_timestamp, seq, c, key))
+		fired.sort()
+		datetimes = {} # (timestamp, id(tzinfo)) -> datetime. jobs that share a schedule also share their run times
+		runs = []
+		for ts, jobid in fired:
+			j = originals[jobid]
+			key = (ts, id(j.tzinfo))
+			if key not in datetimes:
+				datetimes[key] = j.to_datetime(ts)
+			runs.append((datetimes[key], j))
+		return runs
+
+
+	def stagger_report(self):
+		'''
+		number of jobs starting in each minute, before and after staggering
+		- 'before' uses the nominal schedule (next_timestamp) and 'after' the actual start times (due_timestamp)
+		- only the next run of every enabled job is counted
+		'''
+		zone = get_tz(self._tz_default, self._tz_backend)
+		bucket = lambda ts: dt.fromtimestamp(ts, tz=zone).strftime("%Y-%m-%d %H:%M")
+		before, after = {}, {}
+		for j in self.jobs:
+			if j.is_disabled or j.next_timestamp <= 0:
+				continue
+			b, a = bucket(j.next_timestamp), bucket(j.due_timestamp)
+			before[b] = before.get(b, 0) + 1
+			after[a] = after.get(a, 0) + 1
+		return {
+			'stagger_window': self._stagger_window,
+			'stagger_mode': self._stagger_mode,
+			'before': dict(sorted(before.items())),
+			'after': dict(sorted(after.items())),
+			'peak_before': max(before.values(), default=0),
+			'peak_after': max(after.values(), default=0),
+		}
+
+
+	def stats(self):
+		'''
+		histograms of job start lateness and scheduler loop overhead, in seconds
+		- lateness: how long after their due time scheduled runs started. catch-up runs count from their missed time
+		- tick: time spent in check() for every tick, excluding jobs that run inline
+		- schedule: time spent rescheduling jobs after runs and skipped ticks
+		- callbacks: time spent in on-complete callbacks (state handlers, dependent jobs..)
+		- utilization: fraction of the time since the first check spent in check(). near 1 means the loop is saturated
+		- jobs: lateness of every job that ran
+		- log_queue: log lines waiting to be written to log files, and lines dropped because the queue was full
+		'''
+		merged = {name: Histogram() for name in ('lateness', 'schedule', 'callbacks')}
+		jobs = {}
+		for j in self.jobs:
+			for name, h in merged.items():
+				h.merge(j._histograms[name])
+			if j._histograms['lateness'].count > 0:
+				jobs[j.jobid] = j._histograms['lateness'].to_dict()
+		elapsed = time.perf_counter() - self._first_check if self._first_check is not None else 0
+		return {
+			'lateness': merged['lateness'].to_dict(),
+			'tick': self._tick_histogram.to_dict(),
+			'schedule': merged['schedule'].to_dict(),
+			'callbacks': merged['callbacks'].to_dict(),
+			'utilization': round(self._busy_seconds / elapsed, 4) if elapsed > 0 else None,
+			'check_interval': self._check_interval,
+			'jobs': jobs,
+			'log_queue': {
+				'pending': sum(h.pending for h in self._log_queues),
+				'dropped': sum(h.dropped for h in self._log_queues),
+			} if self._log_queues else None,
+		}
+
+
+	def _park_job(self, j):
+		'''hold a due job that cannot start right now. it is reconsidered when any job completes'''
+		with self._parked_lock:
+			self._parked_jobs[id(j)] = j
+		if not j.is_running and not j.is_queued: # completed while we were parking it
+			self._unpark_jobs()
+
+
+	def _unpark_jobs(self):
+		with self._parked_lock:
+			parked = list(self._parked_jobs.values())
+			self._parked_jobs.clear()
+		for j in parked:
+			self._due_queue.push(j)
+		if parked:
+			self._wakeup()
+
+
+	def _wakeup(self):
+		'''wake up the scheduler loop (only has an effect when event_wakeup is set)'''
+		with self._wakeup_cond:
+			self._wakeup_pending = True
+			self._wakeup_cond.notify_all()
+
+
+	def _wait_for_next_check(self):
+		'''sleep for check_interval, or if event_wakeup is set, until the next job is due'''
+		if not self._event_wakeup:
+			timeout = self._check_interval
+			for j in self._aligned_jobs: # wake up on the boundary of aligned jobs
+				if j.next_timestamp > 0 and not j.is_disabled:
+					timeout = min(timeout, max(0, j.due_timestamp - self.clock.time()))
+			self.clock.sleep(timeout)
+			return
+		timeout = MAX_WAKEUP_SLEEP
+		next_ts = self._due_queue.peek_timestamp()
+		if next_ts is not None:
+			wait = next_ts - self.clock.time()
+			timeout = min(timeout, wait if wait > 0 else self._check_interval) # past due: deferred by is_due(), poll it
+		with self._wakeup_cond:
+			if not self._wakeup_pending:
+				self._wakeup_cond.wait(timeout)
+			self._wakeup_pending = False
 
 
 	def has_checked(self):
@@ -290,17 +948,44 @@ class TaskScheduler:
 			# import traceback
 			# traceback.print_exc()
 			print("unable to restore states:", str(e))
+		self._catch_up_misfires()
+
+
+	def _catch_up_misfires(self):
+		'''
+		apply the misfire policy of every job to the runs it missed while the app was down (see self.misfire())
+		- all jobs are evaluated in one pass. catch-up runs are released over 'misfire_spread' seconds, oldest miss first
+		- dropped runs are saved right away, so that they are not counted again on the next restart
+		'''
+		now = self.clock.time()
+		catchups = []
+		for j in self.jobs.copy():
+			last_scheduled = j._last_scheduled
+			runs = j._collect_misfires(now)
+			if len(runs) > 0:
+				catchups.append((runs[0], j))
+			elif j._last_scheduled != last_scheduled and isinstance(self._state_handler, BaseStateHandler): # missed runs were dropped
+				try:
+					self._state_handler.save_job_logs(j)
+				except Exception as e:
+					print("unable to save state:", str(e))
+		catchups.sort(key=lambda c: c[0])
+		for i, (missed_ts, j) in enumerate(catchups):
+			j._schedule_catchup(now + self._misfire_spread * i / len(catchups))
+			print("catching up", j, "- missed run at", j.to_datetime(missed_ts).strftime("%Y-%m-%d %H:%M:%S %Z"))
+		if len(catchups) > 0:
+			self._wakeup()
 
 
 	def start(self):
-		'''blocking function that checks for jobs every 'check_interval' seconds'''
+		'''blocking function that checks for jobs every 'check_interval' seconds (or when woken up if event_wakeup is set)'''
 		self.restore_all_job_logs()
 		self._running_auto = True
 		try:
 			while self._running_auto:
 				try:
 					self.check()
-					time.sleep(self._check_interval)
+					self._wait_for_next_check()
 				except KeyboardInterrupt:
 					print("KeyboardInterrupt")
 					self.stop()
@@ -311,16 +996,68 @@ class TaskScheduler:
 
 
 	def join(self):
-		'''wait for any async jobs to complete'''
-		for j in self.jobs:
-			if isinstance(j, AsyncJobWrapper) and j.is_running: # wait for any running parallel tasks
-				j.proc.join()
-				print(j, "exited")
+		'''wait for queued and running async jobs to complete and shut down the worker pool'''
+		active = [j for j in self.jobs if isinstance(j, AsyncJobWrapper) and (j.is_running or j.is_queued)]
+		self.executor.shutdown()
+		for lane in list(self.lanes.values()):
+			lane.shutdown()
+		self._process_pool.shutdown()
+		for j in active:
+			if j.executor is None and j.proc is not None:
+				j.proc.join() # wrapper created outside of the scheduler
+			print(j, "exited")
+		self._finish_timed_out_runs() # the scheduler loop may be gone
+		self._flush_logs_on_exit()
 
 
 	def stop(self):
 		'''stop job started with .start() method'''
 		self._running_auto = False
+		self._wakeup()
+		self._flush_logs_on_exit()
+
+
+	def _flush_logs_on_exit(self):
+		'''flush logs without hanging on a log file that cannot be written (ex: a stale network mount)'''
+		if not self.flush_logs(timeout=LOG_FLUSH_TIMEOUT):
+			print("* Some log lines could not be written to the log files *")
+
+
+	def flush_logs(self, timeout=None):
+		'''
+		wait until queued log lines are written to log_filepath, json_log_filepath and job_log_dir (rotated job log segments compressed)
+		- returns False if 'timeout' seconds passed first
+		'''
+		return all([h.flush(timeout) for h in self._log_queues])
+
+
+	@property
+	def _log_queues(self):
+		'''handlers that write logs in the background. see _log_queue._QueuedHandler'''
+		return [h for h in (self._log_handler, self._json_log_handler, self._job_log_handler) if h is not None]
+
+
+	def job_log_segments(self, jobid):
+		'''
+		segments of the log file of a job, oldest first. the last one is being written. see job_log_dir
+		- list of dict with 'name', 'size' (bytes on disk), 'modified' (timestamp) and 'archived' (gzip-compressed)
+		'''
+		j = self.get_job_by_id(jobid)
+		if j is None:
+			raise IndexError("Invalid job id")
+		if self._job_log_handler is None:
+			raise RuntimeError("job_log_dir is not set")
+		return self._job_log_handler.segments(j.signature_hash())
+
+
+	def iter_job_log(self, jobid, segment):
+		'''text of one segment of the log file of a job (see self.job_log_segments()), in chunks. archives are decompressed on the fly'''
+		j = self.get_job_by_id(jobid)
+		if j is None:
+			raise IndexError("Invalid job id")
+		if self._job_log_handler is None:
+			raise RuntimeError("job_log_dir is not set")
+		return self._job_log_handler.iter_segment(j.signature_hash(), segment)
 
 	def get_job_by_id(self, jobid) -> Union[Job, None]:
 		for j in self.jobs:
@@ -335,9 +1072,12 @@ class TaskScheduler:
 			raise IndexError("Invalid job id")
 		if selected_job.is_running:
 			raise RuntimeError("Cannot rerun a running task")
+		if selected_job.is_queued:
+			raise RuntimeError("Cannot rerun a queued task")
 		if not isinstance(selected_job, AsyncJobWrapper):
-			selected_job = AsyncJobWrapper(selected_job)
+			selected_job = AsyncJobWrapper(selected_job, executor=self.executor)
 		selected_job.run(is_rerun=True, kwargs=kwargs)
+		self._wakeup()
 
 
 	def disable_all(self):
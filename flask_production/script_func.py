@@ -41,9 +41,18 @@ class ScriptFunc(ModuleType):
         self.__doc__ = f"Script called '{self.script_name}' defined in '{self.script_dir_path}'"
 
         self.__wd = os.getcwd() # capture working directory to change back to once script is complete
+        self._procs = {} # run token -> subprocess of every run in progress
 
 
-    def __call__(self):
+    def cancel(self, run_token=None):
+        '''kill the script started by the run 'run_token'. used to enforce Job.timeout()'''
+        p = self._procs.get(run_token)
+        if p is not None and p.poll() is None:
+            p.kill()
+
+
+    def __call__(self, _run_token=None):
+        '''run the script. '_run_token' identifies the run of the job, see self.cancel()'''
         os.chdir(self.script_dir_path)
         cmd = [sys.executable, "-u", self.__file__] + self.script_args
 
@@ -65,6 +74,7 @@ class ScriptFunc(ModuleType):
                 bufsize=1,
                 env=os.environ.copy() # give the child its own environment copy without mutating the parent process
             )
+            self._procs[_run_token] = p
             stderr_lines = []
             stderr_thread = threading.Thread(
                 target=_read_stream,
@@ -100,5 +110,6 @@ class ScriptFunc(ModuleType):
                 print(err)
 
         finally:
+            self._procs.pop(_run_token, None)
             os.chdir(self.__wd)
 
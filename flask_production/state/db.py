@@ -47,7 +47,7 @@ class SQLAlchemyState(BaseStateHandler):
 		self.__tables_created = True
 
 		from sqlalchemy import create_engine, MetaData
-		from sqlalchemy import Table, Column, String, Text, DateTime, Boolean
+		from sqlalchemy import Table, Column, String, Text, DateTime, Boolean, Float
 		from sqlalchemy import select, insert, update
 		from sqlalchemy_utils import database_exists, create_database
 
@@ -75,6 +75,16 @@ class SQLAlchemyState(BaseStateHandler):
 			Column('end_dt', DateTime),
 			Column('disabled', Boolean),
 		)
+
+		# last scheduled and actual fire times of jobs. see Job.misfire()
+		# - kept apart from fp_state so that databases created by earlier versions don't need a migration
+		self.fp_fire_times = Table(
+			'fp_fire_times', self._meta,
+			Column('app_id', String(50), primary_key=True),
+			Column('signature', String(50), primary_key=True),
+			Column('scheduled', Float), # timestamps
+			Column('fired', Float),
+		)
 		self._meta.create_all(self._engine)
 
 		# update info to fp_apps table
@@ -119,6 +129,19 @@ class SQLAlchemyState(BaseStateHandler):
 				end_dt=logs.get('end'),
 				disabled=job_obj.is_disabled
 			))
+
+			times = job_obj._fire_times_to_dict()
+			stmt = select(self.fp_fire_times).where(self.fp_fire_times.c.signature == signature, self.fp_fire_times.c.app_id == self._cur_app_unique_info_hash)
+			if len(conn.execute(stmt).all()) == 1:
+				update_stmt = update(self.fp_fire_times).where(self.fp_fire_times.c.signature == signature, self.fp_fire_times.c.app_id == self._cur_app_unique_info_hash)
+			else:
+				update_stmt = insert(self.fp_fire_times)
+			conn.execute(update_stmt.values(
+				app_id=self._cur_app_unique_info_hash,
+				signature=signature,
+				scheduled=times['scheduled'],
+				fired=times['fired'],
+			))
 			conn.commit()
 
 
@@ -128,6 +151,8 @@ class SQLAlchemyState(BaseStateHandler):
 
 		with self._engine.connect() as conn:
 			db_states = conn.execute(select(self.fp_state).where(self.fp_state.c.app_id == self._cur_app_unique_info_hash)).all()
+			db_times = conn.execute(select(self.fp_fire_times).where(self.fp_fire_times.c.app_id == self._cur_app_unique_info_hash)).all()
+		fire_times = {t.signature: {'scheduled': t.scheduled, 'fired': t.fired} for t in db_times}
 
 		states = {}
 		for s in db_states:
@@ -144,6 +169,7 @@ class SQLAlchemyState(BaseStateHandler):
 					'start': st.start_dt,
 					'end': st.end_dt,
 				})
+				j._fire_times_from_dict(fire_times.get(signature, {}))
 				if st.disabled:
 					j.disable()
 				found_states.append(signature)
@@ -154,6 +180,9 @@ class SQLAlchemyState(BaseStateHandler):
 			for sig, st in states.items():
 				if sig not in found_states:
 					conn.execute(delete(self.fp_state).where(self.fp_state.c.signature == sig))
+			for sig in fire_times:
+				if sig not in found_states:
+					conn.execute(delete(self.fp_fire_times).where(self.fp_fire_times.c.signature == sig, self.fp_fire_times.c.app_id == self._cur_app_unique_info_hash))
 			conn.commit()
 
 		print("* scheduler state restored from database *")
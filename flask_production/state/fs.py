@@ -55,7 +55,7 @@ class FileSystemState(BaseStateHandler):
 			filename = job_obj.signature_hash()
 			with open(os.path.join(self._job_state_dir, f"{filename}.pickle"), 'wb') as f:
 				logs = job_obj._logs_to_dict()
-				pickle.dump({'logs':logs, 'disabled': job_obj.is_disabled}, f) # we only care about logs
+				pickle.dump({'logs':logs, 'disabled': job_obj.is_disabled, 'fire_times': job_obj._fire_times_to_dict()}, f)
 
 
 	def restore_all_job_logs(self, jobs_list):
@@ -69,6 +69,7 @@ class FileSystemState(BaseStateHandler):
 						state = pickle.load(f)
 						logs = state['logs'] if 'logs' in state else state # doing it this way for backwards compatibility as 'state' was previously 'logs'
 						j._logs_from_dict(logs)
+						j._fire_times_from_dict(state.get('fire_times', {})) # last scheduled and actual fire times. see Job.misfire()
 						if state.get('disabled'):
 							j.disable()
 					found_states.append(filename)
@@ -2,6 +2,7 @@ from flask import Flask
 from flask_production import TaskScheduler
 from flask_production.plugins import TaskMonitor
 
+import threading
 import time
 import json
 import pytest
@@ -146,6 +147,139 @@ def test_monitor_summary(client):
 	assert(len(all_respdict['success'])==len(respdict['success']['details']))
 
 
+def test_monitor_dag(client):
+	resp = client.get("/{}/json/dag".format(monitor._endpoint), content_type='application/json')
+	assert('error' in json.loads(resp.data.decode('utf8')))
+
+	upstream = sched.every("day").at("8:00").do(another_task)
+	sched.after(upstream).do(another_task)
+	resp = client.get("/{}/json/dag".format(monitor._endpoint), content_type='application/json')
+	respdict = json.loads(resp.data.decode('utf8'))
+	assert('success' in respdict)
+	assert(len(respdict['success']['nodes'])==2)
+	assert(respdict['success']['edges']==[[upstream.jobid, upstream.jobid+1]])
+
+	dagpage = client.get("/{}/dag".format(monitor._endpoint))
+	assert(dagpage.status_code==200)
+	html_text = dagpage.data.decode(errors='ignore').lower()
+	assert("<svg" in html_text)
+	assert("critical path" in html_text)
+
+	homepage = client.get("/{}/".format(monitor._endpoint))
+	assert("job dependencies" in homepage.data.decode(errors='ignore').lower())
+
+
+def test_monitor_upcoming(client):
+	j = sched.every("businessday").at("8:00").do(another_task)
+	sched.every(600).do(another_task)
+	resp = client.get("/{}/json/{}/upcoming?n=3".format(monitor._endpoint, j.jobid))
+	respdict = json.loads(resp.data.decode('utf8'))
+	assert(len(respdict['success']['runs'])==3)
+	resp = client.get("/{}/json/{}/upcoming?until=2000-01-01".format(monitor._endpoint, j.jobid))
+	assert(json.loads(resp.data.decode('utf8'))['success']['runs']==[])
+	resp = client.get("/{}/json/{}/upcoming?n=abc".format(monitor._endpoint, j.jobid))
+	assert('error' in json.loads(resp.data.decode('utf8')))
+
+	resp = client.get("/{}/json/runs?days=7".format(monitor._endpoint))
+	runs = json.loads(resp.data.decode('utf8'))['success']['runs']
+	assert(len([r for r in runs if r['jobid']==j.jobid]) in (4, 5)) # 4 in weeks with a holiday
+
+	calpage = client.get("/{}/calendar?days=7".format(monitor._endpoint))
+	assert(calpage.status_code==200)
+	html_text = calpage.data.decode(errors='ignore').lower()
+	assert("upcoming runs" in html_text)
+	assert("&times;" in html_text) # every(600) job is summarized
+	assert("upcoming runs" in client.get("/{}/".format(monitor._endpoint)).data.decode(errors='ignore').lower())
+
+
+def test_monitor_stats(client):
+	sched.every(600).do(another_task)
+	sched.check()
+	resp = client.get("/{}/json/stats".format(monitor._endpoint))
+	stats = json.loads(resp.data.decode('utf8'))['success']
+	assert(stats['tick']['count'] > 0)
+	assert(set(stats) >= {'lateness', 'tick', 'schedule', 'callbacks', 'utilization', 'jobs'})
+	assert("loop utilization" in client.get("/{}/".format(monitor._endpoint)).data.decode(errors='ignore'))
+
+
+def failing_task():
+	raise ValueError("failing_task")
+
+
+def test_monitor_metrics(client):
+	ok = sched.on(dt.now().strftime("%Y-%m-%d")).do(another_task)
+	bad = sched.on(dt.now().strftime("%Y-%m-%d")).do(failing_task)
+	for j in [ok, bad, ok]:
+		j.run(is_rerun=True)
+	ok.disable()
+	resp = client.get("/{}/metrics".format(monitor._endpoint))
+	assert(resp.status_code==200)
+	assert(resp.headers['Content-Type'].startswith("application/openmetrics-text"))
+	lines = resp.data.decode().splitlines()
+	assert(lines[-1]=="# EOF")
+	samples = dict(l.rsplit(" ", 1) for l in lines if not l.startswith("#"))
+	ok_labels = 'jobid="{}",job="another_task"'.format(ok.jobid)
+	bad_labels = 'jobid="{}",job="failing_task"'.format(bad.jobid)
+	assert(samples["flask_production_job_runs_total{%s}" % ok_labels]=="2")
+	assert(samples["flask_production_job_failures_total{%s}" % ok_labels]=="0")
+	assert(samples["flask_production_job_failures_total{%s}" % bad_labels]=="1")
+	assert(samples["flask_production_job_duration_seconds_count{%s}" % bad_labels]=="1")
+	assert(samples["flask_production_job_duration_seconds_bucket{%s,le=\"+Inf\"}" % ok_labels]=="2")
+	assert(samples["flask_production_job_disabled{%s}" % ok_labels]=="1")
+	assert(samples["flask_production_job_running{%s}" % bad_labels]=="0")
+	assert("flask_production_job_last_success_timestamp_seconds{%s}" % ok_labels in samples)
+	assert("flask_production_job_last_success_timestamp_seconds{%s}" % bad_labels not in samples)
+	assert("# TYPE flask_production_scheduler_tick_seconds histogram" in lines)
+
+
+def chatty_task():
+	for i in range(2000): # more than the default log_memory_limit
+		print("progress", i, "." * 1000)
+
+
+def test_monitor_full_log(client):
+	j = sched.on(dt.now().strftime("%Y-%m-%d")).do(chatty_task).silently()
+	j.run(is_rerun=True)
+	assert("full log" in client.get("/{}/{}".format(monitor._endpoint, j.jobid)).data.decode(errors='ignore'))
+	resp = client.get("/{}/json/{}/log?offset=0&size=1000".format(monitor._endpoint, j.jobid))
+	page = json.loads(resp.data.decode('utf8'))['success']
+	assert(page['text'].startswith("=") and page['next_offset'] <= 1000 and page['size'] > 2000000)
+	html_text = client.get("/{}/log?job={}&offset={}".format(monitor._endpoint, j.jobid, page['size'] - 100)).data.decode(errors='ignore')
+	assert("Job Rerun End" in html_text)
+	assert("previous page" in html_text)
+	assert(client.get("/{}/log?job=abc".format(monitor._endpoint)).status_code==200)
+
+
+def test_monitor_concurrent_run_logs(client):
+	release = threading.Event()
+	def _waiting_task(name):
+		print("output of", name)
+		release.wait(5)
+	j = sched.every(60).do_parallel(_waiting_task, name="first").silently()
+	j.overlap(2)
+	first = threading.Thread(target=j.run, kwargs=dict(is_rerun=True))
+	first.start()
+	time.sleep(0.3)
+	second = threading.Thread(target=j.run, kwargs=dict(is_rerun=True, kwargs={'name': 'second'}))
+	second.start()
+	time.sleep(0.6)
+	try:
+		run_ids = j.active_run_ids
+		assert(len(run_ids)==2 and run_ids[1]==j.to_dict()['logs']['run_id'])
+		html_text = client.get("/{}/{}".format(monitor._endpoint, j.jobid)).data.decode(errors='ignore')
+		assert("&run={}".format(run_ids[0]) in html_text) # link to the older run
+		resp = client.get("/{}/json/{}/log?run={}".format(monitor._endpoint, j.jobid, run_ids[0]))
+		assert("output of first" in json.loads(resp.data.decode('utf8'))['success']['text'])
+		assert("output of second" in j.read_log()['text'])
+		resp = client.get("/{}/json/{}/log?run=unknown".format(monitor._endpoint, j.jobid))
+		assert('error' in json.loads(resp.data.decode('utf8')))
+	finally:
+		release.set()
+		first.join()
+		second.join()
+	assert(j.active_run_ids==[])
+
+
 class Color(Enum):
 	RED = 1
 	BLUE = 2
@@ -230,3 +364,25 @@ def test_create_rerun_popup_html_with_multiline_string():
 		assert 'data-type="str"' in html
 	finally:
 		monitor._enhanced_rerun = original_setting
+
+
+def test_monitor_log_archives(client, tmp_path):
+	archive_app = Flask("archives")
+	archive_sched = TaskScheduler(job_log_dir=str(tmp_path), job_log_maxsize=5000, persist_states=False)
+	archive_monitor = TaskMonitor(archive_app, sched=archive_sched)
+	j = archive_sched.on(dt.now().strftime("%Y-%m-%d")).do(chatty_task).silently()
+	j.run(is_rerun=True)
+	assert(archive_sched.flush_logs(timeout=30))
+	with archive_app.test_client() as c:
+		assert("log archives" in c.get("/{}/{}".format(archive_monitor._endpoint, j.jobid)).data.decode(errors='ignore'))
+		segments = json.loads(c.get("/{}/json/{}/archives".format(archive_monitor._endpoint, j.jobid)).data.decode('utf8'))['success']
+		assert(segments[0]['archived'] and segments[-1]['name']=='current.log')
+		html_text = c.get("/{}/archives?job={}".format(archive_monitor._endpoint, j.jobid)).data.decode(errors='ignore')
+		assert(segments[0]['name'] in html_text)
+		resp = c.get("/{}/archive?job={}&segment={}".format(archive_monitor._endpoint, j.jobid, segments[0]['name']))
+		assert(resp.status_code==200 and resp.data.decode().startswith("="))
+		assert(c.get("/{}/archive?job={}&segment=job.txt".format(archive_monitor._endpoint, j.jobid)).status_code==404)
+	assert("job_log_dir is not set" in client.get("/{}/json/{}/archives".format(monitor._endpoint, sched.jobs[0].jobid)).data.decode())
+	from flask_production.print_logger import LOGGER
+	LOGGER.removeHandler(archive_sched._job_log_handler)
+	archive_sched._job_log_handler.close()
@@ -15,10 +15,14 @@ from dateutil.easter import easter
 from dateutil.relativedelta import relativedelta, FR
 
 from flask_production import TaskScheduler
-from flask_production.jobs import Job
+from flask_production.jobs import Job, AsyncJobWrapper, MAX_PREVIEW_RUNS, _get_eom
 from flask_production.hols import TradingHolidays
 from flask_production.sched import LOGGER, BadScheduleError
 from flask_production.state import FileSystemState, SQLAlchemyState
+from flask_production import _capture
+from flask_production._log_queue import QueuedFileHandler
+from flask_production._job_logs import JobLogHandler
+from flask_production.print_logger import _PrintLogger
 
 CUR_APP_DATA_DIR_PATH = FileSystemState()._get_current_app_data_directory()
 
@@ -125,6 +129,36 @@ def test_holidays():
 	assert(s.jobs[1]._job_must_run_today(good_friday_2026)==False) # 2026 good friday was NOT a holiday
 
 
+def test_calendar_index():
+	from flask_production.jobs import RUNABLE_DAYS
+	from flask_production._calendar_index import _CalendarIndex
+	index = _CalendarIndex()
+	hols = TradingHolidays()
+	d = dt(2024, 1, 1)
+	while d < dt(2026, 1, 1):
+		for rule in RUNABLE_DAYS.values():
+			assert(index.is_runnable(rule, hols, d) == rule(d, hols))
+		d += timedelta(days=1)
+	assert(index.next_runnable(RUNABLE_DAYS['eom-businessday'], hols, dt(2024, 5, 1)) == dt(2024, 5, 31).date())
+	assert(index.next_runnable(RUNABLE_DAYS['trading-holiday'], hols, dt(2024, 12, 26)) == dt(2025, 1, 1).date()) # next year
+	assert(index.next_runnable(RUNABLE_DAYS['trading-holiday'], {}, dt(2024, 12, 26)) is None) # never runnable
+
+	# custom holidays are picked up
+	custom = TradingHolidays()
+	assert(index.is_runnable(RUNABLE_DAYS['businessday'], custom, dt(2024, 7, 2)) == True)
+	custom[dt(2024, 7, 2).date()] = "company holiday"
+	assert(index.is_runnable(RUNABLE_DAYS['businessday'], custom, dt(2024, 7, 2)) == False)
+
+	s = TaskScheduler(persist_states=False)
+	started = time.time()
+	for i in range(1000):
+		s.every("eom-businessday").at("17:00").do(job, x=i, y=i)
+	assert(time.time() - started < 10)
+	assert(len(set(j.next_timestamp for j in s.jobs)) == 1)
+	with pytest.raises(BadScheduleError):
+		s.every("trading-holiday", calendar={}).at("17:00").do(job, x=0, y=0)
+
+
 def test_multi_intraday(): # test list of timestamps for .at()
 	sched = TaskScheduler()
 	n1 = dt.now().replace(second=0, microsecond=0)
@@ -233,6 +267,86 @@ def test_repeat():
 	assert (abs(s.jobs[0].next_timestamp - (d+(2*sleep_time))) < 0.1)
 
 
+def test_due_queue():
+	'''check() should only touch jobs that are due'''
+	s = TaskScheduler(persist_states=False)
+	for _ in range(500):
+		s.every('on-demand').do(job, x="never", y="due")
+		s.every("day").at("23:59").do(job, x="not", y="due")
+	assert(len(s._due_queue) == 500) # on-demand jobs are never indexed
+
+	j = s.every(1).do(job, x="hello", y="world")
+	time.sleep(1.1)
+	touched = []
+	for sj in s.jobs:
+		sj.is_due = (lambda _j: lambda: touched.append(_j) or Job.is_due(_j))(sj)
+	s.check()
+	assert(touched == [j])
+	assert(j.to_dict()['logs']['start'] is not None)
+
+	j.disable()
+	assert(len(s._due_queue) == 500) # disabled job is removed from the index
+	j.enable()
+	assert(len(s._due_queue) == 501)
+	assert(s._due_queue.peek_timestamp() == j.next_timestamp)
+
+
+def test_event_wakeup():
+	'''with event_wakeup, jobs start on time even if check_interval is large'''
+	s = TaskScheduler(check_interval=30, event_wakeup=True, persist_states=False)
+	j = s.every(1).do(job, x="hello", y="wakeup")
+	scheduled_ts = j.next_timestamp
+	t = threading.Thread(target=s.start)
+	t.start()
+	time.sleep(1.5)
+	start_dt = j.to_dict()['logs']['start']
+	assert(start_dt is not None) # polling every 30 seconds would not have run this yet
+	assert(abs(start_dt.timestamp() - scheduled_ts) < 0.1)
+
+	# a newly added job wakes the scheduler up
+	j2 = s.every(0.5).do(job, x="hello", y="new job")
+	time.sleep(0.8)
+	assert(j2.to_dict()['logs']['start'] is not None)
+
+	stop_start = time.time()
+	s.stop()
+	t.join()
+	assert(time.time() - stop_start < 1) # stop() wakes up the loop immediately
+
+
+def test_stagger():
+	s = TaskScheduler(stagger_window=120, persist_states=False)
+	with pytest.raises(ValueError):
+		TaskScheduler(stagger_window=60, stagger_mode='spread', persist_states=False)
+	for i in range(20):
+		s.every("day").at("09:00").do(job, x=i, y=i)
+	j_repeat = s.every(60).do(job, x=0, y=0) # repeating jobs are not staggered
+	assert(j_repeat.due_timestamp == j_repeat.next_timestamp)
+
+	offsets = [j.due_timestamp - j.next_timestamp for j in s.jobs[:20]]
+	assert(all(0 <= o < 120 for o in offsets))
+	assert(len(set(offsets)) > 10) # spread out
+	assert(abs(s.jobs[0]._compute_start_offset() - offsets[0]) < 0.01) # 'hash' mode is deterministic
+	assert(s.jobs[0].to_dict()['next_run'] == s.jobs[0].to_datetime(s.jobs[0].next_timestamp)) # nominal schedule is shown
+
+	report = s.stagger_report()
+	assert(report['peak_before'] == 20)
+	assert(report['peak_after'] < 20)
+	assert(sum(report['after'].values()) == sum(report['before'].values()) == 21)
+
+	# not due until the staggered start time
+	j = s.jobs[0]
+	j.next_timestamp = time.time() - 1
+	assert(j.is_due() == (offsets[0] < 1))
+	j.stagger(0)
+	assert(j.is_due() == True)
+
+	j.stagger(30, mode='random')
+	assert(0 <= j.due_timestamp - j.next_timestamp < 30)
+	with pytest.raises(BadScheduleError):
+		j.stagger(-1)
+
+
 def test_repeat_parallel():
 	sleep_time = 1
 	s = TaskScheduler()
@@ -250,6 +364,272 @@ def test_repeat_parallel():
 	assert (abs(s.jobs[0].next_timestamp - s.jobs[1].next_timestamp) < 0.1)
 
 
+def test_executor_bounded():
+	'''parallel jobs share a bounded worker pool'''
+	concurrent = 0
+	max_concurrent = 0
+	lock = threading.Lock()
+	def _job():
+		nonlocal concurrent, max_concurrent
+		with lock:
+			concurrent += 1
+			max_concurrent = max(max_concurrent, concurrent)
+		time.sleep(0.5)
+		with lock:
+			concurrent -= 1
+
+	s = TaskScheduler(max_workers=2, max_queue=2, persist_states=False)
+	jobs = [s.every(1).do_parallel(_job) for _ in range(5)]
+	time.sleep(1.1)
+	s.check()
+	time.sleep(0.1) # let the workers pick up their first runs
+	assert(s.executor.stats()['workers'] == 2)
+	assert(s.executor.queue_length + s.executor.active_workers == 4)
+	assert(s.executor.stats()['rejected'] == 1)
+	assert(sum(j.is_queued for j in jobs) == 2)
+	with pytest.raises(RuntimeError):
+		s.rerun(next(j for j in jobs if j.is_queued).jobid) # can't rerun a queued job
+
+	s.join()
+	assert(max_concurrent == 2)
+	assert(s.executor.active_workers == 0 and s.executor.queue_length == 0)
+	assert(s.executor.stats()['workers'] == 0) # join() shuts down the pool
+	assert(sum(j.to_dict()['logs']['end'] is not None for j in jobs) == 4)
+	assert(len(s._parked_jobs) == 0) # rejected job was retried once a worker became free
+	s.check()
+	s.join()
+	assert(all(j.to_dict()['logs']['end'] is not None for j in jobs))
+
+
+def process_job(n):
+	'''CPU bound job run in a worker process'''
+	print("pid", os.getpid())
+	print("total", sum(range(n)))
+	if n < 0:
+		raise ValueError("negative n")
+
+
+def test_do_in_process():
+	errors = []
+	s = TaskScheduler(process_workers=2, on_job_error=errors.append, persist_states=False)
+	j = s.every(1).do_in_process(process_job, n=1000)
+	j_fail = s.every(1).do_in_process(process_job, n=-1)
+	with pytest.raises(ValueError):
+		s.every(1).do_in_process(lambda: None) # can't be pickled
+	assert(j.to_dict()['func'] == 'process_job')
+	assert(j.to_dict()['doc'] == 'CPU bound job run in a worker process')
+
+	time.sleep(1.1)
+	s.check()
+	s.join()
+	assert('total 499500' in j._run_info.log)
+	assert(f"pid {os.getpid()}" not in j._run_info.log) # ran in a different process
+	assert('ValueError: negative n' in j_fail._run_info.error)
+	assert(len(errors) == 1 and 'negative n' in errors[0])
+
+
+def test_serial_lanes():
+	'''do() jobs run on serial lanes and never block check()'''
+	order = []
+	def _job(name, sleep_time):
+		time.sleep(sleep_time)
+		order.append(name)
+
+	s = TaskScheduler(serial_lanes=True, persist_states=False)
+	s.every(1).do(_job, name="slow", sleep_time=1)
+	s.every(1).do(_job, name="fast", sleep_time=0)
+	s.every(1).lane("other").do(_job, name="other", sleep_time=0)
+	time.sleep(1.1)
+	check_start = time.time()
+	s.check()
+	assert(time.time() - check_start < 0.5) # slow job did not block the loop
+	time.sleep(0.3)
+	assert(order == ["other"]) # 'fast' is waiting for 'slow' on the default lane
+	s.join()
+	assert(order == ["other", "slow", "fast"])
+	assert(set(s.lanes.keys()) == {'default', 'other'})
+
+	# do() jobs with a timeout don't run inline, even without serial_lanes
+	order.clear()
+	s = TaskScheduler(persist_states=False)
+	j = s.every(1).do(_job, name="slow", sleep_time=1)
+	j.timeout(5)
+	time.sleep(1.1)
+	check_start = time.time()
+	s.check()
+	assert(time.time() - check_start < 0.5)
+	assert(order == [] and (j.is_queued or j.is_running))
+	s.join()
+	assert(order == ["slow"] and set(s.lanes.keys()) == {'default'})
+
+
+def test_overlap_policy():
+	def _slow_job(counter):
+		counter.append(1)
+		time.sleep(0.7)
+
+	s = TaskScheduler(check_interval=0.05, persist_states=False)
+	skip_runs, queue_runs, multi_runs = [], [], []
+	j_skip = s.every(0.2).do_parallel(_slow_job, counter=skip_runs)
+	j_queue = s.every(0.2).do_parallel(_slow_job, counter=queue_runs)
+	j_queue.overlap('queue')
+	j_multi = s.every(0.2).do_parallel(_slow_job, counter=multi_runs)
+	j_multi.overlap(2)
+	with pytest.raises(BadScheduleError):
+		j_multi.overlap(0)
+	with pytest.raises(BadScheduleError):
+		j_multi.overlap('wait')
+
+	max_instances = 0
+	started = time.time()
+	while time.time() - started < 2.2:
+		s.check()
+		max_instances = max(max_instances, j_multi.running_instances)
+		time.sleep(0.05)
+	s.join()
+
+	d_skip, d_queue, d_multi = j_skip.to_dict(), j_queue.to_dict(), j_multi.to_dict()
+	assert(d_skip['overlap'] == 'skip' and d_queue['overlap'] == 'queue' and d_multi['overlap'] == 2)
+	# skip: ticks that were due during a run are dropped
+	assert(d_skip['skipped_ticks'] > 0 and d_skip['coalesced_ticks'] == 0)
+	# queue: one pending run right after the previous one. other ticks are coalesced into it
+	assert(d_queue['coalesced_ticks'] > 0 and d_queue['skipped_ticks'] == 0)
+	assert(len(queue_runs) >= len(skip_runs))
+	# n: up to 2 concurrent runs, each with its own log
+	assert(max_instances == 2)
+	assert(d_multi['skipped_ticks'] > 0)
+	assert(len(multi_runs) > len(skip_runs))
+	assert(d_multi['logs']['log'].count('Job Start') == 1)
+	assert(j_multi.is_running == False)
+
+
+def test_priority_and_groups():
+	started = []
+	def _db_job(name):
+		time.sleep(0.5)
+	def _track(j):
+		run = j.run
+		def _run(*args, **kwargs):
+			started.append(j.kwargs['name']) # recorded by check(), in dispatch order. worker threads may start in any order
+			return run(*args, **kwargs)
+		j.run = _run
+
+	s = TaskScheduler(check_interval=0.05, persist_states=False)
+	with pytest.raises(BadScheduleError):
+		s.every(60).group("db") # limit required for a new group
+	with pytest.raises(BadScheduleError):
+		s.every(60).group("db", limit=0)
+	with pytest.raises(BadScheduleError):
+		s.every(60).priority("high")
+
+	s.every(60).group("db", limit=2).do_parallel(_db_job, name="low")
+	s.every(60).group("db").priority(5).do_parallel(_db_job, name="high")
+	s.every(60).group("db").priority(1).do_parallel(_db_job, name="mid")
+	s.every(60).priority(-1).do_parallel(_db_job, name="other") # not part of the group
+	for j in s.jobs:
+		j.job.next_timestamp = time.time() - 1 # all due now
+		_track(j)
+
+	s.check()
+	time.sleep(0.1)
+	assert(started[:2] == ["high", "mid"]) # dispatched in order of priority
+	assert(sorted(started) == ["high", "mid", "other"]) # 'low' is held back by the group limit
+	assert(s.group_stats() == {'db': {'limit': 2, 'active': 2}})
+	assert(s.jobs[0].to_dict()['group'] == 'db' and s.jobs[1].to_dict()['priority'] == 5)
+
+	time.sleep(0.6)
+	s.check() # group has room again
+	time.sleep(0.1)
+	assert(started[-1] == "low")
+	s.join()
+
+
+def test_job_dependencies():
+	order = []
+	def _step(name, fail=False, sleep=0.2):
+		order.append(name)
+		time.sleep(sleep)
+		if fail:
+			raise Exception(f"{name} failed")
+
+	def _run_for(s, seconds):
+		started = time.time()
+		while time.time() - started < seconds:
+			s.check()
+			time.sleep(0.05)
+
+	s = TaskScheduler(check_interval=0.05, persist_states=False)
+	a = s.every(60).do(_step, name="a")
+	b = s.every(60).do_parallel(_step, name="b")
+	c = s.after(a).do(_step, name="c") # fan-out
+	d = s.after(a, b).do(_step, name="d") # fan-in
+	e = s.after(c, d).do(_step, name="e")
+	with pytest.raises(BadScheduleError):
+		s.every(60).after(a)
+	with pytest.raises(BadScheduleError):
+		TaskScheduler(persist_states=False).after(a) # not registered with this scheduler
+
+	assert(isinstance(e, AsyncJobWrapper) and e.to_dict()['type'] == 'DependentJob') # dependents run on the worker pool
+	assert(e.to_dict()['after'] == [c.jobid, d.jobid])
+	assert(e.next_timestamp == 0 and e.is_due() == False)
+	assert(s.dag.levels() == {a.jobid: 0, b.jobid: 0, c.jobid: 1, d.jobid: 1, e.jobid: 2})
+
+	a.next_timestamp = time.time() - 1
+	b.job.next_timestamp = time.time() - 1
+	_run_for(s, 1.5)
+	assert(sorted(order[:2]) == ["a", "b"])
+	assert(sorted(order[2:4]) == ["c", "d"]) # independent branches
+	assert(order[4:] == ["e"])
+
+	paths = s.dag.critical_paths()
+	assert(len(paths) == 1 and paths[0]['sink'] == e.jobid)
+	steps = [st['jobid'] for st in paths[0]['steps']]
+	assert(len(steps) == 3 and steps[-1] == e.jobid and steps[0] in (a.jobid, b.jobid))
+	assert(paths[0]['wall_time'] >= paths[0]['busy_time'] >= 0.6)
+
+	# failed upstream holds back its dependents until it succeeds again
+	order.clear()
+	s.rerun(b.jobid, kwargs={'fail': True})
+	_run_for(s, 0.5)
+	assert(order == ["b"])
+	assert(s.dag.to_dict()['blocked_by'] == {d.jobid: b.jobid})
+	s.rerun(a.jobid)
+	_run_for(s, 0.7)
+	assert(order == ["b", "a", "c"])
+	s.rerun(b.jobid)
+	_run_for(s, 1)
+	assert(order == ["b", "a", "c", "b", "d", "e"])
+	s.join()
+
+	# an upstream completing while its dependent runs triggers it again once the run completes
+	order.clear()
+	s = TaskScheduler(check_interval=0.05, persist_states=False)
+	a = s.every(60).do(_step, name="a")
+	c = s.after(a).do(_step, name="c", sleep=0.6)
+	s.rerun(a.jobid)
+	_run_for(s, 0.5) # c is running
+	assert(order == ["a", "c"] and c.is_running)
+	s.rerun(a.jobid)
+	_run_for(s, 1.5)
+	assert(order == ["a", "c", "a", "c"])
+	assert(c.next_timestamp == 0)
+	s.join()
+
+	# run times of the graph are read from the scheduler clock
+	from flask_production.clock import VirtualClock
+	clock = VirtualClock(dt(2025, 3, 6, 9, 0, tzinfo=tz.UTC))
+	s = TaskScheduler(clock=clock, persist_states=False)
+	a = s.every(60).do(job, x=1, y=1)
+	c = s.after(a).do(job, x=1, y=1)
+	a.run(is_rerun=True)
+	clock.advance(30)
+	s.check() # c waited 30 seconds for a free check
+	s.join()
+	paths = s.dag.critical_paths()
+	assert(paths[0]['steps'][0]['end'] == dt(2025, 3, 6, 9, 0, tzinfo=tz.UTC).timestamp())
+	assert(paths[0]['steps'][1]['wait'] == pytest.approx(30, abs=0.5))
+
+
 def test_parallel_wait_running():
 	'''long running parallel jobs shouldn't step on it's own feet (don't start when another instance is running)'''
 	run_count = 0
@@ -357,6 +737,38 @@ def test_print_capture():
 
 
 
+def test_print_capture_batching():
+	outer, inner, other = [], [], []
+	stdout = sys.stdout
+	with _capture._capture_stdout(_capture._LineBatcher(outer.append)) as batcher:
+		router = sys.stdout
+		assert(router is not stdout)
+		for i in range(100):
+			print("line", i)
+		assert(outer==[]) # below BATCH_CHARS and BATCH_SECONDS
+		t = threading.Thread(target=lambda: other.append(sys.stdout._sink()))
+		t.start()
+		t.join()
+		assert(other==[None]) # threads that are not capturing write to the original stdout
+		with _capture.print_capture(inner.append):
+			print("nested")
+			sys.stdout.write("no line break")
+		assert(inner==["nested\nno line break"]) # handed over when the capture ends
+		print("x" * _capture.BATCH_CHARS)
+		assert(len(outer) in (1, 2) and ''.join(outer).count('\n')==101) # handed over once BATCH_CHARS are pending
+		sys.stdout.write("quiet ")
+		sys.stdout.write("job\n")
+		time.sleep(_capture.BATCH_SECONDS * 3) # handed over by the flusher thread
+		assert(outer[-1]=="quiet job\n")
+		sys.stdout.write("y" * _capture.BATCH_CHARS + "\n") # a single write larger than a batch, into an empty batch
+		assert(outer[-1]=="y" * _capture.BATCH_CHARS + "\n")
+		sys.stdout.buffer.write("bytes é\n".encode())
+		sys.stdout.write("last")
+	assert(outer[-1]=="bytes é\nlast")
+	assert("nested" not in ''.join(outer))
+	assert(sys.stdout is stdout)
+
+
 def test_log_rotation():
 	def slow_job(sleep_time):
 		time.sleep(sleep_time)
@@ -387,6 +799,206 @@ def test_log_rotation():
 
 
 
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning") # writer thread killed on purpose
+def test_log_queue(tmp_path):
+	import logging
+	from logging.handlers import RotatingFileHandler
+	log_file = str(tmp_path / 'queue.log')
+	target = RotatingFileHandler(log_file, maxBytes=0)
+	handler = QueuedFileHandler(target, queue_size=10, batch_size=4)
+	logger = logging.getLogger('test_log_queue')
+	logger.propagate = False
+	logger.addHandler(handler)
+
+	target.acquire() # slow disk: the writer waits
+	try:
+		for i in range(30):
+			logger.warning("line %d", i) # never waits on the writer
+		assert(handler.dropped > 0)
+		assert(handler.pending <= 10 + handler.dropped)
+	finally:
+		target.release()
+	assert(handler.flush(timeout=5))
+	assert(handler.pending==0)
+	with open(log_file) as f:
+		lines = f.read().splitlines()
+	written = [l for l in lines if l.startswith('line')]
+	notes = [int(l.split()[1]) for l in lines if 'dropped' in l]
+	assert(written==sorted(written, key=lambda l: int(l.split()[1]))) # in order
+	assert(len(written) + handler.dropped==30)
+	assert(sum(notes)==handler.dropped)
+
+	logger.warning("after close")
+	logger.removeHandler(handler)
+	handler.close()
+	with open(log_file) as f:
+		assert('after close' in f.read())
+
+	# write errors (ex: disk full) don't stop the writer
+	class _FullDisk(RotatingFileHandler):
+		full = True
+		def flush(self):
+			if self.full:
+				raise OSError("No space left on device")
+			super().flush()
+	full_target = _FullDisk(str(tmp_path / 'full.log'), maxBytes=0)
+	full = QueuedFileHandler(full_target)
+	full_logger = logging.getLogger('test_log_queue_full')
+	full_logger.propagate = False
+	full_logger.addHandler(full)
+	raise_exceptions, logging.raiseExceptions = logging.raiseExceptions, False # handleError() stays quiet
+	try:
+		full_logger.warning("lost")
+		assert(full.flush(timeout=5))
+		full_logger.warning("still writing")
+		assert(full.flush(timeout=5))
+		assert(full._writer.is_alive())
+	finally:
+		logging.raiseExceptions = raise_exceptions
+		full_logger.removeHandler(full)
+		full_target.full = False
+		full.close()
+
+	# flush() returns when the writer thread is gone, even without a timeout
+	class _Dead(QueuedFileHandler):
+		def _write(self, batch):
+			raise SystemExit
+	dead = _Dead(RotatingFileHandler(str(tmp_path / 'dead.log'), maxBytes=0))
+	dead.emit(logging.makeLogRecord({'msg': 'first'}))
+	dead._writer.join(5)
+	dead.emit(logging.makeLogRecord({'msg': 'never written'}))
+	result = []
+	t = threading.Thread(target=lambda: result.append(dead.flush()), daemon=True)
+	t.start()
+	t.join(5)
+	assert(result==[False])
+	dead.close()
+
+	sched_log = str(tmp_path / 'sched.log')
+	s = TaskScheduler(log_filepath=sched_log, log_queue_size=100)
+	s.every(1).do(lambda: print("queued log line"))
+	time.sleep(1.1)
+	s.check()
+	s.stop() # flushes the queue
+	with open(sched_log, 'r') as lf:
+		assert('queued log line' in lf.read())
+	assert(s.stats()['log_queue']=={'pending': 0, 'dropped': 0})
+	with pytest.raises(ValueError):
+		TaskScheduler(log_filepath=sched_log, log_queue_size=0)
+
+
+def test_job_logs(tmp_path):
+	def _chatty(n):
+		for i in range(n):
+			print("line", i, "." * 100)
+	def _quiet():
+		print("quiet job")
+
+	job_log_dir = str(tmp_path / 'jobs')
+	s = TaskScheduler(job_log_dir=job_log_dir, job_log_maxsize=2000, job_log_backups=3, persist_states=False)
+	today = dt.now().strftime("%Y-%m-%d")
+	j = s.on(today).do(_chatty, n=50)
+	q = s.on(today).do(_quiet)
+	for _ in range(3):
+		j.run(is_rerun=True)
+	q.run(is_rerun=True)
+	assert(s.flush_logs(timeout=10))
+
+	segments = s.job_log_segments(j.jobid)
+	assert(segments[-1]['name']=='current.log' and not segments[-1]['archived'])
+	archives = segments[:-1]
+	assert(len(archives)==3 and all(seg['archived'] for seg in archives)) # older segments were pruned
+	assert(all(seg['size'] < 2000 for seg in archives)) # compressed
+	text = ''.join(s.iter_job_log(j.jobid, archives[0]['name']))
+	assert("line" in text and len(text.encode()) <= 2000)
+	current = ''.join(s.iter_job_log(j.jobid, 'current.log'))
+	assert("Job Rerun End" in current)
+	assert("quiet job" not in current)
+	assert("quiet job" in ''.join(s.iter_job_log(q.jobid, 'current.log')))
+	with open(os.path.join(job_log_dir, j.signature_hash(), 'job.txt')) as f:
+		assert('_chatty' in f.read())
+	with pytest.raises(ValueError):
+		s.iter_job_log(j.jobid, '../job.txt')
+	with pytest.raises(ValueError):
+		TaskScheduler(job_log_dir=job_log_dir, job_log_maxsize=0)
+	LOGGER.removeHandler(s._job_log_handler) # LOGGER is shared by the schedulers of other tests
+	s._job_log_handler.close()
+
+	# time based rotation
+	import logging
+	handler = JobLogHandler(str(tmp_path / 'timed'), maxsize=0, interval=1)
+	logger = logging.getLogger('test_job_logs')
+	logger.propagate = False
+	logger.addHandler(handler)
+	logger.warning("first", extra={'job_signature': 'abc'})
+	logger.warning("no job") # not routed
+	assert(handler.flush(timeout=5))
+	time.sleep(1.1)
+	logger.warning("second", extra={'job_signature': 'abc'})
+	logger.removeHandler(handler)
+	handler.close()
+	segments = handler.segments('abc')
+	assert([seg['archived'] for seg in segments]==[True, False])
+	assert(''.join(handler.iter_segment('abc', segments[0]['name']))=="first\n")
+	assert(''.join(handler.iter_segment('abc', 'current.log'))=="second\n")
+
+	# only a few job logs are kept open
+	handler = JobLogHandler(str(tmp_path / 'lru'), open_files=2)
+	logger.addHandler(handler)
+	for sig in ['a1', 'b2', 'c3', 'a1']:
+		logger.warning(f"line of {sig}", extra={'job_signature': sig})
+	assert(handler.flush(timeout=5))
+	assert(list(handler._open_files)==['c3', 'a1'] and handler._files['b2']._file is None)
+	logger.warning("again", extra={'job_signature': 'b2'}) # reopened
+	logger.removeHandler(handler)
+	handler.close()
+	assert(''.join(handler.iter_segment('b2', 'current.log'))=="line of b2\nagain\n")
+	assert(''.join(handler.iter_segment('a1', 'current.log'))=="line of a1\nline of a1\n")
+
+
+def test_json_log(tmp_path):
+	def _work():
+		print("first line")
+		print("second line\nthird line")
+	def _fail():
+		print("about to fail")
+		return 1 / 0
+	printed = []
+	def _slow():
+		printed.append(time.time())
+		print("before sleep")
+		time.sleep(0.2) # the line is logged when the run ends
+
+	json_log = str(tmp_path / 'jobs.jsonl')
+	s = TaskScheduler(json_log_filepath=json_log, persist_states=False)
+	today = dt.now().strftime("%Y-%m-%d")
+	j = s.on(today).do(_work)
+	f = s.on(today).do(_fail)
+	j.run(is_rerun=True)
+	j.run(is_rerun=True)
+	f.run(is_rerun=True)
+	s.on(today).do(_slow).run(is_rerun=True)
+	assert(s.flush_logs(timeout=10))
+	LOGGER.removeHandler(s._json_log_handler) # LOGGER is shared by the schedulers of other tests
+	s._json_log_handler.close()
+
+	with open(json_log, encoding='utf-8') as lf:
+		records = [json.loads(line) for line in lf]
+	assert(all(set(r)=={'timestamp', 'level', 'jobid', 'signature', 'run_id', 'stream', 'message'} for r in records))
+	assert(all(dt.fromisoformat(r['timestamp']).utcoffset()==timedelta(0) for r in records))
+	work = [r for r in records if r['jobid']==j.jobid]
+	assert(all(r['signature']==j.signature_hash() and r['level']=='INFO' and r['stream']=='stdout' for r in work))
+	assert(len({r['run_id'] for r in work})==2) # one per run
+	assert(work[-1]['run_id']==j.to_dict()['logs']['run_id'])
+	assert([r['message'] for r in work if 'line' in r['message']][-3:]==["first line", "second line", "third line"])
+	fail = [r for r in records if r['jobid']==f.jobid]
+	tb = [r for r in fail if r['stream']=='traceback']
+	assert(len(tb)==1 and tb[0]['level']=='ERROR' and 'ZeroDivisionError' in tb[0]['message'])
+	assert(tb[0]['run_id']==fail[0]['run_id'])
+	slow = next(r for r in records if r['message']=="before sleep")
+	assert(abs(dt.fromisoformat(slow['timestamp']).timestamp() - printed[0]) < 0.1) # time of the print
+
+
 def test_silent_run():
 
 	# Redirect stderr to a buffer
@@ -578,6 +1190,39 @@ def test_timezones():
 
 
 
+def test_tz_backends():
+	from flask_production._tz import get_tz
+	with pytest.raises(ValueError):
+		TaskScheduler(tz_backend="pytz", persist_states=False)
+	jobs = {}
+	for backend in ("dateutil", "zoneinfo"):
+		s = TaskScheduler(tzname="America/New_York", tz_backend=backend, persist_states=False)
+		with pytest.raises(BadScheduleError):
+			s.every("day").at("8:00").timezone("US/US") # bad timezone
+		jobs[backend] = [
+			s.every("businessday").at("08:00").do(job, x=1, y=1),
+			s.every("day").at("02:30").timezone("Europe/London").do(job, x=1, y=1),
+			s.every("eom").at("17:00").timezone("Asia/Tokyo").do(job, x=1, y=1),
+		]
+	for j_du, j_zi in zip(jobs["dateutil"], jobs["zoneinfo"]):
+		assert(j_du.next_timestamp == j_zi.next_timestamp)
+	for backend, backend_jobs in jobs.items():
+		assert(get_tz("Europe/London", backend) is get_tz("Europe/London", backend)) # resolved once
+		for j in backend_jobs:
+			assert(j.tzinfo is get_tz(j.tzname, backend)) # jobs share the cached tzinfo
+
+	j_du, j_zi = jobs["dateutil"][0], jobs["zoneinfo"][0]
+	assert(type(j_zi.tzinfo).__name__ == "ZoneInfo")
+	# 02:30 does not exist on the day clocks spring forward. it is moved to 03:30 EDT
+	for j in (j_du, j_zi):
+		d = j.tz_dt(2024, 3, 10, 2, 30)
+		assert(d.strftime("%H:%M %Z") == "03:30 EDT")
+	assert(j_du.tz_dt(2024, 3, 10, 2, 30).timestamp() == j_zi.tz_dt(2024, 3, 10, 2, 30).timestamp())
+	assert(j_du.tz_dt(2024, 11, 3, 1, 30).timestamp() == j_zi.tz_dt(2024, 11, 3, 1, 30).timestamp()) # ambiguous time
+	assert(j_zi.to_datetime(j_zi.tz_dt(2024, 7, 1, 8).timestamp()).strftime('%Z') == "EDT")
+
+
+
 def test_fs_persistent_logs():
 	s = TaskScheduler() # persist_states=True by default
 	j1 = s.every(1).do_parallel(job, x="hello", y="state1")
@@ -647,12 +1292,71 @@ def test_sqlite_persistent_logs(sqlalchemy_state):
 
 	assert(j._run_info._ended_at is not None)
 	assert(isinstance(j._run_info._ended_at, dt))
+	assert(j._last_scheduled is not None and j._last_start >= j._last_scheduled) # fire times restored from fp_fire_times
 
 	time.sleep(1)
 	s.check()
 	assert(isinstance(j._run_info._ended_at, dt))
 
 
+def test_misfire(tmp_path):
+	from flask_production.clock import VirtualClock
+	def _work(name):
+		print(name)
+	def _define(clock):
+		s = TaskScheduler(tzname="UTC", clock=clock, state_handler=FileSystemState(str(tmp_path)))
+		return s, dict(
+			once=s.every("day").at("09:00").misfire().do(_work, name="once"),
+			all=s.every(3600).misfire("all").do(_work, name="all"),
+			skip=s.every("day").at("09:00").misfire("skip").do(_work, name="skip"),
+			late=s.every("day").at("09:00").misfire("once", max_lateness=3600).do(_work, name="late"),
+			grace=s.every("day").at("09:00").do(_work, name="grace"),
+		)
+	ts = lambda *args: dt(*args, tzinfo=tz.UTC).timestamp()
+
+	clock = VirtualClock(dt(2025, 3, 6, 8, 59, 30, tzinfo=tz.UTC))
+	s, jobs = _define(clock)
+	for t in [ts(2025, 3, 6, 9, 0, 30), ts(2025, 3, 6, 9, 59, 30)]:
+		clock.set(t)
+		s.check()
+	assert(jobs['once']._last_scheduled==ts(2025, 3, 6, 9) and jobs['once']._last_start==ts(2025, 3, 6, 9, 0, 30))
+	assert(jobs['all']._last_scheduled==ts(2025, 3, 6, 9, 59, 30))
+
+	# app was down for 2 days. restarted at 09:30 UTC
+	clock = VirtualClock(dt(2025, 3, 8, 9, 30, tzinfo=tz.UTC))
+	s, jobs = _define(clock)
+	s.restore_all_job_logs()
+	now = clock.time()
+	assert(jobs['all'].next_timestamp==now) # oldest miss (2025-03-06 10:59:30) is caught up first
+	assert(jobs['all'].to_dict()['misfire']=={'policy': 'all', 'max_lateness': None, 'pending': 47})
+	assert(jobs['once'].next_timestamp==now + 20) # released over 'misfire_spread' seconds
+	assert(jobs['once'].to_dict()['coalesced_ticks']==1)
+	assert(jobs['late'].next_timestamp==now + 40)
+	assert(jobs['late'].to_dict()['skipped_ticks']==1) # 2025-03-07 09:00 is more than an hour late
+	assert(jobs['skip'].next_timestamp==ts(2025, 3, 9, 9) and jobs['skip'].to_dict()['skipped_ticks']==2)
+	assert(jobs['grace'].next_timestamp==ts(2025, 3, 9, 9)) # no policy. missed runs are only picked up within startup_grace_mins
+
+	for _ in range(60):
+		s.check()
+		clock.advance(1)
+	assert(jobs['all']._run_info.jitter==now + 46 - ts(2025, 3, 8, 8, 59, 30)) # 47th catch-up run, back to back. jitter is its lateness
+	assert(jobs['all'].next_timestamp==ts(2025, 3, 8, 10, 30)) # back to the regular schedule
+	assert(jobs['once']._last_scheduled==ts(2025, 3, 8, 9) and jobs['once'].next_timestamp==ts(2025, 3, 9, 9))
+	assert(jobs['late'].to_dict()['misfire']['pending']==0)
+
+	# restarted again. missed runs were caught up or dropped, and saved
+	s, jobs = _define(clock)
+	s.restore_all_job_logs()
+	for name in ['once', 'late', 'skip']:
+		assert(jobs[name]._last_scheduled==ts(2025, 3, 8, 9))
+		assert(jobs[name].next_timestamp==ts(2025, 3, 9, 9))
+
+	with pytest.raises(BadScheduleError):
+		s.every(60).misfire("coalesce")
+	with pytest.raises(BadScheduleError):
+		s.every(60).misfire("once", max_lateness=0)
+
+
 
 @pytest.fixture
 def script_dir():
@@ -775,3 +1479,505 @@ def test_external_job_class():
 	j = s.every('1pm').do(job)
 
 	assert(dt.fromtimestamp(j.next_timestamp).hour == 13)
+
+	# is_due() can defer a run that is due on the index
+	class DeferredJob(Job):
+		deferred = 0
+
+		@classmethod
+		def is_valid_interval(cls, interval, time_string):
+			return interval=='deferred'
+
+		def schedule_next_run(self, *args, **kwargs):
+			self.next_timestamp = time.time() - 1
+
+		def is_due(self):
+			if self.deferred == 0:
+				self.deferred += 1
+				return False
+			return super().is_due()
+
+	s = TaskScheduler(persist_states=False)
+	s.register_external_job_class(DeferredJob)
+	j = s.every('deferred').do(job, x=1, y=1)
+	s.check()
+	assert(j.deferred == 1 and j.to_dict()['logs']['start'] is None)
+	s.check() # still indexed
+	assert(j.to_dict()['logs']['start'] is not None)
+
+
+def test_job_timeout(script_dir):
+	errors = []
+	def _hung_job():
+		time.sleep(3)
+		print("hung job completed")
+
+	async def _hung_coroutine():
+		import asyncio
+		await asyncio.sleep(3)
+
+	with open(os.path.join(script_dir, "hung_script.py"), 'w') as f:
+		f.write("import time\n")
+		f.write("print('script started')\n")
+		f.write("time.sleep(10)\n")
+
+	s = TaskScheduler(on_job_error=errors.append, persist_states=False)
+	j_thread = s.every(1).do_parallel(_hung_job)
+	j_thread.timeout(0.5)
+	completed_on = []
+	j_thread.register_callback(lambda job: completed_on.append(threading.current_thread()), cb_type="oncomplete")
+	j_coro = s.every(1).do_parallel(_hung_coroutine)
+	j_coro.timeout(0.5)
+	j_script = s.every(1).run_script_parallel(script_dir, "hung_script.py")
+	j_script.timeout(1)
+	with pytest.raises(BadScheduleError):
+		j_script.timeout(-1)
+
+	time.sleep(1.1)
+	s.check()
+	time.sleep(2)
+	assert(j_thread.is_running and len(errors) == 2) # the abandoned run is cleaned up on the scheduler loop, not on the timer thread
+	s._finish_timed_out_runs() # done by s.check()
+	assert(completed_on == [threading.current_thread()])
+	for j in [j_thread, j_coro, j_script]:
+		assert(j.is_running == False) # slot released
+		assert(j._run_info.timed_out == True)
+		assert('timed out' in j._run_info.error)
+		assert(j.next_timestamp > 0) # rescheduled
+	assert('script started' in j_script._run_info.log)
+	assert(len(errors) == 3)
+
+	time.sleep(1)
+	assert('hung job completed' not in j_thread._run_info.log) # abandoned run does not write to the new logs
+	s.join()
+
+
+def sleepy_job(seconds):
+	time.sleep(seconds)
+	print("slept", seconds)
+
+
+def test_timeout_per_run(script_dir):
+	'''a timeout only stops the run that exceeded it, not other runs of the same job'''
+	from flask_production.script_func import ScriptFunc
+	with open(os.path.join(script_dir, "sleepy_script.py"), 'w') as f:
+		f.write("import time\n")
+		f.write("time.sleep(1.5)\n")
+		f.write("print('script done')\n")
+	func = ScriptFunc(script_dir, "sleepy_script.py")
+	results = {}
+	def _run(token):
+		try:
+			func(_run_token=token)
+			results[token] = 'done'
+		except Exception:
+			results[token] = 'killed'
+	threads = [threading.Thread(target=_run, args=(token, )) for token in (1, 2)]
+	for t in threads:
+		t.start()
+	time.sleep(0.5)
+	func.cancel(1) # the first run, not the latest one
+	for t in threads:
+		t.join()
+	assert(results == {1: 'killed', 2: 'done'})
+	assert(func._procs == {})
+
+	errors = []
+	s = TaskScheduler(process_workers=2, on_job_error=errors.append, persist_states=False)
+	j = s.every(60).do_in_process(sleepy_job, seconds=3).silently()
+	warmup = [threading.Thread(target=j.run, kwargs=dict(is_rerun=True, kwargs={'seconds': 0.5})) for _ in range(2)]
+	for t in warmup: # start both workers, so that timings don't include process start up
+		t.start()
+	for t in warmup:
+		t.join()
+	j.overlap(2).timeout(1.5)
+	slow = threading.Thread(target=j.run, kwargs=dict(is_rerun=True))
+	slow.start()
+	time.sleep(0.5)
+	j.run(is_rerun=True, kwargs={'seconds': 1.2}) # still running when the first run times out
+	slow.join()
+	assert('slept 1.2' in j._run_info.log and j._run_info.error == '')
+	assert(len(errors) == 1 and 'timed out' in errors[0])
+	assert(j._cancelled_runs == set())
+	s.join()
+
+
+def test_upcoming_runs():
+	from flask_production.jobs import RUNABLE_DAYS
+	s = TaskScheduler(persist_states=False)
+	hols = TradingHolidays()
+	for interval in ['day', 'businessday', 'eom-businessday', 'monday']:
+		j = s.every(interval, calendar=hols).at(["8:00", "16:30"]).do(job, x=1, y=1)
+		runs = j.upcoming_runs(n=20)
+		assert(len(runs)==20)
+		assert(runs[0].timestamp()==j.next_timestamp)
+		assert(runs==sorted(runs))
+		for r in runs: # every run is on a runnable day, at one of the scheduled times
+			assert(RUNABLE_DAYS[interval](r.replace(tzinfo=None), hols))
+			assert((r.hour, r.minute) in [(8, 0), (16, 30)])
+		# no runnable day is skipped between the first and the last run
+		d = runs[0].replace(tzinfo=None)
+		expected = 0
+		while d.date() <= runs[-1].date():
+			if RUNABLE_DAYS[interval](d, hols):
+				expected += 2
+			d += timedelta(days=1)
+		assert(expected - (runs[0].hour==16) - (runs[-1].hour==8) == 20)
+
+	j = s.every(10).do(job, x=1, y=1)
+	runs = j.upcoming_runs(n=5)
+	assert([r.timestamp() - runs[0].timestamp() for r in runs] == [0, 10, 20, 30, 40])
+	assert(len(j.upcoming_runs(until=time.time() + 35))==3)
+
+	j = s.every("31st").strict_date(True).at("10:00").do(job, x=1, y=1)
+	assert(all(r.day==31 for r in j.upcoming_runs(n=12)))
+	j = s.every("31st").strict_date(False).at("10:00").do(job, x=1, y=1)
+	runs = j.upcoming_runs(n=12)
+	assert(len(set(r.month for r in runs))==12)
+	assert(all(r.day==_get_eom(r).day for r in runs))
+
+	tomorrow = dt.now() + timedelta(days=1)
+	j = s.on(tomorrow.strftime("%Y-%m-%d")).at("10:00").do(job, x=1, y=1)
+	assert(j.upcoming_runs(n=5)==[j.to_datetime(j.next_timestamp)])
+	j.disable()
+	assert(j.upcoming_runs(n=5)==[])
+	with pytest.raises(ValueError):
+		j.upcoming_runs()
+
+	# preview of all jobs
+	runs = s.runs_between(dt.now(), dt.now() + timedelta(days=3))
+	assert(runs==sorted(runs, key=lambda r: r[0]))
+	assert(len([r for r in runs if r[1].interval==10]) == MAX_PREVIEW_RUNS) # capped per job
+	assert(all(r[1].interval!="day" or r[0].hour in (8, 16) for r in runs))
+
+
+def test_virtual_clock():
+	from flask_production.clock import VirtualClock
+	clock = VirtualClock(dt(2024, 12, 31, 7, 59, tzinfo=tz.UTC))
+	s = TaskScheduler(clock=clock, tzname="UTC", persist_states=False)
+	counts = {'day': 0, 'repeat': 0}
+	def _count(name):
+		counts[name] += 1
+	d = s.every("businessday").at("8:00").do(_count, name='day').silently()
+	s.every(60).do(_count, name='repeat').silently()
+	assert(d.next_timestamp==dt(2024, 12, 31, 8, 0, tzinfo=tz.UTC).timestamp())
+	started = time.time()
+	for _ in range(60*24*2): # two days, checking every minute
+		clock.advance(60)
+		s.check()
+	assert(time.time() - started < 30)
+	assert(counts['repeat']==60*24*2)
+	assert(counts['day']==1) # Jan 1st is a holiday
+	assert(d.next_timestamp==dt(2025, 1, 2, 8, 0, tzinfo=tz.UTC).timestamp())
+
+
+def test_simulate():
+	from flask_production.jobs import RUNABLE_DAYS
+	s = TaskScheduler(tzname="America/New_York", persist_states=False)
+	a = s.every("businessday").at("9:30").do(job, x=1, y=1)
+	b = s.every("businessday").at("9:30").do_parallel(job, x=2, y=2) # same schedule as a
+	m = s.every("31st").strict_date(False).at("2:30").do(job, x=3, y=3)
+	r = s.every(3600).do(job, x=4, y=4)
+	dep = s.after(a, m).do(job, x=5, y=5)
+	off = s.every("day").at("12:00").do(job, x=6, y=6).disable()
+	before = [j.next_timestamp for j in s.jobs]
+
+	start, end = dt(2025, 1, 1), dt(2026, 1, 1)
+	runs = s.simulate(start, end)
+	assert([j.next_timestamp for j in s.jobs]==before) # registered jobs are not rescheduled
+	assert(runs==sorted(runs, key=lambda x: x[0]))
+	by_job = {}
+	for d, j in runs:
+		by_job.setdefault(j.jobid, []).append(d)
+	assert(off.jobid not in by_job)
+
+	expected = []
+	d = start
+	while d < end:
+		if RUNABLE_DAYS['businessday'](d, s.holidays_calendar):
+			expected.append(d.date())
+		d += timedelta(days=1)
+	assert([x.date() for x in by_job[a.jobid]]==expected)
+	assert(all((x.hour, x.minute)==(9, 30) for x in by_job[a.jobid])) # on both sides of the daylight savings transitions
+	assert(by_job[a.jobid]==by_job[b.jobid])
+	assert(len(by_job[m.jobid])==12)
+	assert(all(x.day==_get_eom(x).day for x in by_job[m.jobid]))
+	assert(len(by_job[r.jobid])==365*24)
+	# dependent fires once both upstream jobs ran since its last run. a runs daily, so with every run of m
+	assert(by_job[dep.jobid]==by_job[m.jobid])
+
+	# stagger offsets are applied to the simulated runs
+	a.stagger(120)
+	staggered = [x for x, j in s.simulate(start, end, jobs=[a])]
+	assert(all(0 <= (x - y).total_seconds() < 120 for x, y in zip(staggered, by_job[a.jobid])))
+
+
+def test_cron():
+	from flask_production.jobs import CronJob
+	from flask_production.clock import VirtualClock
+	clock = VirtualClock(dt(2025, 3, 7, 15, 50, tzinfo=tz.UTC))
+	s = TaskScheduler(tzname="America/New_York", clock=clock, persist_states=False)
+	c = s.every("businessday").cron("*/15 9-15 * * *").do(job, x=1, y=1)
+	at = ["{:02}:{:02}".format(h, m) for h in range(9, 16) for m in (0, 15, 30, 45)]
+	l = s.every("businessday").at(at).do(job, x=2, y=2)
+	assert(isinstance(c, CronJob))
+	assert(c.next_timestamp==dt(2025, 3, 7, 11, 0, tzinfo=tz.gettz("America/New_York")).timestamp())
+	# same runs as the list of time strings, over holidays and daylight savings
+	start, end = dt(2025, 1, 1), dt(2025, 4, 1)
+	assert([d for d, _ in s.simulate(start, end, jobs=[c])]==[d for d, _ in s.simulate(start, end, jobs=[l])])
+	clock.set(c.next_timestamp)
+	c.schedule_next_run(just_ran=True)
+	assert(c.next_timestamp==dt(2025, 3, 7, 11, 15, tzinfo=tz.gettz("America/New_York")).timestamp())
+
+	# day of month OR day of week when both are restricted, names, seconds
+	j = s.cron("0 12 1 * mon").do(job, x=3, y=3)
+	runs = j.upcoming_runs(until=dt(2025, 4, 30))
+	assert(all(d.day==1 or d.isoweekday()==1 for d in runs))
+	assert(len(runs)==len([d for d in runs if d.isoweekday()==1]) + 1) # april 1st is a tuesday
+	j = s.cron("*/20 30 8 * jan,jul sat,sun").do(job, x=4, y=4)
+	runs = j.upcoming_runs(n=6)
+	assert(all(d.month==7 and d.isoweekday() >= 6 and (d.hour, d.minute)==(8, 30) for d in runs))
+	assert([d.second for d in runs]==[0, 20, 40, 0, 20, 40])
+
+	# wall times in the spring daylight savings gap run once, right after the gap
+	j = s.cron("*/30 2 * * *").do(job, x=5, y=5)
+	runs = j.upcoming_runs(until=dt(2025, 3, 10))
+	assert([d.strftime("%d %H:%M") for d in runs]==["08 02:00", "08 02:30", "09 03:00", "09 03:30"])
+
+	for expr in ["* * *", "60 * * * *", "5-1 * * * *", "*/0 * * * *", "0 12 * foo *"]:
+		with pytest.raises(BadScheduleError):
+			s.cron(expr).do(job, x=6, y=6)
+	with pytest.raises(BadScheduleError):
+		s.cron("0 0 30 feb *").do(job, x=6, y=6) # never runs
+
+
+def test_window_job():
+	from flask_production.jobs import WindowJob
+	from flask_production.clock import VirtualClock
+	zone = tz.gettz("America/New_York")
+	clock = VirtualClock(dt(2025, 3, 7, 10, 52, tzinfo=zone))
+	s = TaskScheduler(tzname="America/New_York", clock=clock, persist_states=False)
+	w = s.every("businessday").between("09:30", "16:00", 300).do(job, x=1, y=1)
+	at = ["{:02}:{:02}".format(*divmod(570 + 5*i, 60)) for i in range(78)]
+	l = s.every("businessday").at(at).do(job, x=2, y=2)
+	assert(isinstance(w, WindowJob))
+	assert(w.next_timestamp==dt(2025, 3, 7, 10, 55, tzinfo=zone).timestamp())
+	assert(w.to_dict()['window']=={'start': '09:30', 'end': '16:00', 'interval': 300})
+	# same runs as the list of time strings, over holidays and daylight savings
+	start, end = dt(2025, 2, 14), dt(2025, 3, 12) # presidents' day and the start of daylight savings
+	assert([d for d, _ in s.simulate(start, end, jobs=[w])]==[d for d, _ in s.simulate(start, end, jobs=[l])])
+
+	clock.set(dt(2025, 3, 7, 15, 55, tzinfo=zone))
+	w.schedule_next_run(just_ran=True) # end of the window is excluded. next run on monday
+	assert(w.next_timestamp==dt(2025, 3, 10, 9, 30, tzinfo=zone).timestamp())
+
+	# window past midnight belongs to the day it starts on
+	n = s.every("friday").between("22:00", "01:00", 1800).do(job, x=3, y=3)
+	assert([d.strftime("%a %H:%M") for d in n.upcoming_runs(n=7)]==[
+		"Fri 22:00", "Fri 22:30", "Fri 23:00", "Fri 23:30", "Sat 00:00", "Sat 00:30", "Fri 22:00"
+	])
+	clock.set(dt(2025, 3, 8, 0, 10, tzinfo=zone))
+	n.schedule_next_run()
+	assert(n.next_timestamp==dt(2025, 3, 8, 0, 30, tzinfo=zone).timestamp()) # friday's window is still open
+
+	with pytest.raises(BadScheduleError):
+		s.every("day").between("09:30", "16:00", 0)
+	with pytest.raises(BadScheduleError):
+		s.every("day").between("9.30", "16:00", 60)
+	with pytest.raises(BadScheduleError):
+		s.every("day").between("09:30", "24:00", 60).do(job, x=4, y=4)
+
+
+def test_aligned_repeat():
+	from flask_production.clock import VirtualClock
+	runs = {}
+	def _aligned_sched():
+		clock = VirtualClock(dt(2025, 3, 7, 10, 0, 17, tzinfo=tz.UTC))
+		return clock, TaskScheduler(tzname="UTC", clock=clock, check_interval=5, persist_states=False)
+	def _work(clock, name, slow=0):
+		runs.setdefault(name, []).append(clock.now(tz.UTC).strftime("%H:%M:%S"))
+		clock.advance(slow if len(runs[name])==1 else 0) # only the first run is slow
+	def _run_for(clock, s, seconds):
+		end = clock.time() + seconds
+		while clock.time() < end:
+			s._wait_for_next_check() # wakes up on the boundary of aligned jobs, between polls
+			s.check()
+
+	clock, s = _aligned_sched()
+	a = s.every(60).align().do(_work, clock=clock, name="a").silently()
+	b = s.every(60).align(offset=15).do(_work, clock=clock, name="b").silently()
+	k = s.every(3600).tz("Asia/Kolkata").align().do(_work, clock=clock, name="k").silently() # UTC+05:30
+	late = s.every(60).do(_work, clock=clock, name="late").silently()
+	late.align(offset=30) # aligned after .do()
+	assert(a.to_datetime(a.next_timestamp).strftime("%H:%M:%S")=="10:01:00")
+	assert(b.to_datetime(b.next_timestamp).strftime("%H:%M:%S")=="10:01:15")
+	assert(k.to_datetime(k.next_timestamp).strftime("%H:%M:%S")=="16:00:00") # top of the hour in the job's timezone
+	assert(a.to_dict()['align']=={'offset': 0, 'catchup': 'once'})
+	_run_for(clock, s, 200)
+	assert(runs['a']==["10:01:00", "10:02:00", "10:03:00"]) # no drift from polling
+	assert(runs['b']==["10:01:15", "10:02:15", "10:03:15"])
+	assert(runs['late']==["10:00:30", "10:01:30", "10:02:30", "10:03:30"]) # the loop wakes up on its boundaries too
+	assert(a.to_dict()['logs']['jitter']==0)
+
+	# wall clock set back an hour. aligned jobs are re-anchored instead of waiting an hour
+	clock.jump(-3600)
+	s.check()
+	assert(0 < a.next_timestamp - clock.time() <= 60)
+	assert(0 < late.next_timestamp - clock.time() <= 60)
+
+	# catch-up of the boundaries that passed during a slow first run (200 seconds from 10:01:00)
+	slow, scheds = {}, {}
+	for catchup in ['once', 'skip', 2]:
+		clock, s = scheds[catchup] = _aligned_sched()
+		slow[catchup] = s.every(60).align(catchup=catchup).do(_work, clock=clock, name=catchup, slow=200).silently()
+		_run_for(clock, s, 400)
+	assert(runs['once'][:3]==["10:01:00", "10:04:20", "10:05:00"]) # 10:02, 10:03 and 10:04 coalesced into one run
+	assert(slow['once'].to_dict()['coalesced_ticks']==2)
+	assert(runs['skip'][:3]==["10:01:00", "10:05:00", "10:06:00"])
+	assert(slow['skip'].to_dict()['skipped_ticks']==3)
+	assert(runs[2][:4]==["10:01:00", "10:04:20", "10:04:20", "10:05:00"]) # 10:02 and 10:03 run late, 10:04 is dropped
+	assert(slow[2].to_dict()['skipped_ticks']==1)
+
+	# a suspend: 'skip' drops the stale tick, 'once' runs it late
+	for catchup, ran in [('once', True), ('skip', False)]:
+		clock, s = scheds[catchup]
+		n = len(runs[catchup])
+		clock.advance(150)
+		s.check()
+		assert((len(runs[catchup]) > n)==ran)
+	assert(slow['once'].to_dict()['logs']['jitter'] >= 90)
+
+	# simulate() keeps aligned jobs that only differ by offset, and plain jobs with the same interval, apart
+	clock, s = _aligned_sched()
+	h0 = s.every(3600).align().do(_work, clock=clock, name="h0")
+	h30 = s.every(3600).align(offset=1800).do(_work, clock=clock, name="h30")
+	plain = s.every(3600).do(_work, clock=clock, name="plain")
+	sim = s.simulate(dt(2025, 3, 7, 10, 0, 17, tzinfo=tz.UTC), dt(2025, 3, 7, 12, 59, tzinfo=tz.UTC))
+	def _sim_times(j):
+		return [d.strftime("%H:%M:%S") for d, sj in sim if sj is j]
+	assert(_sim_times(h0)==["11:00:00", "12:00:00"])
+	assert(_sim_times(h30)==["10:30:00", "11:30:00", "12:30:00"])
+	assert(_sim_times(plain)==["11:00:17", "12:00:17"])
+	assert(_sim_times(h30)==[d.strftime("%H:%M:%S") for d in h30.upcoming_runs(3)])
+
+	clock, s = _aligned_sched()
+	with pytest.raises(BadScheduleError):
+		s.every("day").at("10:00").align()
+	with pytest.raises(BadScheduleError):
+		s.every(60).align(offset=60)
+	with pytest.raises(BadScheduleError):
+		s.every(60).align(catchup='all')
+
+
+def test_stats():
+	from flask_production._histogram import Histogram
+	h = Histogram()
+	assert(h.to_dict()['p50'] is None)
+	for v in [0.0003]*90 + [0.02]*9 + [7200]:
+		h.record(v)
+	d = h.to_dict()
+	assert(d['count']==100 and d['max']==7200)
+	assert(d['p50']==0.0005 and d['p90']==0.0005 and d['p99']==0.025) # upper bound of the bucket
+	assert(h.percentile(100)==7200) # unbounded bucket reports the max
+	assert(Histogram().merge(h).merge(h).count==200)
+
+	from flask_production.clock import VirtualClock
+	clock = VirtualClock(dt(2025, 3, 7, 10, 0, 0, tzinfo=tz.UTC))
+	s = TaskScheduler(tzname="UTC", clock=clock, persist_states=False)
+	a = s.every(60).do(job, x="stats", y=1).silently()
+	b = s.every(60).do(job, x="stats", y=2).silently()
+	s.check()
+	assert(s.stats()['lateness']['count']==0)
+	clock.advance(65)
+	s.check()
+	st = s.stats()
+	assert(st['tick']['count']==2)
+	assert(st['lateness']['count']==2 and st['lateness']['max']==5)
+	assert(st['jobs'][a.jobid]['count']==1)
+	assert(st['schedule']['count']==2 and st['callbacks']['count']==2)
+	assert(st['tick']['max'] < 0.1) # inline runs (0.1 seconds each) are not loop overhead
+	assert(0 < st['utilization'] < 1)
+
+
+def test_log_spill():
+	s = TaskScheduler(log_memory_limit=4000, persist_states=False)
+	def _chatty(n):
+		for i in range(n):
+			print(f"line {i:05} \u00e9")
+	j = s.on(dt.now().strftime("%Y-%m-%d")).do(_chatty, n=5).silently()
+	j.run(is_rerun=True)
+	assert(j._run_info.spill_path is None and "line 00004" in j.to_dict()['logs']['log'])
+	assert(j.read_log()['next_offset'] is None)
+
+	j.run(is_rerun=True, kwargs={'n': 20000}) # ~ 300KB
+	info = j._run_info
+	log = j.to_dict()['logs']['log']
+	path = j.to_dict()['logs']['log_file']
+	assert(path==info.spill_path and os.path.isfile(path))
+	assert(len(log) < 4200) # head + tail + note
+	assert("line 00000" in log and "line 19999" in log and "line 10000" not in log)
+	assert("characters not shown" in log)
+	with open(path, encoding='utf-8') as f:
+		full = f.read()
+	assert(full.count("\n") > 20000 and "line 10000 \u00e9\n" in full)
+
+	# page through the full log
+	pages, offset = [], 0
+	while offset is not None:
+		page = j.read_log(offset=offset, size=10000)
+		assert(page['text'].endswith("\n")) # pages end on a line break
+		pages.append(page['text'])
+		offset = page['next_offset']
+	assert(''.join(pages)==full and page['size']==len(full.encode('utf-8')))
+
+	j.run(is_rerun=True, kwargs={'n': 1})
+	assert(not os.path.isfile(path)) # previous run's log file is removed
+	assert(j._run_info.spill_path is None)
+
+	# a first line longer than the whole memory limit
+	info = _PrintLogger(memory_limit=100)
+	with info.start_capture(silently=True):
+		print("x" * 250)
+		print("y" * 10)
+	log = info.log
+	assert(log.startswith("x" * 25 + "\n...") and log.endswith("y" * 10 + "\n") and "characters not shown" in log)
+	assert(info.read_log()['text'] == "x" * 250 + "\n" + "y" * 10 + "\n")
+	path = info.spill_path
+	info.discard()
+	assert(not os.path.isfile(path) and info.spill_path is None)
+
+	# overlapping runs: the replaced run info deletes its log file once its run ends
+	release = threading.Event()
+	def _chatty_wait(n, wait=True):
+		_chatty(n)
+		if wait:
+			release.wait(5)
+	j_overlap = s.on(dt.now().strftime("%Y-%m-%d")).do(_chatty_wait, n=20000).silently()
+	t = threading.Thread(target=j_overlap.run, kwargs=dict(is_rerun=True))
+	t.start()
+	started = time.time()
+	while j_overlap._run_info.spill_path is None and time.time() - started < 5:
+		time.sleep(0.01)
+	path = j_overlap._run_info.spill_path
+	j_overlap.run(is_rerun=True, kwargs={'n': 1, 'wait': False})
+	assert(os.path.isfile(path)) # still being written
+	release.set()
+	t.join()
+	assert(not os.path.isfile(path))
+
+	# timed out run: the log file is handed to the run info that replaces it
+	def _chatty_slow(n, pause=1):
+		_chatty(n)
+		time.sleep(pause)
+	j_timeout = s.on(dt.now().strftime("%Y-%m-%d")).do(_chatty_slow, n=20000).silently()
+	j_timeout.timeout(0.5)
+	j_timeout.run(is_rerun=True)
+	path = j_timeout._run_info.spill_path
+	assert(j_timeout._run_info.timed_out and os.path.isfile(path))
+	time.sleep(0.7) # abandoned run ends
+	assert(os.path.isfile(path) and "timed out" in j_timeout.to_dict()['logs']['err'])
+	j_timeout.run(is_rerun=True, kwargs={'n': 1, 'pause': 0})
+	assert(not os.path.isfile(path))
+
+	with pytest.raises(ValueError):
+		TaskScheduler(log_memory_limit=0, persist_states=False)